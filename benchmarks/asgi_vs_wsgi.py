@@ -0,0 +1,106 @@
+"""
+Пропускная способность поиска точек: синхронный DRF view (WSGI-путь,
+пул потоков) против нативного async view (ASGI-путь, asyncio).
+
+    python -m benchmarks.asgi_vs_wsgi --points 20000 --requests 500 --concurrency 50
+
+Запросы идут через тестовые клиенты Django в одном процессе, поэтому
+результат сравнивает обработчики, а не веб-серверы. Кэш поиска на время
+замера отключён.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import create_api_user, percentiles, seed_uniform_points, setup_django, test_database
+
+
+def _urls(path, coords, count, radius, seed):
+    rng = random.Random(seed)
+    return [
+        f'{path}?latitude={lat}&longitude={lon}&radius={radius}'
+        for lat, lon in (rng.choice(coords) for _ in range(count))
+    ]
+
+
+def run_wsgi(urls, token, concurrency):
+    from django.test import Client
+
+    def worker(chunk):
+        client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+        latencies = []
+        for url in chunk:
+            started = time.perf_counter()
+            response = client.get(url)
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.status_code
+        return latencies
+
+    chunks = [urls[i::concurrency] for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = [lat for chunk in pool.map(worker, chunks) for lat in chunk]
+    return time.perf_counter() - started, latencies
+
+
+def run_asgi(urls, token, concurrency):
+    from django.test import AsyncClient
+
+    async def main():
+        client = AsyncClient(HTTP_AUTHORIZATION=f'Token {token}')
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def one(url):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(url)
+                latencies.append(time.perf_counter() - started)
+                assert response.status_code == 200, response.status_code
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(url) for url in urls))
+        return time.perf_counter() - started, latencies
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--radius', type=float, default=10)
+    parser.add_argument('--output', help='Сохранить результат в JSON-файл')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test.utils import override_settings
+
+    with test_database(), override_settings(POINTS_SEARCH_CACHE=False):
+        user, token = create_api_user()
+        coords = seed_uniform_points(user, args.points)
+        results = {'params': vars(args)}
+        for name, path, runner in (
+            ('wsgi', '/api/points/search/', run_wsgi),
+            ('asgi', '/api/async/points/search/', run_asgi),
+        ):
+            urls = _urls(path, coords, args.requests, args.radius, seed=1)
+            elapsed, latencies = runner(urls, token, args.concurrency)
+            results[name] = {
+                'elapsed_s': round(elapsed, 3),
+                'throughput_rps': round(len(urls) / elapsed, 1),
+                **percentiles(latencies),
+            }
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Общие помощники бенчмарков: настройка Django, временная тестовая БД,
+синтетические данные и статистика задержек.
+
+Бенчмарки работают с отдельной тестовой БД (как manage.py test) и не
+трогают рабочие данные.
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'geopoints.settings')
+    import django
+
+    django.setup()
+
+
+@contextmanager
+def test_database(verbosity=0):
+    """Создать тестовую БД на время бенчмарка и удалить её после."""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
+
+
+def create_api_user(username='bench'):
+    """Пользователь и токен для запросов к API."""
+    from django.contrib.auth.models import User
+    from rest_framework.authtoken.models import Token
+
+    user = User.objects.create_user(username=username, password='bench')
+    token = Token.objects.create(user=user)
+    return user, token.key
+
+
+def seed_uniform_points(user, count, center=(55.75, 37.61), spread_deg=1.0, seed=0):
+    """count точек, равномерно разбросанных вокруг center; возвращает их координаты."""
+    import random
+
+    from points.ingest import ingest_points, iter_payload
+
+    rng = random.Random(seed)
+    coords = [
+        (center[0] + rng.uniform(-spread_deg, spread_deg), center[1] + rng.uniform(-spread_deg, spread_deg))
+        for _ in range(count)
+    ]
+    records = ({'name': f'P{i}', 'latitude': lat, 'longitude': lon} for i, (lat, lon) in enumerate(coords))
+    ingest_points(iter_payload(list(records)), user)
+    return coords
+
+
+def clustered_coords(count, clusters=20, spread_km=3.0, noise=0.1, center=(55.75, 37.61), extent_deg=2.0, seed=0):
+    """
+    Координаты, похожие на реальные: count точек вокруг clusters центров
+    («городов») с нормальным разбросом spread_km и долей noise равномерного
+    фона в квадрате extent_deg вокруг center. Размеры кластеров неравные
+    (распределение Ципфа). Возвращает массивы (lats, lons).
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    lat0, lon0 = center
+    centers_lat = lat0 + rng.uniform(-extent_deg, extent_deg, clusters)
+    centers_lon = lon0 + rng.uniform(-extent_deg, extent_deg, clusters)
+    weights = 1.0 / np.arange(1, clusters + 1)
+    weights /= weights.sum()
+
+    background = rng.random(count) < noise
+    members = rng.choice(clusters, size=count, p=weights)
+    spread_lat = spread_km / 111.0
+    spread_lon = spread_lat / max(np.cos(np.radians(lat0)), 0.01)
+    lats = centers_lat[members] + rng.normal(0, spread_lat, count)
+    lons = centers_lon[members] + rng.normal(0, spread_lon, count)
+    lats[background] = lat0 + rng.uniform(-extent_deg, extent_deg, background.sum())
+    lons[background] = lon0 + rng.uniform(-extent_deg, extent_deg, background.sum())
+    return np.clip(lats, -90, 90), np.clip(lons, -180, 180)
+
+
+def seed_clustered_points(user, count, seed=0, **kwargs):
+    """count точек с clustered_coords через массовую загрузку; возвращает список (lat, lon)."""
+    from points.ingest import ingest_points, iter_payload
+
+    lats, lons = clustered_coords(count, seed=seed, **kwargs)
+    coords = list(zip(lats.tolist(), lons.tolist()))
+    records = [{'name': f'P{i}', 'latitude': lat, 'longitude': lon} for i, (lat, lon) in enumerate(coords)]
+    ingest_points(iter_payload(records), user)
+    return coords
+
+
+def seed_messages(user, count, seed=0, chunk_size=5000):
+    """
+    count сообщений по существующим точкам: популярность точек — по Ципфу,
+    как у реальных мест. Агрегаты сообщений точек пересчитываются в конце.
+    """
+    import numpy as np
+    from django.db.models import Count, OuterRef, Subquery
+    from django.db.models.functions import Coalesce
+
+    from points.models import Message, Point
+
+    point_ids = np.array(Point.objects.order_by('id').values_list('id', flat=True), dtype=np.int64)
+    if not len(point_ids) or not count:
+        return
+    rng = np.random.default_rng(seed)
+    ranks = (rng.zipf(1.3, count) - 1) % len(point_ids)
+    targets = point_ids[rng.permutation(len(point_ids))][ranks].tolist()
+    for start in range(0, count, chunk_size):
+        Message.objects.bulk_create([
+            Message(user=user, point_id=point_id, content=f'M{start + i}')
+            for i, point_id in enumerate(targets[start:start + chunk_size])
+        ])
+
+    messages = Message.objects.filter(point=OuterRef('pk'))
+    Point.objects.update(
+        message_count=Coalesce(Subquery(messages.values('point').annotate(n=Count('id')).values('n')), 0),
+        last_message_id=Subquery(messages.order_by('-created_at', '-id').values('id')[:1]),
+        last_message_at=Subquery(messages.order_by('-created_at', '-id').values('created_at')[:1]),
+    )
+
+
+def environment_info():
+    """Окружение прогона для сравнения результатов между коммитами."""
+    import platform
+    import subprocess
+
+    import django
+    from django.conf import settings
+    from django.db import connection
+
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'postgis': connection.vendor == 'postgresql',
+        'spatial_index': getattr(settings, 'POINTS_SPATIAL_INDEX', True),
+    }
+
+
+def percentiles(samples, points=(50, 95, 99)):
+    """Перцентили (nearest-rank) списка задержек в миллисекундах."""
+    if not samples:
+        return {f'p{p}': None for p in points}
+    ordered = sorted(samples)
+    result = {}
+    for p in points:
+        rank = max(1, -(-p * len(ordered) // 100))
+        result[f'p{p}'] = round(ordered[rank - 1] * 1000, 3)
+    return result
+
+
+class Timer:
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
@@ -0,0 +1,83 @@
+"""
+Масштабирование fallback-поиска в радиусе по числу потоков
+(points.parallel): один и тот же индекс в памяти, поиск с радиусом до
+1000 км, POINTS_PARALLEL_WORKERS = 1, 2, 4, ... до числа ядер.
+
+    python -m benchmarks.parallel --points 2000000 --radius 1000 --repeat 20
+    python -m benchmarks.parallel --workers 1,2,4,8 --limit 0
+
+БД не нужна: точки — clustered_coords на большой территории.
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+from benchmarks.common import clustered_coords, environment_info, percentiles, setup_django
+
+
+def _default_workers():
+    workers, count = [], 1
+    while count < (os.cpu_count() or 1):
+        workers.append(count)
+        count *= 2
+    return workers + [os.cpu_count() or 1]
+
+
+def run(args):
+    from django.test import override_settings
+
+    from points.spatial_index import GridIndex
+
+    lats, lons = clustered_coords(args.points, clusters=200, spread_km=50, extent_deg=15, seed=args.seed)
+    index = GridIndex(cell_deg=args.cell_deg)
+    index.build(zip(range(1, args.points + 1), lats.tolist(), lons.tolist()))
+
+    rng = random.Random(args.seed)
+    centers = [(lats[i], lons[i]) for i in rng.sample(range(args.points), args.repeat)]
+    limit = args.limit or None
+    results = {'params': vars(args), 'environment': {**environment_info(), 'cpus': os.cpu_count()}, 'workers': {}}
+    expected = None
+    for workers in args.workers:
+        with override_settings(POINTS_PARALLEL_WORKERS=workers, POINTS_PARALLEL_MIN_POINTS=args.min_points):
+            index.query_arrays(*centers[0], args.radius, limit=limit)
+            timings, hits = [], []
+            for lat, lon in centers:
+                started = time.perf_counter()
+                ids, _ = index.query_arrays(lat, lon, args.radius, limit=limit)
+                timings.append(time.perf_counter() - started)
+                hits.append(ids.tolist())
+        # Результат не должен зависеть от числа потоков
+        expected = expected or hits
+        results['workers'][workers] = {**percentiles(timings), 'same_result': hits == expected}
+    base = results['workers'][args.workers[0]]['p50']
+    for stats in results['workers'].values():
+        stats['speedup_p50'] = round(base / stats['p50'], 2) if stats['p50'] else None
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=2000000)
+    parser.add_argument('--radius', type=float, default=1000, help='Радиус поиска, км')
+    parser.add_argument('--limit', type=int, default=100, help='Размер страницы; 0 — все точки в радиусе')
+    parser.add_argument('--workers', type=lambda value: [int(w) for w in value.split(',')], default=_default_workers())
+    parser.add_argument('--min-points', type=int, default=0, help='POINTS_PARALLEL_MIN_POINTS на время замера')
+    parser.add_argument('--cell-deg', type=float, default=0.1)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Сохранить результат в JSON-файл')
+    args = parser.parse_args()
+
+    setup_django()
+    results = run(args)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
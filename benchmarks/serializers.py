@@ -0,0 +1,114 @@
+"""
+Микробенчмарк сериализации страницы точек: PointSerializer по экземплярам
+модели против PointRowSerializer по строкам .values().
+
+    python -m benchmarks.serializers --rows 1000 --repeat 20
+    python -m benchmarks.serializers --rows 1000 --database
+
+Без --database строки БД имитируются в памяти: путь модели разбирает
+геометрию из HEXEWKB (как её отдаёт PostGIS) и создаёт экземпляр Point
+через Model.from_db, как это делает ORM. С --database обе выборки выполняются во временной тестовой
+БД, и в замер входит сам запрос.
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks.common import create_api_user, percentiles, seed_uniform_points, setup_django, test_database
+
+
+def _memory_paths(count, fields):
+    from django.contrib.gis.geos import GEOSGeometry, Point as GEOSPoint
+
+    from points.models import Point
+    from points.serializers import PointRowSerializer, PointSerializer
+
+    rng = random.Random(0)
+    rows = []
+    for pk in range(1, count + 1):
+        lat, lon = rng.uniform(-60, 60), rng.uniform(-180, 180)
+        rows.append((pk, 1, f'P{pk}', 'Описание точки', lat, lon, GEOSPoint(lon, lat, srid=4326).hexewkb.decode()))
+    names = ['id', 'user_id', 'name', 'description', 'latitude', 'longitude', 'location']
+    columns = PointRowSerializer.columns(fields)
+
+    def model_path():
+        points = [Point.from_db('default', names, (*row[:6], GEOSGeometry(row[6]))) for row in rows]
+        return PointSerializer(points, many=True).data
+
+    def row_path():
+        values = [dict(zip(('id', 'user', 'name', 'description', 'latitude', 'longitude'), row[:6])) for row in rows]
+        values = [{name: row[name] for name in columns} for row in values]
+        return PointRowSerializer(values, many=True, fields=fields).data
+
+    return model_path, row_path
+
+
+def _database_paths(count, fields):
+    from points.models import Point
+    from points.serializers import PointRowSerializer, PointSerializer
+
+    user, _ = create_api_user()
+    seed_uniform_points(user, count)
+    columns = PointRowSerializer.columns(fields)
+
+    def model_path():
+        return PointSerializer(list(Point.objects.order_by('id')), many=True).data
+
+    def row_path():
+        return PointRowSerializer(list(Point.objects.order_by('id').values(*columns)), many=True, fields=fields).data
+
+    return model_path, row_path
+
+
+def measure(fn, repeat):
+    fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return percentiles(timings)
+
+
+def run(args):
+    from points.serializers import POINT_FIELDS
+
+    fields = args.fields.split(',') if args.fields else POINT_FIELDS
+    make_paths = _database_paths if args.database else _memory_paths
+    model_path, row_path = make_paths(args.rows, POINT_FIELDS)
+    results = {
+        'params': vars(args),
+        'model_serializer': measure(model_path, args.repeat),
+        'row_serializer': measure(row_path, args.repeat),
+    }
+    if fields != POINT_FIELDS:
+        results['row_serializer_fields'] = measure(make_paths(args.rows, fields)[1], args.repeat)
+    results['speedup_p50'] = round(results['model_serializer']['p50'] / results['row_serializer']['p50'], 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000, help='Точек на странице')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--fields', help='Дополнительный замер с ?fields=, например id,name,latitude,longitude')
+    parser.add_argument('--database', action='store_true', help='Выборка из временной тестовой БД')
+    parser.add_argument('--output', help='Сохранить результат в JSON-файл')
+    args = parser.parse_args()
+
+    setup_django()
+    if args.database:
+        with test_database():
+            results = run(args)
+    else:
+        results = run(args)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
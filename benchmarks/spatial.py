@@ -0,0 +1,187 @@
+"""
+Нагрузочный бенчмарк пространственных эндпоинтов на синтетических данных.
+
+    python -m benchmarks.spatial --points 20000 --messages 50000 --requests 300 --output bench.json
+    python -m benchmarks.spatial --output new.json --baseline bench.json --fail-threshold 20
+
+Создаёт временную тестовую БД, заполняет её кластеризованными точками и
+сообщениями (benchmarks.common.clustered_coords) и прогоняет сценарии
+points-search, messages-search, points-list, messages-list и points-create
+через тестовый клиент Django в --concurrency потоках. Для каждого сценария
+считаются p50/p95/p99, пропускная способность и среднее число SQL-запросов
+(из заголовка Server-Timing).
+
+Бэкенд — тот, что задан окружением: PostGIS при DB_NAME (USE_POSTGIS=1),
+иначе SQLite с haversine-fallback. Результат в JSON содержит коммит и
+окружение; --baseline сравнивает с прошлым прогоном.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import (
+    create_api_user, environment_info, percentiles, seed_clustered_points, seed_messages, setup_django,
+    test_database,
+)
+
+SCENARIOS = ('points-search', 'messages-search', 'points-list', 'messages-list', 'points-create')
+
+_SQL_COUNT = re.compile(r'SQL x(\d+)')
+
+
+def _search_urls(path, coords, count, radii, rng):
+    urls = []
+    for _ in range(count):
+        lat, lon = rng.choice(coords)
+        # Центр рядом с существующей точкой: запросы идут туда, где есть данные
+        lat += rng.uniform(-0.01, 0.01)
+        lon += rng.uniform(-0.01, 0.01)
+        urls.append(f'{path}?latitude={lat:.5f}&longitude={lon:.5f}&radius={rng.choice(radii)}')
+    return urls
+
+
+def build_requests(scenario, coords, count, radii, seed):
+    """Список запросов сценария: (method, url, json-тело или None)."""
+    rng = random.Random(f'{scenario}:{seed}')
+    if scenario == 'points-search':
+        return [('get', url, None) for url in _search_urls('/api/points/search/', coords, count, radii, rng)]
+    if scenario == 'messages-search':
+        return [('get', url, None) for url in _search_urls('/api/points/messages/search/', coords, count, radii, rng)]
+    if scenario == 'points-list':
+        return [('get', '/api/points/', None)] * count
+    if scenario == 'messages-list':
+        return [('get', '/api/points/messages/', None)] * count
+    if scenario == 'points-create':
+        requests = []
+        for i in range(count):
+            lat, lon = rng.choice(coords)
+            requests.append(('post', '/api/points/', {'name': f'New {i}', 'latitude': lat, 'longitude': lon}))
+        return requests
+    raise ValueError(scenario)
+
+
+def run_scenario(requests, token, concurrency):
+    """(elapsed_s, latencies, sql_counts, errors) для списка запросов."""
+    from django.db import connections
+    from django.test import Client
+
+    def worker(chunk):
+        client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+        latencies, sql_counts, errors = [], [], 0
+        try:
+            for method, url, body in chunk:
+                started = time.perf_counter()
+                if method == 'post':
+                    response = client.post(url, body, content_type='application/json')
+                else:
+                    response = client.get(url)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors += 1
+                match = _SQL_COUNT.search(response.get('Server-Timing', ''))
+                if match:
+                    sql_counts.append(int(match.group(1)))
+        finally:
+            connections.close_all()
+        return latencies, sql_counts, errors
+
+    chunks = [requests[i::concurrency] for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(worker, chunks))
+    elapsed = time.perf_counter() - started
+    latencies = [lat for chunk, _, _ in results for lat in chunk]
+    sql_counts = [n for _, chunk, _ in results for n in chunk]
+    return elapsed, latencies, sql_counts, sum(errors for _, _, errors in results)
+
+
+def compare(results, baseline, threshold=None):
+    """Печать изменений p50/p95 относительно baseline; True, если есть регрессия p95 больше threshold %."""
+    regressed = False
+    print(f"{'scenario':<18}{'p50 old':>10}{'p50 new':>10}{'p95 old':>10}{'p95 new':>10}{'Δp95 %':>9}")
+    for name, new in results.items():
+        old = baseline.get('results', {}).get(name)
+        if not old or not old.get('p95') or new.get('p95') is None:
+            continue
+        change = (new['p95'] - old['p95']) / old['p95'] * 100
+        flag = ''
+        if threshold is not None and change > threshold:
+            regressed = True
+            flag = '  <-- регрессия'
+        print(f"{name:<18}{old['p50']:>10}{new['p50']:>10}{old['p95']:>10}{new['p95']:>10}{change:>9.1f}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=20000)
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--clusters', type=int, default=20, help='Число кластеров («городов») в данных')
+    parser.add_argument('--requests', type=int, default=300, help='Запросов на сценарий')
+    parser.add_argument('--list-requests', type=int, default=10, help='Запросов для list-сценариев (отдают всю таблицу)')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--radius', type=float, nargs='+', default=[1, 5, 25], help='Радиусы поиска, км')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--warmup', type=int, default=10, help='Запросов прогрева (строят индекс) перед замером')
+    parser.add_argument('--cache', action='store_true', help='Не отключать кэш поиска')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Сохранить результат в JSON-файл')
+    parser.add_argument('--baseline', help='JSON прошлого прогона для сравнения')
+    parser.add_argument('--fail-threshold', type=float, help='Код выхода 1 при росте p95 больше чем на N %%')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from django.test.utils import override_settings
+
+    # POINTS_METRICS включает заголовок Server-Timing, из него берётся число SQL-запросов
+    with test_database(), override_settings(POINTS_SEARCH_CACHE=args.cache, POINTS_METRICS=True):
+        user, token = create_api_user()
+        started = time.perf_counter()
+        coords = seed_clustered_points(user, args.points, seed=args.seed, clusters=args.clusters)
+        seed_messages(user, args.messages, seed=args.seed)
+        seed_seconds = time.perf_counter() - started
+
+        report = {
+            'environment': environment_info(),
+            'params': vars(args),
+            'seed_seconds': round(seed_seconds, 3),
+            'results': {},
+        }
+        for name in args.scenarios:
+            count = args.list_requests if name.endswith('-list') else args.requests
+            concurrency = args.concurrency
+            # SQLite в памяти не переносит параллельную запись
+            if name == 'points-create' and connection.vendor == 'sqlite':
+                concurrency = 1
+            run_scenario(build_requests(name, coords, args.warmup, args.radius, seed=-1), token, 1)
+            elapsed, latencies, sql_counts, errors = run_scenario(
+                build_requests(name, coords, count, args.radius, args.seed), token, concurrency,
+            )
+            report['results'][name] = {
+                'requests': len(latencies),
+                'errors': errors,
+                'concurrency': concurrency,
+                'elapsed_s': round(elapsed, 3),
+                'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+                'mean_sql_queries': round(sum(sql_counts) / len(sql_counts), 2) if sql_counts else None,
+                **percentiles(latencies),
+            }
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(report['results'], baseline, args.fail_threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -64,6 +64,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'points.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -109,6 +110,14 @@ if USE_POSTGIS and os.environ.get('DB_NAME'):
             'PORT': os.environ.get('DB_PORT', '5432'),
         }
     }
+elif os.environ.get('USE_SPATIALITE') == '1':
+    # SQLite с расширением SpatiaLite: поиск в радиусе, bbox и области — в БД
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.contrib.gis.db.backends.spatialite',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
 else:
     # Fallback for local dev without PostGIS (limited functionality)
     DATABASES = {
@@ -118,6 +127,123 @@ else:
         }
     }
 
+# Постоянные соединения: соединение живёт DB_CONN_MAX_AGE секунд между
+# запросами и перед переиспользованием проверяется (CONN_HEALTH_CHECKS).
+# DB_POOL=1 — пул psycopg 3 (pip install "psycopg[pool]") вместо этого
+for _database in DATABASES.values():
+    _database['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', '60'))
+    _database['CONN_HEALTH_CHECKS'] = True
+if os.environ.get('DB_POOL') == '1' and 'postgis' in DATABASES['default']['ENGINE']:
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {'pool': {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '20')),
+    }}
+
+# Реплики для чтения (points.replicas): DB_REPLICA_HOSTS=host1,host2 — копии
+# default с другим HOST; без PostgreSQL DB_REPLICAS=<n> — n псевдонимов того
+# же файла SQLite, чтобы проверить маршрутизацию локально. В тестах реплики
+# зеркалят default
+if 'postgis' in DATABASES['default']['ENGINE']:
+    _replicas = [
+        {**DATABASES['default'], 'HOST': host.strip()}
+        for host in os.environ.get('DB_REPLICA_HOSTS', '').split(',') if host.strip()
+    ]
+else:
+    _replicas = [dict(DATABASES['default']) for _ in range(int(os.environ.get('DB_REPLICAS', '0')))]
+for _number, _replica in enumerate(_replicas, start=1):
+    DATABASES[f'replica_{_number}'] = {**_replica, 'TEST': {'MIRROR': 'default'}}
+POINTS_DB_REPLICAS = [f'replica_{number}' for number in range(1, len(_replicas) + 1)]
+DATABASE_ROUTERS = ['points.replicas.ReplicaRouter']
+# Сколько секунд после своей записи пользователь читает с default (read-your-writes)
+POINTS_DB_STICKY_SECONDS = int(os.environ.get('POINTS_DB_STICKY_SECONDS', '5'))
+
+# Пространственный движок (points.engines): auto — по бэкенду БД, либо
+# postgis, spatialite, python (всё через in-process fallback)
+POINTS_SPATIAL_ENGINE = os.environ.get('POINTS_SPATIAL_ENGINE', 'auto')
+
+# Fallback-поиск без PostGIS: in-process индекс-сетка (1) или range-запрос
+# по bounding box к индексу (latitude, longitude) в БД (0)
+POINTS_SPATIAL_INDEX = os.environ.get('POINTS_SPATIAL_INDEX', '1') == '1'
+POINTS_INDEX_CELL_DEG = float(os.environ.get('POINTS_INDEX_CELL_DEG', '0.1'))
+# Изменения, сделанные другими воркерами, индекс применяет из журнала
+# ChangeLog не чаще раза в POLL секунд
+POINTS_INDEX_POLL_SECONDS = float(os.environ.get('POINTS_INDEX_POLL_SECONDS', '1'))
+# Общий для воркеров снимок индекса (manage.py export_point_snapshot):
+# путь к файлу или пусто — каждый воркер строит индекс из БД сам. Новые
+# версии файла подхватываются при том же опросе
+POINTS_INDEX_SNAPSHOT = os.environ.get('POINTS_INDEX_SNAPSHOT', '')
+# Fallback-поиск в радиусе с числом кандидатов от MIN_POINTS делится на
+# шарды и считается в WORKERS потоках (по умолчанию — по числу ядер; 1 —
+# всегда в одном потоке). При нескольких воркерах gunicorn на машине
+# стоит делить ядра между ними
+POINTS_PARALLEL_WORKERS = int(os.environ['POINTS_PARALLEL_WORKERS']) if os.environ.get('POINTS_PARALLEL_WORKERS') else None
+POINTS_PARALLEL_MIN_POINTS = int(os.environ.get('POINTS_PARALLEL_MIN_POINTS', '200000'))
+
+# Размер страницы поиска по умолчанию и серверный максимум параметра limit
+POINTS_SEARCH_DEFAULT_LIMIT = 100
+POINTS_SEARCH_MAX_LIMIT = 1000
+
+# Общий кэш воркеров (Redis): нужен кэшам поиска и тайлов, иначе —
+# LocMemCache своего процесса у каждого воркера
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        },
+    }
+
+# Кэш результатов поиска (Django cache framework) с пространственной
+# инвалидацией: координаты центра округляются до PRECISION знаков.
+# Включается только с общим кэшем (проверка points.E001): версии,
+# повышенные в кэше одного процесса, другие воркеры не видят
+POINTS_SEARCH_CACHE = os.environ.get('POINTS_SEARCH_CACHE', '0') == '1'
+POINTS_SEARCH_CACHE_ALIAS = 'default'
+POINTS_SEARCH_CACHE_PRECISION = int(os.environ.get('POINTS_SEARCH_CACHE_PRECISION', '4'))
+POINTS_SEARCH_CACHE_TTL = 300
+
+# Дельта-синхронизация (/api/sync/): курсор не продвигается дальше записей
+# журнала моложе SETTLE секунд — за это время успевают закоммититься
+# транзакции, получившие меньший id
+POINTS_SYNC_SETTLE_SECONDS = 5
+
+# Кластеризация точек (/api/points/clusters/): ячеек сетки на ширину тайла,
+# максимальный zoom и предел числа ячеек в одном запросе
+POINTS_CLUSTER_CELLS_PER_TILE = 8
+POINTS_CLUSTER_MAX_ZOOM = 22
+POINTS_CLUSTER_MAX_CELLS = 10000
+
+# Векторные тайлы (/api/points/tiles/{z}/{x}/{y}.mvt): размер сетки тайла,
+# буфер в его единицах и предел числа точек в тайле. Тайлы до
+# CACHE_MAX_ZOOM кэшируются до изменения точки внутри тайла (тот же
+# кэш, что у поиска, и то же требование общего бэкенда — points.E002)
+POINTS_TILE_MAX_ZOOM = 22
+POINTS_TILE_EXTENT = 4096
+POINTS_TILE_BUFFER = 64
+POINTS_TILE_MAX_FEATURES = 5000
+POINTS_TILE_CACHE = os.environ.get('POINTS_TILE_CACHE', '0') == '1'
+POINTS_TILE_CACHE_MAX_ZOOM = 16
+POINTS_TILE_CACHE_TTL = 86400
+
+# Поиск внутри области: предел числа вершин многоугольника и сколько
+# скомпилированных сохранённых областей держать в памяти процесса
+POINTS_REGION_MAX_VERTICES = 100000
+POINTS_REGION_CACHE_SIZE = 64
+
+# Метрики запросов (points.instrumentation): заголовок Server-Timing и
+# /api/metrics/ в формате Prometheus. Без токена метрики видит только staff
+POINTS_METRICS = os.environ.get('POINTS_METRICS', '1') == '1'
+POINTS_SERVER_TIMING = os.environ.get('POINTS_SERVER_TIMING', '1') == '1'
+POINTS_METRICS_TOKEN = os.environ.get('POINTS_METRICS_TOKEN', '')
+
+# Кэш Token-аутентификации (points.authentication): LRU в памяти процесса
+# с TTL, при заданном алиасе — ещё и общий Django cache между воркерами
+POINTS_AUTH_CACHE = os.environ.get('POINTS_AUTH_CACHE', '1') == '1'
+POINTS_AUTH_CACHE_TTL = int(os.environ.get('POINTS_AUTH_CACHE_TTL', '60'))
+POINTS_AUTH_CACHE_SIZE = 10000
+POINTS_AUTH_CACHE_ALIAS = os.environ.get('POINTS_AUTH_CACHE_ALIAS') or None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -157,7 +283,7 @@ STATIC_URL = 'static/'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'points.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -171,3 +297,24 @@ SPATIALITE_LIBRARY_PATH = os.environ.get('SPATIALITE_LIBRARY_PATH')
 PROJ_LIB = os.environ.get('PROJ_LIB')
 
 # Add PostGIS support with GeoDjango
+
+# Push новых сообщений по SSE (/api/stream/messages/, только ASGI): брокер
+# между процессами (InProcessBroker — один процесс, PostgresBroker —
+# LISTEN/NOTIFY), ячейка индекса подписок в градусах, длина очереди
+# клиента и интервал keepalive в секундах
+POINTS_REALTIME_BROKER = os.environ.get('POINTS_REALTIME_BROKER', 'points.realtime.InProcessBroker')
+POINTS_REALTIME_CELL_DEG = 1.0
+POINTS_REALTIME_QUEUE_SIZE = 100
+POINTS_REALTIME_KEEPALIVE = 15
+
+# Логи приложения (выбор пространственного движка, переходы на fallback)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'points': {'handlers': ['console'], 'level': os.environ.get('POINTS_LOG_LEVEL', 'INFO')},
+    },
+}
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Point, Message
+from .models import Point, Message, Region
 
 # Register your models here.
 
@@ -10,3 +10,8 @@ class PointAdmin(admin.ModelAdmin):
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     list_display = ['user', 'point', 'content', 'created_at']
+
+
+@admin.register(Region)
+class RegionAdmin(admin.ModelAdmin):
+    list_display = ['name', 'user', 'updated_at']
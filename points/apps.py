@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class PointsConfig(AppConfig):
     name = 'points'
+    default_auto_field = 'django.db.models.BigAutoField'
+
+    def ready(self):
+        from . import checks, engines, instrumentation, signals  # noqa: F401
+
+        # Движок выбирается при старте, чтобы выбор попал в лог сразу
+        engines.get_engine()
@@ -0,0 +1,230 @@
+"""
+Нативные async-варианты list/search для точек и сообщений.
+
+Под ASGI такие view не занимают поток на время ожидания БД: запросы идут
+через async ORM (async for по queryset, acount), токен проверяется асинхронно.
+Python-fallback (points.engines) остаётся синхронным и выполняется через
+sync_to_async.
+"""
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.geos import Point as GEOSPoint
+from django.contrib.gis.measure import D
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import engines
+from .authentication import aauthenticate_token
+from .models import Message, Point
+from .pagination import decode_cursor, decode_id_cursor, decode_time_cursor, next_page_headers, parse_page_params
+from .realtime import format_sse, hub
+from .serializers import MessageSerializer, PointRowSerializer
+from .views import (
+    _fallback_messages, _fallback_points, _fallback_recent_messages, _keyset_q, _parse_geo_params, _parse_order,
+    _parse_point_fields, _parse_time_window, _recent_q,
+)
+
+
+def _json(data, status=status.HTTP_200_OK, headers=None):
+    return JsonResponse(
+        data, status=status, safe=False, encoder=JSONEncoder,
+        json_dumps_params={'ensure_ascii': False}, headers=headers,
+    )
+
+
+def _error(response):
+    return _json(response.data, status=response.status_code)
+
+
+def token_required(view):
+    """
+    Только GET с Token-аутентификацией. View получает DRF Request,
+    чтобы переиспользовать разбор параметров и сериализаторы.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return _json({'detail': f'Метод "{request.method}" не разрешен.'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+        user = await aauthenticate_token(request)
+        if user is None:
+            response = _json({'detail': 'Учетные данные не были предоставлены.'}, status=status.HTTP_401_UNAUTHORIZED)
+            response['WWW-Authenticate'] = 'Token'
+            return response
+        api_request = Request(request)
+        api_request.user = user
+        return await view(api_request, *args, **kwargs)
+    return wrapper
+
+
+async def _postgis_page(qs, limit, after, columns=None):
+    """Страница по (distance, id); с columns — строки .values(), как views._postgis_rows_page."""
+    if after:
+        qs = qs.filter(_keyset_q(after))
+    qs = qs.order_by('distance', 'id')
+    if columns is not None:
+        qs = qs.values(*columns, 'distance')
+    rows = [row async for row in qs[:limit + 1]]
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    next_after = (last['distance'].m, last['id']) if columns is not None else (last.distance.m, last.pk)
+    return rows[:limit], next_after
+
+
+async def _recent_page(qs, limit, after):
+    """Страница от новых к старым и курсор следующей, как views._recent_page."""
+    if after:
+        qs = qs.filter(_recent_q(after))
+    rows = [row async for row in qs.order_by('-created_at', '-id')[:limit + 1]]
+    next_after = (rows[limit - 1].created_at, rows[limit - 1].pk) if len(rows) > limit else None
+    return rows[:limit], next_after
+
+
+async def _id_rows_page(qs, limit, after, columns):
+    """Страница строк .values(*columns) по возрастанию id и курсор следующей."""
+    if after:
+        qs = qs.filter(id__gt=after[1])
+    rows = [row async for row in qs.order_by('id').values(*columns)[:limit + 1]]
+    next_after = (rows[limit - 1]['id'], rows[limit - 1]['id']) if len(rows) > limit else None
+    return rows[:limit], next_after
+
+
+def _paginated(request, data, next_after, headers=None):
+    """Как pagination.paginated_response: тело — список, следующая страница — в Link и X-Next-Cursor."""
+    return _json(data, headers={**(headers or {}), **next_page_headers(request, next_after)})
+
+
+@token_required
+async def point_list(request):
+    """Точки по возрастанию id с ?fields= и keyset-курсором; X-Total-Count — всего точек."""
+    fields, error_response = _parse_point_fields(request)
+    if error_response:
+        return _error(error_response)
+    limit, after, error_response = parse_page_params(request, decode=decode_id_cursor)
+    if error_response:
+        return _error(error_response)
+
+    qs = Point.objects.all()
+    total = await qs.acount()
+    rows, next_after = await _id_rows_page(qs, limit, after, PointRowSerializer.columns(fields))
+    serializer = PointRowSerializer(rows, many=True, fields=fields)
+    return _paginated(request, serializer.data, next_after, headers={'X-Total-Count': str(total)})
+
+
+@token_required
+async def message_list(request):
+    """Лента сообщений как MessageViewSet.list: от новых к старым, since/until, курсор по времени."""
+    time_q, _, error_response = _parse_time_window(request)
+    if error_response:
+        return _error(error_response)
+    limit, after, error_response = parse_page_params(request, decode=decode_time_cursor)
+    if error_response:
+        return _error(error_response)
+
+    qs = Message.objects.filter(time_q)
+    total = await qs.acount()
+    messages, next_after = await _recent_page(qs, limit, after)
+    serializer = MessageSerializer(messages, many=True, context={'request': request})
+    return _paginated(request, serializer.data, next_after, headers={'X-Total-Count': str(total)})
+
+
+@token_required
+async def point_search(request):
+    lat, lon, radius, error_response = _parse_geo_params(request)
+    if error_response:
+        return _error(error_response)
+    fields, error_response = _parse_point_fields(request)
+    if error_response:
+        return _error(error_response)
+    columns = PointRowSerializer.columns(fields)
+    limit, after, error_response = parse_page_params(request)
+    if error_response:
+        return _error(error_response)
+
+    if engines.use_database(engines.RADIUS):
+        center = GEOSPoint(lon, lat, srid=4326)
+        qs = Point.objects.filter(location__distance_lte=(center, D(km=radius)))
+        qs = qs.annotate(distance=Distance('location', center))
+        rows, next_after = await _postgis_page(qs, limit, after, columns)
+    else:
+        rows, next_after = await sync_to_async(_fallback_points)(lat, lon, radius, limit, after, columns)
+    serializer = PointRowSerializer(rows, many=True, fields=fields)
+    return _paginated(request, serializer.data, next_after)
+
+
+@token_required
+async def message_search(request):
+    """Параметры и порядок — как у MessageViewSet.search: since/until и order=distance|recent."""
+    lat, lon, radius, error_response = _parse_geo_params(request)
+    if error_response:
+        return _error(error_response)
+    time_q, _, error_response = _parse_time_window(request)
+    if error_response:
+        return _error(error_response)
+    order, error_response = _parse_order(request)
+    if error_response:
+        return _error(error_response)
+    decode = decode_time_cursor if order == 'recent' else decode_cursor
+    limit, after, error_response = parse_page_params(request, decode=decode)
+    if error_response:
+        return _error(error_response)
+
+    if engines.use_database(engines.RADIUS):
+        center = GEOSPoint(lon, lat, srid=4326)
+        if order == 'recent':
+            nearby = Point.objects.filter(location__distance_lte=(center, D(km=radius))).values('id')
+            qs = Message.objects.select_related('point').filter(time_q, point_id__in=nearby)
+            messages, next_after = await _recent_page(qs, limit, after)
+        else:
+            qs = Message.objects.select_related('point').filter(time_q, point__location__distance_lte=(center, D(km=radius)))
+            qs = qs.annotate(distance=Distance('point__location', center))
+            messages, next_after = await _postgis_page(qs, limit, after)
+    else:
+        fallback = _fallback_recent_messages if order == 'recent' else _fallback_messages
+        messages, next_after = await sync_to_async(fallback)(lat, lon, radius, limit, after, time_q)
+    serializer = MessageSerializer(messages, many=True, context={'request': request})
+    return _paginated(request, serializer.data, next_after)
+
+
+async def _sse_events(lat, lon, radius):
+    subscription = hub.subscribe(lat, lon, radius, asyncio.get_running_loop())
+    keepalive = getattr(settings, 'POINTS_REALTIME_KEEPALIVE', 15)
+    try:
+        yield format_sse(comment='subscribed')
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                # Комментарий держит соединение живым через прокси
+                yield format_sse(comment='keepalive')
+                continue
+            dropped = subscription.take_dropped()
+            if dropped:
+                yield format_sse(event='dropped', data={'count': dropped})
+            yield format_sse(event='message', data=event['data'], event_id=event['id'])
+    finally:
+        hub.unsubscribe(subscription)
+
+
+@token_required
+async def message_stream(request):
+    """
+    Новые сообщения в круге (latitude, longitude, radius) потоком
+    Server-Sent Events. Только под ASGI: под WSGI соединение занимало бы
+    поток воркера. После события dropped (клиент не успевал читать) или
+    переподключения пропущенное догружается через messages/search.
+    """
+    lat, lon, radius, error_response = _parse_geo_params(request)
+    if error_response:
+        return _error(error_response)
+    response = StreamingHttpResponse(_sse_events(lat, lon, radius), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Отключить буферизацию ответа в nginx
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,197 @@
+"""
+Token-аутентификация с кэшем: пара (user, token) запоминается по ключу
+токена, и повторные запросы не делают выборку Token + User.
+
+Кэш — LRU в памяти процесса с TTL (POINTS_AUTH_CACHE_SIZE,
+POINTS_AUTH_CACHE_TTL), при POINTS_AUTH_CACHE_ALIAS — ещё и общий
+Django cache, чтобы промах одного воркера закрывал запись остальных.
+Удаление токена и сохранение пользователя (деактивация, смена прав)
+сбрасывают запись через сигналы (points.signals). Локальные копии в
+других процессах живут не дольше TTL.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+from .instrumentation import registry
+
+_PREFIX = 'points:auth'
+
+
+def _token_key(request):
+    """Ключ из заголовка 'Authorization: Token <key>' или None."""
+    auth = get_authorization_header(request).split()
+    if len(auth) != 2 or auth[0].lower() != b'token':
+        return None
+    try:
+        return auth[1].decode()
+    except UnicodeError:
+        return None
+
+
+def _digest(key):
+    # Сам токен в ключах общего кэша не хранится
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class TokenCache:
+    """LRU (user, token) по ключу токена с TTL и счётчиками попаданий."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.counters = {'hit_local': 0, 'hit_shared': 0, 'miss': 0}
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, 'POINTS_AUTH_CACHE', False)
+
+    @staticmethod
+    def _shared():
+        alias = getattr(settings, 'POINTS_AUTH_CACHE_ALIAS', None)
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def _ttl():
+        return getattr(settings, 'POINTS_AUTH_CACHE_TTL', 60)
+
+    def _count(self, result):
+        with self._lock:
+            self.counters[result] += 1
+
+    def _get_local(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            if entry[0] <= monotonic():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            self.counters['hit_local'] += 1
+            return entry[1]
+
+    def _set_local(self, digest, value):
+        with self._lock:
+            self._entries[digest] = (monotonic() + self._ttl(), value)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > getattr(settings, 'POINTS_AUTH_CACHE_SIZE', 10000):
+                self._entries.popitem(last=False)
+
+    def _from_shared(self, digest, value):
+        if value is None:
+            self._count('miss')
+            return None
+        self._count('hit_shared')
+        self._set_local(digest, value)
+        return value
+
+    def get(self, key):
+        """(user, token) из кэша или None."""
+        if not self.enabled():
+            return None
+        digest = _digest(key)
+        value = self._get_local(digest)
+        if value is not None:
+            return value
+        shared = self._shared()
+        return self._from_shared(digest, shared.get(f'{_PREFIX}:{digest}') if shared else None)
+
+    async def aget(self, key):
+        if not self.enabled():
+            return None
+        digest = _digest(key)
+        value = self._get_local(digest)
+        if value is not None:
+            return value
+        shared = self._shared()
+        return self._from_shared(digest, await shared.aget(f'{_PREFIX}:{digest}') if shared else None)
+
+    def set(self, key, user, token):
+        if not self.enabled():
+            return
+        digest = _digest(key)
+        self._set_local(digest, (user, token))
+        shared = self._shared()
+        if shared:
+            shared.set(f'{_PREFIX}:{digest}', (user, token), self._ttl())
+
+    async def aset(self, key, user, token):
+        if not self.enabled():
+            return
+        digest = _digest(key)
+        self._set_local(digest, (user, token))
+        shared = self._shared()
+        if shared:
+            await shared.aset(f'{_PREFIX}:{digest}', (user, token), self._ttl())
+
+    def evict(self, key):
+        digest = _digest(key)
+        with self._lock:
+            self._entries.pop(digest, None)
+        shared = self._shared()
+        if shared:
+            shared.delete(f'{_PREFIX}:{digest}')
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.counters = dict.fromkeys(self.counters, 0)
+
+    def collect(self):
+        """Семейства метрик для /api/metrics/."""
+        with self._lock:
+            counters = dict(self.counters)
+            size = len(self._entries)
+        return [
+            ('points_auth_cache_requests_total', 'counter', 'Проверки токена через кэш аутентификации.', [
+                f'points_auth_cache_requests_total{{result="{result}"}} {count}'
+                for result, count in counters.items()
+            ]),
+            ('points_auth_cache_entries', 'gauge', 'Записей в локальном кэше аутентификации.', [
+                f'points_auth_cache_entries {size}',
+            ]),
+        ]
+
+
+token_cache = TokenCache()
+registry.add_collector(token_cache.collect)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с кэшем (user, token): без запроса к БД при попадании."""
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user, token)
+        return user, token
+
+
+async def aauthenticate_token(request):
+    """
+    Асинхронный аналог CachedTokenAuthentication для нативных async view:
+    пользователь по токену или None.
+    """
+    key = _token_key(request)
+    if key is None:
+        return None
+    cached = await token_cache.aget(key)
+    if cached is not None:
+        return cached[0]
+    try:
+        token = await Token.objects.select_related('user').aget(key=key)
+    except Token.DoesNotExist:
+        return None
+    if not token.user.is_active:
+        return None
+    await token_cache.aset(key, token.user, token)
+    return token.user
@@ -0,0 +1,172 @@
+"""
+Журнал изменений для дельта-синхронизации клиентов.
+
+Записи пишутся сигналами (points.signals) и массовой загрузкой
+(points.ingest); read_changes отдаёт изменения после курсора, схлопывая
+несколько изменений одного объекта в последнее.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.db.models import Max
+from django.utils import timezone
+
+from .geo import bbox_q
+from .models import ChangeLog, Message, Point
+
+
+def record(model, object_id, action, coords=None, previous=None):
+    latitude, longitude = coords or (None, None)
+    previous_latitude, previous_longitude = previous or (None, None)
+    ChangeLog.objects.create(
+        model=model, object_id=object_id, action=action,
+        latitude=latitude, longitude=longitude,
+        previous_latitude=previous_latitude, previous_longitude=previous_longitude,
+    )
+
+
+def message_coords(message):
+    """Координаты точки сообщения или None, если точка уже удалена (каскад)."""
+    try:
+        point = message.point
+    except Point.DoesNotExist:
+        return None
+    return point.latitude, point.longitude
+
+
+def record_points(points):
+    """Записи upsert для точек, созданных bulk_create (сигналы не срабатывают)."""
+    ChangeLog.objects.bulk_create([
+        ChangeLog(
+            model=ChangeLog.POINT, object_id=point.pk, action=ChangeLog.UPSERT,
+            latitude=point.latitude, longitude=point.longitude,
+        )
+        for point in points
+        if point.pk is not None
+    ])
+
+
+def record_copied_points(user, after_id):
+    """
+    Записи upsert для точек пользователя, загруженных COPY: id COPY не
+    возвращает, поэтому журнал заполняется одним INSERT ... SELECT по
+    точкам с id больше after_id. Лишняя запись для параллельно созданной
+    точки безвредна — upsert идемпотентен.
+    """
+    log_table = ChangeLog._meta.db_table
+    point_table = Point._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {log_table} (model, object_id, action, latitude, longitude, created_at) '
+            f'SELECT %s, id, %s, latitude, longitude, %s FROM {point_table} WHERE user_id = %s AND id > %s',
+            [ChangeLog.POINT, ChangeLog.UPSERT, timezone.now(), user.pk, after_id],
+        )
+
+
+def last_point_id():
+    return Point.objects.aggregate(last=Max('id'))['last'] or 0
+
+
+def _settled_before():
+    """
+    Граница «устоявшихся» записей. id выдаются при вставке, а видны после
+    коммита, поэтому запись с меньшим id может появиться позже записи с
+    большим. Курсор не продвигается дальше записей моложе
+    POINTS_SYNC_SETTLE_SECONDS — их клиент получит ещё раз.
+    """
+    return timezone.now() - timedelta(seconds=getattr(settings, 'POINTS_SYNC_SETTLE_SECONDS', 5))
+
+
+def settled_cursor():
+    """Последняя запись журнала, после которой уже не появится записей с меньшим id."""
+    return ChangeLog.objects.using(DEFAULT_DB_ALIAS).filter(
+        created_at__lte=_settled_before(),
+    ).aggregate(last=Max('id'))['last'] or 0
+
+
+def replay_point_changes(since, upsert, delete):
+    """
+    Применить к in-process индексу записи журнала точек после since:
+    upsert(pk, lat, lon) и delete(pk) в порядке журнала. Возвращает
+    (курсор, число записей). Курсор не обгоняет неустоявшиеся записи —
+    следующий вызов применит их ещё раз, upsert и delete идемпотентны.
+    Журнал читается только с default: на отстающей реплике курсор ушёл бы
+    дальше видимых записей.
+    """
+    settled_before = _settled_before()
+    entries = ChangeLog.objects.using(DEFAULT_DB_ALIAS).filter(
+        model=ChangeLog.POINT, id__gt=since,
+    ).order_by('id').values_list('id', 'object_id', 'action', 'latitude', 'longitude', 'created_at')
+    cursor, settled, applied = since, True, 0
+    for entry_id, pk, action, lat, lon, created_at in entries.iterator():
+        if action == ChangeLog.UPSERT:
+            upsert(pk, lat, lon)
+        else:
+            delete(pk)
+        applied += 1
+        settled = settled and created_at <= settled_before
+        if settled:
+            cursor = entry_id
+    return cursor, applied
+
+
+def read_changes(since, limit, bbox=None):
+    """
+    Изменения после курсора since: (changes, cursor, has_more).
+
+    changes — список (entry, obj) в порядке журнала, по одной последней
+    записи на объект; obj — текущий экземпляр для upsert (None, если объект
+    удалён позже — его delete придёт следующими страницами) или None для delete.
+    """
+    qs = ChangeLog.objects.filter(id__gt=since)
+    if bbox is not None:
+        qs = qs.filter(bbox_q(bbox) | bbox_q(bbox, prefix='previous_'))
+    entries = list(qs.order_by('id')[:limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    cursor = since
+    settled_before = _settled_before()
+    for entry in entries:
+        if entry.created_at > settled_before:
+            break
+        cursor = entry.id
+    # Неустоявшийся хвост страницы: клиенту стоит повторить позже, а не сразу
+    has_more = has_more and cursor == entries[-1].id
+
+    latest = {}
+    for entry in entries:
+        latest.pop((entry.model, entry.object_id), None)
+        latest[entry.model, entry.object_id] = entry
+
+    upserts = {ChangeLog.POINT: [], ChangeLog.MESSAGE: []}
+    for (model, object_id), entry in latest.items():
+        if entry.action == ChangeLog.UPSERT:
+            upserts[model].append(object_id)
+    objects = {
+        ChangeLog.POINT: Point.objects.in_bulk(upserts[ChangeLog.POINT]),
+        ChangeLog.MESSAGE: Message.objects.in_bulk(upserts[ChangeLog.MESSAGE]),
+    }
+
+    changes = []
+    for (model, object_id), entry in latest.items():
+        if entry.action == ChangeLog.UPSERT:
+            obj = objects[model].get(object_id)
+            if obj is None:
+                continue
+            changes.append((entry, obj))
+        else:
+            changes.append((entry, None))
+    return changes, cursor, has_more
+
+
+def compact():
+    """
+    Удалить записи, перекрытые более поздней записью того же объекта.
+    Журнал остаётся достаточным для синхронизации с нуля, а его размер —
+    порядка числа объектов плюс удалений. Возвращает число удалённых записей.
+    """
+    latest_ids = ChangeLog.objects.values('model', 'object_id').annotate(last=Max('id')).values('last')
+    deleted, _ = ChangeLog.objects.exclude(id__in=latest_ids).delete()
+    return deleted
@@ -0,0 +1,34 @@
+"""
+Проверки настроек (manage.py check, запуск сервера и тестов).
+
+Кэши поиска и тайлов инвалидируются повышением версий в Django cache.
+В кэше процесса (LocMemCache) новую версию видит только воркер,
+обработавший запись, а остальные до истечения TTL отдают устаревшие
+ответы. Поэтому эти кэши включаются только с общим бэкендом.
+"""
+from django.conf import settings
+from django.core import checks
+
+# Бэкенды, которые не делят данные между процессами
+_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    alias = getattr(settings, 'POINTS_SEARCH_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend not in _LOCAL_BACKENDS:
+        return []
+    errors = []
+    for setting, code in (('POINTS_SEARCH_CACHE', 'points.E001'), ('POINTS_TILE_CACHE', 'points.E002')):
+        if getattr(settings, setting, False):
+            errors.append(checks.Error(
+                f'{setting} включён, но кэш {alias!r} ({backend}) не общий для воркеров: '
+                f'инвалидация дойдёт только до процесса, обработавшего запись.',
+                hint='Задайте REDIS_URL (или общий бэкенд в CACHES) либо выключите кэш.',
+                id=code,
+            ))
+    return errors
@@ -0,0 +1,136 @@
+"""
+Выбор пространственного движка: какие запросы выполняет БД, а какие —
+Python-fallback (in-process индекс, haversine, GEOS).
+
+Движок определяется один раз по бэкенду соединения (PostGIS, SpatiaLite,
+без пространственного расширения) или задаётся POINTS_SPATIAL_ENGINE.
+Если возможность движку недоступна, запрос сразу идёт в fallback — без
+заведомо неудачного SQL. Ошибки БД не маскируются fallback-ом и доходят
+до клиента. Выбор движка и каждый переход на fallback пишутся в лог и
+в счётчики /api/metrics/.
+"""
+import logging
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import connection
+from django.dispatch import receiver
+
+from .instrumentation import registry
+
+logger = logging.getLogger(__name__)
+
+# Возможности: поиск в радиусе, окно bbox, область, KNN, кластеры, MVT-тайлы
+RADIUS = 'radius'
+BBOX = 'bbox'
+REGION = 'region'
+KNN = 'knn'
+CLUSTERS = 'clusters'
+TILES = 'tiles'
+
+
+@dataclass(frozen=True)
+class Engine:
+    name: str
+    capabilities: frozenset
+
+
+ENGINES = {
+    'postgis': Engine('postgis', frozenset({RADIUS, BBOX, REGION, KNN, CLUSTERS, TILES})),
+    # Нет оператора <->, ST_AsMVT и приведения geography -> geometry
+    'spatialite': Engine('spatialite', frozenset({RADIUS, BBOX, REGION})),
+    'python': Engine('python', frozenset()),
+}
+
+_lock = threading.Lock()
+_engine = None
+_source = None
+_queries = defaultdict(int)
+_warned = set()
+
+
+def detect_engine(conn=connection):
+    """Имя движка по операциям бэкенда соединения, без запросов к БД."""
+    if getattr(conn.ops, 'postgis', False):
+        return 'postgis'
+    if getattr(conn.ops, 'spatialite', False):
+        return 'spatialite'
+    return 'python'
+
+
+def get_engine():
+    global _engine, _source
+    if _engine is not None:
+        return _engine
+    with _lock:
+        if _engine is None:
+            name = getattr(settings, 'POINTS_SPATIAL_ENGINE', 'auto')
+            _source = 'setting'
+            if name == 'auto':
+                name, _source = detect_engine(), 'detected'
+            if name not in ENGINES:
+                raise ImproperlyConfigured(
+                    f"POINTS_SPATIAL_ENGINE: неизвестный движок {name!r}, допустимы auto, {', '.join(ENGINES)}"
+                )
+            _engine = ENGINES[name]
+            logger.info(
+                'Пространственный движок: %s (%s), в БД: %s', name, _source,
+                ', '.join(sorted(_engine.capabilities)) or 'ничего',
+            )
+    return _engine
+
+
+def reset():
+    global _engine, _source
+    with _lock:
+        _engine = _source = None
+        _warned.clear()
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    if setting == 'POINTS_SPATIAL_ENGINE':
+        reset()
+
+
+def use_database(capability):
+    """
+    True — запрос выполняет БД движка, False — Python-fallback. Каждый
+    вызов учитывается в points_spatial_queries_total.
+    """
+    engine = get_engine()
+    supported = capability in engine.capabilities
+    path = engine.name if supported else 'python'
+    with _lock:
+        _queries[(capability, engine.name, path)] += 1
+        first = not supported and capability not in _warned
+        _warned.add(capability)
+    if first and engine.name != 'python':
+        logger.warning('Движок %s не поддерживает %s: используется Python-fallback', engine.name, capability)
+    elif not supported:
+        logger.debug('Python-fallback для %s (движок %s)', capability, engine.name)
+    return supported
+
+
+def collect():
+    """Семейства метрик для /api/metrics/."""
+    with _lock:
+        engine, source, queries = _engine, _source, sorted(_queries.items())
+    families = [
+        ('points_spatial_queries_total', 'counter', 'Пространственные запросы по возможности и пути выполнения.', [
+            f'points_spatial_queries_total{{capability="{capability}",engine="{name}",path="{path}"}} {count}'
+            for (capability, name, path), count in queries
+        ]),
+    ]
+    if engine is not None:
+        families.append(('points_spatial_engine_info', 'gauge', 'Выбранный пространственный движок.', [
+            f'points_spatial_engine_info{{engine="{engine.name}",source="{source}"}} 1',
+        ]))
+    return families
+
+
+registry.add_collector(collect)
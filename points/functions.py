@@ -0,0 +1,20 @@
+from django.contrib.gis.db.models import PointField
+from django.db.models import F, FloatField, Func, Value
+
+
+class KNNDistance(Func):
+    """
+    Оператор PostGIS <-> для ORDER BY: KNN-сортировка по GiST-индексу.
+
+    Для geography возвращает сферическое расстояние в метрах, но ценность
+    в том, что планировщик отдаёт строки прямо из индекса в порядке
+    удаления, не вычисляя расстояние до всей таблицы.
+    """
+
+    arg_joiner = ' <-> '
+    template = '(%(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, field_name, point, **extra):
+        geography = Value(point, output_field=PointField(geography=True, srid=4326))
+        super().__init__(F(field_name), geography, **extra)
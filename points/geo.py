@@ -0,0 +1,236 @@
+from math import asin, atan2, cos, degrees, radians, sin, sqrt
+
+import numpy as np
+from django.db.models import Q
+
+EARTH_RADIUS_KM = 6371
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * atan2(sqrt(a), sqrt(1 - a))
+
+
+def haversine_rad(lat_r, lon_r, lats_r, lons_r, cos_lats):
+    """
+    Векторный haversine по заранее переведённым в радианы массивам.
+
+    cos_lats — предвычисленный cos(lats_r): индекс хранит его рядом с
+    координатами, чтобы не считать на каждый запрос.
+    """
+    a = np.sin((lats_r - lat_r) * 0.5) ** 2
+    a += cos(lat_r) * cos_lats * np.sin((lons_r - lon_r) * 0.5) ** 2
+    np.clip(a, 0.0, 1.0, out=a)
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def distances_km(center, lats, lons):
+    """Расстояния в км от center=(lat, lon) до каждой точки массивов lats/lons."""
+    lats_r = np.radians(np.asarray(lats, dtype=np.float64))
+    lons_r = np.radians(np.asarray(lons, dtype=np.float64))
+    return haversine_rad(radians(center[0]), radians(center[1]), lats_r, lons_r, np.cos(lats_r))
+
+
+def sort_within(distances, ids, radius_km, limit=None, after=None):
+    """
+    Отбор по радиусу и сортировка по (расстояние, id) за один проход.
+
+    after=(distance, id) отсекает всё до курсора включительно, limit
+    ограничивает результат: полная сортировка не нужна, достаточно
+    argpartition. Возвращает позиции подходящих элементов во входных массивах.
+    """
+    mask = distances <= radius_km
+    if after is not None:
+        after_distance, after_id = after
+        mask &= (distances > after_distance) | ((distances == after_distance) & (ids > after_id))
+    positions = np.flatnonzero(mask)
+
+    if limit is not None and len(positions) > limit:
+        # Берём limit ближайших; равные граничному расстоянию добираем целиком,
+        # чтобы порядок по id среди них остался корректным
+        kth = np.partition(distances[positions], limit - 1)[limit - 1]
+        positions = positions[distances[positions] <= kth]
+
+    order = np.lexsort((ids[positions], distances[positions]))
+    positions = positions[order]
+    if limit is not None:
+        positions = positions[:limit]
+    return positions
+
+
+def within_radius(center, lats, lons, radius_km, ids=None, limit=None, after=None):
+    """
+    Точки в радиусе radius_km от center=(lat, lon).
+
+    Возвращает (positions, distances): позиции во входных массивах,
+    отсортированные по расстоянию, и расстояния до них. ids, limit и
+    after — см. sort_within.
+    """
+    distances = distances_km(center, lats, lons)
+    if ids is None:
+        ids = np.arange(len(distances))
+    positions = sort_within(distances, np.asarray(ids), radius_km, limit=limit, after=after)
+    return positions, distances[positions]
+
+
+def bounding_box(lat, lon, radius_km):
+    """
+    Ограничивающий прямоугольник круга поиска.
+
+    Возвращает (min_lat, max_lat, lon_ranges), где lon_ranges — список
+    диапазонов долготы: два диапазона при переходе через антимеридиан,
+    полный диапазон [-180, 180], если круг накрывает полюс.
+    """
+    dlat = radius_km / EARTH_RADIUS_KM
+    lat_r = radians(lat)
+    min_lat_r = lat_r - dlat
+    max_lat_r = lat_r + dlat
+    half_pi = radians(90)
+
+    if min_lat_r <= -half_pi or max_lat_r >= half_pi:
+        # Круг накрывает полюс — подходят все долготы
+        return (
+            degrees(max(min_lat_r, -half_pi)),
+            degrees(min(max_lat_r, half_pi)),
+            [(-180.0, 180.0)],
+        )
+
+    dlon = degrees(asin(min(1.0, sin(dlat) / cos(lat_r))))
+    min_lon = lon - dlon
+    max_lon = lon + dlon
+    if min_lon < -180:
+        lon_ranges = [(min_lon + 360, 180.0), (-180.0, max_lon)]
+    elif max_lon > 180:
+        lon_ranges = [(min_lon, 180.0), (-180.0, max_lon - 360)]
+    else:
+        lon_ranges = [(min_lon, max_lon)]
+    return degrees(min_lat_r), degrees(max_lat_r), lon_ranges
+
+
+def bounding_box_q(lat, lon, radius_km, prefix=''):
+    """
+    Q-фильтр по bounding box круга поиска для range-сканирования индекса
+    (latitude, longitude). prefix — путь до модели Point, например 'point__'.
+    """
+    min_lat, max_lat, lon_ranges = bounding_box(lat, lon, radius_km)
+    lon_q = Q()
+    for min_lon, max_lon in lon_ranges:
+        lon_q |= Q(**{f'{prefix}longitude__range': (min_lon, max_lon)})
+    q = Q(**{f'{prefix}latitude__range': (min_lat, max_lat)})
+    if lon_ranges != [(-180.0, 180.0)]:
+        q &= lon_q
+    return q
+
+
+def bbox_lon_ranges(min_lon, max_lon):
+    """Диапазоны долгот bbox; min_lon > max_lon означает переход через антимеридиан."""
+    if min_lon <= max_lon:
+        return [(min_lon, max_lon)]
+    return [(min_lon, 180.0), (-180.0, max_lon)]
+
+
+def bbox_q(bbox, prefix=''):
+    """Q-фильтр по прямоугольнику (min_lon, min_lat, max_lon, max_lat) в порядке GeoJSON."""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    lon_q = Q()
+    for lo, hi in bbox_lon_ranges(min_lon, max_lon):
+        lon_q |= Q(**{f'{prefix}longitude__range': (lo, hi)})
+    return Q(**{f'{prefix}latitude__range': (min_lat, max_lat)}) & lon_q
+
+
+def bbox_center(bbox):
+    """Центр bbox (lat, lon) с учётом перехода через антимеридиан."""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    if min_lon > max_lon:
+        max_lon += 360
+    lon = (min_lon + max_lon) / 2
+    if lon > 180:
+        lon -= 360
+    return (min_lat + max_lat) / 2, lon
+
+
+def bbox_radius_km(bbox, center):
+    """Радиус круга с центром center=(lat, lon), накрывающего bbox: до дальнего угла или середины стороны."""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    lat, lon = center
+    edge_points = [
+        (y, x)
+        for y in (min_lat, lat, max_lat)
+        for x in (min_lon, lon, max_lon)
+    ]
+    return max(haversine_km(lat, lon, y, x) for y, x in edge_points) * 1.001
+
+
+def bbox_polygon(bbox, margin_deg=0.01, step_deg=1.0):
+    """
+    MultiPolygon (SRID 4326) для индексного отбора geography по bbox.
+
+    Рёбра geography — дуги большого круга, а не параллели, поэтому рёбра
+    прямоугольника дробятся через step_deg градусов, а сам он расширяется на
+    margin_deg: многоугольник гарантированно накрывает bbox, точная граница
+    проверяется фильтром bbox_q. Возвращает None для bbox у полюса — там
+    отбор по индексу не помогает.
+    """
+    from django.contrib.gis.geos import MultiPolygon, Polygon
+
+    min_lon, min_lat, max_lon, max_lat = bbox
+    min_lat, max_lat = min_lat - margin_deg, max_lat + margin_deg
+    if min_lat <= -89 or max_lat >= 89:
+        return None
+    polygons = []
+    for lo, hi in bbox_lon_ranges(min_lon, max_lon):
+        lo, hi = max(-180.0, lo - margin_deg), min(180.0, hi + margin_deg)
+        steps = max(1, int(np.ceil((hi - lo) / step_deg)))
+        xs = np.linspace(lo, hi, steps + 1).tolist()
+        ring = (
+            [(x, min_lat) for x in xs]
+            + [(x, max_lat) for x in reversed(xs)]
+            + [(lo, min_lat)]
+        )
+        polygons.append(Polygon(ring))
+    return MultiPolygon(*polygons, srid=4326)
+
+
+def in_bbox(lats, lons, bbox):
+    """Булева маска точек массивов lats/lons внутри bbox (min_lon, min_lat, max_lon, max_lat)."""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    lon_mask = np.zeros(len(lons), dtype=bool)
+    for lo, hi in bbox_lon_ranges(min_lon, max_lon):
+        lon_mask |= (lons >= lo) & (lons <= hi)
+    return lon_mask & (lats >= min_lat) & (lats <= max_lat)
+
+
+def grid_clusters(lats, lons, cell_deg):
+    """
+    Кластеры точек по сетке cell_deg градусов с той же привязкой, что
+    ST_SnapToGrid: точка относится к ближайшему узлу сетки.
+
+    Возвращает словари count, latitude/longitude (центроид) и bbox
+    (min_lon, min_lat, max_lon, max_lat) участников.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if not len(lats):
+        return []
+    cells = np.stack([np.rint(lats / cell_deg), np.rint(lons / cell_deg)], axis=1)
+    _, inverse, counts = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    size = len(counts)
+    sum_lat = np.bincount(inverse, weights=lats, minlength=size)
+    sum_lon = np.bincount(inverse, weights=lons, minlength=size)
+    bounds = []
+    for values, reduce_at, fill in (
+        (lons, np.minimum.at, np.inf), (lats, np.minimum.at, np.inf),
+        (lons, np.maximum.at, -np.inf), (lats, np.maximum.at, -np.inf),
+    ):
+        bound = np.full(size, fill)
+        reduce_at(bound, inverse, values)
+        bounds.append(bound.tolist())
+    return [
+        {'count': count, 'latitude': lat, 'longitude': lon, 'bbox': list(bbox)}
+        for count, lat, lon, bbox in zip(
+            counts.tolist(), (sum_lat / counts).tolist(), (sum_lon / counts).tolist(), zip(*bounds),
+        )
+    ]
@@ -0,0 +1,234 @@
+"""
+Массовая загрузка точек: общая часть для POST /api/points/bulk/ и
+manage.py import_points.
+
+Записи валидируются пачками без DRF-сериализатора на каждую строку,
+location собирается из lat/lon сразу для всей пачки. Запись идёт через
+PostgreSQL COPY, а на остальных СУБД — через bulk_create. Ошибки
+отдельных строк собираются в отчёт и не прерывают загрузку.
+"""
+import io
+import json
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.contrib.gis.geos import Point as GEOSPoint
+from django.db import DatabaseError, connection, transaction
+
+from .changelog import last_point_id, record_copied_points, record_points
+from .models import Point
+from .search_cache import invalidate_all
+from .spatial_index import point_index
+from .tiles import invalidate_all_tiles
+
+DEFAULT_CHUNK_SIZE = 5000
+
+_NAME_MAX_LENGTH = Point._meta.get_field('name').max_length
+
+
+@dataclass
+class IngestResult:
+    created: int = 0
+    errors: list = field(default_factory=list)
+
+    def add_error(self, line, errors):
+        self.errors.append({'line': line, 'errors': errors})
+
+
+def iter_ndjson(lines):
+    """(номер строки, запись или None, ошибка или None) для каждой непустой строки NDJSON."""
+    for line_no, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.lstrip('\ufeff').strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line), None
+        except ValueError as e:
+            yield line_no, None, {'non_field_errors': [f'Некорректный JSON: {e}']}
+
+
+def iter_geojson(collection):
+    """Записи из GeoJSON FeatureCollection: geometry -> location, properties -> поля."""
+    for number, feature in enumerate(collection.get('features') or [], start=1):
+        if not isinstance(feature, dict):
+            yield number, None, {'non_field_errors': ['Ожидается GeoJSON Feature.']}
+            continue
+        record = dict(feature.get('properties') or {})
+        record['location'] = feature.get('geometry')
+        yield number, record, None
+
+
+def iter_payload(data):
+    """Записи из уже разобранного JSON: FeatureCollection, список или один объект."""
+    if isinstance(data, dict) and data.get('type') == 'FeatureCollection':
+        yield from iter_geojson(data)
+        return
+    rows = data if isinstance(data, list) else [data]
+    for number, record in enumerate(rows, start=1):
+        yield number, record, None
+
+
+def _float(value):
+    if isinstance(value, bool):
+        raise ValueError
+    return float(value)
+
+
+def validate_record(record):
+    """
+    Проверить одну запись по тем же правилам, что PointSerializer.
+
+    Возвращает (name, description, latitude, longitude) или бросает
+    ValueError со словарём ошибок в args[0].
+    """
+    if not isinstance(record, dict):
+        raise ValueError({'non_field_errors': ['Ожидается JSON-объект.']})
+
+    errors = {}
+    name = record.get('name')
+    if not isinstance(name, str) or not name.strip():
+        errors['name'] = ['Обязательное поле.']
+    elif len(name) > _NAME_MAX_LENGTH:
+        errors['name'] = [f'Убедитесь, что это значение содержит не более {_NAME_MAX_LENGTH} символов.']
+    description = record.get('description') or ''
+    if not isinstance(description, str):
+        errors['description'] = ['Ожидается строка.']
+
+    location = record.get('location')
+    lat = record.get('latitude')
+    lon = record.get('longitude')
+    if location and (lat is not None or lon is not None):
+        errors['non_field_errors'] = ["Нельзя передавать одновременно 'location' и 'latitude/longitude'."]
+    elif location:
+        try:
+            if location.get('type') != 'Point':
+                errors['location'] = ['location должен быть типа Point.']
+            else:
+                lon, lat = (_float(c) for c in location['coordinates'][:2])
+        except (AttributeError, KeyError, TypeError, ValueError):
+            errors['location'] = ['Некорректная GeoJSON-геометрия.']
+    elif lat is None or lon is None:
+        errors['non_field_errors'] = [
+            "Необходимо указать либо 'location', либо оба параметра 'latitude' и 'longitude'."
+        ]
+
+    if lat is not None and lon is not None and 'location' not in errors:
+        try:
+            lat, lon = _float(lat), _float(lon)
+        except (TypeError, ValueError):
+            errors['non_field_errors'] = ['Координаты должны быть числами.']
+        else:
+            if not -90 <= lat <= 90:
+                errors['latitude'] = ['Широта должна быть в диапазоне от -90 до 90.']
+            if not -180 <= lon <= 180:
+                errors['longitude'] = ['Долгота должна быть в диапазоне от -180 до 180.']
+
+    if errors:
+        raise ValueError(errors)
+    return name, description, lat, lon
+
+
+def _copy_rows(user, rows):
+    """PostgreSQL COPY: location передаётся как EWKT, geography разбирает его сам."""
+    buffer = io.StringIO()
+    for name, description, lat, lon in rows:
+        buffer.write(
+            '\t'.join([
+                str(user.pk),
+                _copy_escape(name),
+                _copy_escape(description),
+                repr(lat),
+                repr(lon),
+                f'SRID=4326;POINT({lon!r} {lat!r})',
+                '0',
+            ]) + '\n'
+        )
+    buffer.seek(0)
+    table = Point._meta.db_table
+    sql = f'COPY {table} (user_id, name, description, latitude, longitude, location, message_count) FROM STDIN'
+    with connection.cursor() as cursor:
+        if hasattr(cursor, 'copy_expert'):
+            cursor.copy_expert(sql, buffer)
+        else:
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+def _copy_escape(value):
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _bulk_create_rows(user, rows):
+    points = [
+        Point(
+            user=user, name=name, description=description, latitude=lat, longitude=lon,
+            location=GEOSPoint(lon, lat, srid=4326),
+        )
+        for name, description, lat, lon in rows
+    ]
+    Point.objects.bulk_create(points)
+    # bulk_create не вызывает post_save — индекс обновляем сами
+    for point in points:
+        if point.pk is not None:
+            point_index.add(point.pk, point.latitude, point.longitude)
+    return points
+
+
+def _write_chunk(user, rows, use_copy):
+    with transaction.atomic():
+        if use_copy:
+            after_id = last_point_id()
+            _copy_rows(user, rows)
+            record_copied_points(user, after_id)
+        else:
+            record_points(_bulk_create_rows(user, rows))
+
+
+def _after_ingest(use_copy):
+    """Один раз после последней пачки: сигналы post_save не срабатывали."""
+    if use_copy:
+        # COPY не возвращает id: индекс перестроится из БД при следующем поиске
+        point_index.reset()
+    # Кэш поиска и тайлов сбрасываем целиком
+    invalidate_all(('points', 'points-stats', 'messages'))
+    invalidate_all_tiles()
+
+
+def ingest_points(records, user, chunk_size=DEFAULT_CHUNK_SIZE, use_copy=None):
+    """
+    Загрузить записи вида (номер, запись, ошибка разбора) от iter_* функций.
+
+    use_copy=None — COPY на PostgreSQL, bulk_create на остальных СУБД.
+    """
+    if use_copy is None:
+        use_copy = connection.vendor == 'postgresql'
+    result = IngestResult()
+    records = iter(records)
+    try:
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                return result
+            rows, lines = [], []
+            for line_no, record, error in chunk:
+                if error:
+                    result.add_error(line_no, error)
+                    continue
+                try:
+                    rows.append(validate_record(record))
+                    lines.append(line_no)
+                except ValueError as e:
+                    result.add_error(line_no, e.args[0])
+            if not rows:
+                continue
+            try:
+                _write_chunk(user, rows, use_copy)
+                result.created += len(rows)
+            except DatabaseError as e:
+                for line_no in lines:
+                    result.add_error(line_no, {'non_field_errors': [f'Ошибка записи в БД: {e}']})
+    finally:
+        if result.created:
+            _after_ingest(use_copy)
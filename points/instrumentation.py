@@ -0,0 +1,282 @@
+"""
+Инструментирование запросов: число SQL-запросов и время БД, время
+сериализации, размер ответа и общая длительность по каждому view и action.
+
+Метрики текущего запроса отдаются заголовком Server-Timing, накопленные —
+в текстовом формате Prometheus на /api/metrics/. Счётчики живут в памяти
+процесса: при нескольких воркерах каждый отдаёт свои.
+
+Замер дешёвый: пара perf_counter на SQL-запрос и на сериализацию объекта
+верхнего уровня, обновление счётчиков под одной блокировкой на запрос.
+"""
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Границы корзин гистограммы длительности, секунды
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar('points_request_stats', default=None)
+
+
+def _enabled():
+    return getattr(settings, 'POINTS_METRICS', False)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'serializer_time', 'serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+
+def current_stats():
+    return _current.get()
+
+
+def _execute_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += perf_counter() - started
+
+
+def install_execute_wrapper(connection):
+    # В начало списка: connection.execute_wrapper() снимает последний элемент
+    if _execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _execute_wrapper)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if _enabled():
+        install_execute_wrapper(connection)
+
+
+class TimedSerializerMixin:
+    """
+    Учитывает время to_representation в метриках запроса. Вложенные вызовы
+    (элементы many=True внутри уже измеряемого объекта, вложенные
+    сериализаторы) не считаются повторно. Ленивые SQL-запросы во время
+    сериализации входят и во время БД, и во время сериализации.
+    """
+
+    def to_representation(self, instance):
+        stats = _current.get()
+        if stats is None or stats.serializing:
+            return super().to_representation(instance)
+        stats.serializing = True
+        started = perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_time += perf_counter() - started
+            stats.serializing = False
+
+
+class _Series:
+    __slots__ = ('requests', 'duration', 'buckets', 'queries', 'db_time', 'serializer_time', 'response_bytes')
+
+    def __init__(self):
+        self.requests = 0
+        self.duration = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.response_bytes = 0
+
+
+class Registry:
+    """Накопленные метрики по ключу (view, action, method, status)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = defaultdict(_Series)
+        self._collectors = []
+
+    def add_collector(self, collector):
+        """
+        Дополнительные метрики: collector() возвращает список
+        (name, kind, help_text, samples) на момент отдачи /api/metrics/.
+        """
+        self._collectors.append(collector)
+
+    def observe(self, labels, duration, stats, response_bytes):
+        bucket = bisect_left(DURATION_BUCKETS, duration)
+        with self._lock:
+            series = self._series[labels]
+            series.requests += 1
+            series.duration += duration
+            if bucket < len(DURATION_BUCKETS):
+                series.buckets[bucket] += 1
+            series.queries += stats.queries
+            series.db_time += stats.db_time
+            series.serializer_time += stats.serializer_time
+            series.response_bytes += response_bytes
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                labels: (
+                    series.requests, series.duration, list(series.buckets), series.queries,
+                    series.db_time, series.serializer_time, series.response_bytes,
+                )
+                for labels, series in self._series.items()
+            }
+
+    def render(self):
+        """Текст в формате Prometheus exposition 0.0.4."""
+        snapshot = sorted(self.snapshot().items())
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(samples)
+
+        def label_str(labels, extra=''):
+            view, action, method, status = labels
+            text = f'view="{_escape(view)}",action="{_escape(action)}",method="{method}",status="{status}"'
+            return '{' + text + extra + '}'
+
+        histogram = []
+        for labels, (requests, duration, buckets, *_rest) in snapshot:
+            cumulative = 0
+            for bound, count in zip(DURATION_BUCKETS, buckets):
+                cumulative += count
+                le = f',le="{bound}"'
+                histogram.append(f'points_request_duration_seconds_bucket{label_str(labels, le)} {cumulative}')
+            le = ',le="+Inf"'
+            histogram.append(f'points_request_duration_seconds_bucket{label_str(labels, le)} {requests}')
+            histogram.append(f'points_request_duration_seconds_sum{label_str(labels)} {duration!r}')
+            histogram.append(f'points_request_duration_seconds_count{label_str(labels)} {requests}')
+        family('points_request_duration_seconds', 'histogram', 'Длительность обработки запроса.', histogram)
+
+        for index, name, help_text in (
+            (3, 'points_db_queries_total', 'Число SQL-запросов.'),
+            (4, 'points_db_seconds_total', 'Суммарное время SQL-запросов.'),
+            (5, 'points_serializer_seconds_total', 'Суммарное время сериализации.'),
+            (6, 'points_response_bytes_total', 'Суммарный размер тел ответов (без потоковых).'),
+        ):
+            family(name, 'counter', help_text, [
+                f'{name}{label_str(labels)} {values[index]!r}' for labels, values in snapshot
+            ])
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                family(name, kind, help_text, samples)
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+def _labels(request, response):
+    match = request.resolver_match
+    method = request.method
+    if match is None:
+        return 'unmatched', method.lower(), method, response.status_code
+    # DRF ViewSet: actions — отображение метода в action (list, create, search, ...)
+    actions = getattr(match.func, 'actions', None) or {}
+    return match.view_name or match.route, actions.get(method.lower(), method.lower()), method, response.status_code
+
+
+def _response_bytes(response):
+    if response.streaming:
+        return 0
+    return len(response.content)
+
+
+def _server_timing(duration, stats):
+    return (
+        f'db;dur={stats.db_time * 1000:.1f};desc="SQL x{stats.queries}", '
+        f'ser;dur={stats.serializer_time * 1000:.1f}, '
+        f'total;dur={duration * 1000:.1f}'
+    )
+
+
+def _finish(request, response, started, stats):
+    duration = perf_counter() - started
+    registry.observe(_labels(request, response), duration, stats, _response_bytes(response))
+    if getattr(settings, 'POINTS_SERVER_TIMING', True):
+        response['Server-Timing'] = _server_timing(duration, stats)
+    return response
+
+
+class InstrumentationMiddleware:
+    """Замер запроса целиком; работает и в WSGI, и в ASGI-цепочке."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _start(self):
+        # Соединения, открытые до подключения обработчика connection_created
+        for connection in connections.all(initialized_only=True):
+            install_execute_wrapper(connection)
+        stats = RequestStats()
+        return stats, _current.set(stats), perf_counter()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not _enabled():
+            return self.get_response(request)
+        stats, token, started = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return _finish(request, response, started, stats)
+
+    async def __acall__(self, request):
+        if not _enabled():
+            return await self.get_response(request)
+        stats, token, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return _finish(request, response, started, stats)
+
+
+def metrics_view(request):
+    """
+    Накопленные метрики в формате Prometheus. Доступ — staff-пользователю
+    или по заголовку Authorization: Bearer <POINTS_METRICS_TOKEN>.
+    """
+    token = getattr(settings, 'POINTS_METRICS_TOKEN', '')
+    authorized = token and request.headers.get('Authorization') == f'Bearer {token}'
+    if not (authorized or request.user.is_staff):
+        return HttpResponseForbidden('Доступ к метрикам запрещён.')
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
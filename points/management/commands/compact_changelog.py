@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from points.changelog import compact
+
+
+class Command(BaseCommand):
+    help = 'Сжать журнал изменений: оставить по одной последней записи на объект.'
+
+    def handle(self, *args, **options):
+        deleted = compact()
+        self.stdout.write(self.style.SUCCESS(f'Удалено записей журнала: {deleted}'))
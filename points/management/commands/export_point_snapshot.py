@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from points.snapshot import export_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Выгрузить точки в файл снимка индекса, общий для всех воркеров (POINTS_INDEX_SNAPSHOT).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='Путь к файлу снимка; по умолчанию POINTS_INDEX_SNAPSHOT')
+        parser.add_argument(
+            '--cell-deg', type=float, default=getattr(settings, 'POINTS_INDEX_CELL_DEG', 0.1),
+            help='Размер ячейки сетки в градусах',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path'] or getattr(settings, 'POINTS_INDEX_SNAPSHOT', '')
+        if not path:
+            raise CommandError('Не задан путь: --path или POINTS_INDEX_SNAPSHOT')
+        if options['cell_deg'] <= 0:
+            raise CommandError('--cell-deg должен быть положительным')
+
+        started = time.monotonic()
+        count, changelog_id = export_snapshot(path, options['cell_deg'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Снимок {path}: точек {count}, журнал до id {changelog_id}, {elapsed:.1f} с'
+        ))
@@ -0,0 +1,65 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from points.ingest import DEFAULT_CHUNK_SIZE, ingest_points, iter_ndjson, iter_payload
+
+
+class Command(BaseCommand):
+    help = 'Массовый импорт точек из NDJSON (по объекту на строку) или GeoJSON FeatureCollection.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу с точками')
+        parser.add_argument('--user', required=True, help='Имя пользователя-владельца точек')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument(
+            '--format', choices=['auto', 'ndjson', 'geojson'], default='auto',
+            help='Формат файла; auto — по первой строке',
+        )
+        parser.add_argument('--no-copy', action='store_true', help='Не использовать COPY даже на PostgreSQL')
+        parser.add_argument('--max-errors', type=int, default=20, help='Сколько ошибок строк вывести')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['user']} не найден")
+
+        started = time.monotonic()
+        with open(options['path'], encoding='utf-8-sig') as f:
+            fmt = options['format']
+            if fmt == 'auto':
+                fmt = 'geojson' if self._looks_like_feature_collection(f) else 'ndjson'
+            if fmt == 'geojson':
+                try:
+                    records = iter_payload(json.load(f))
+                except ValueError as e:
+                    raise CommandError(f'Некорректный GeoJSON: {e}')
+            else:
+                records = iter_ndjson(f)
+            result = ingest_points(
+                records, user, chunk_size=options['chunk_size'],
+                use_copy=False if options['no_copy'] else None,
+            )
+        elapsed = time.monotonic() - started
+
+        for error in result.errors[:options['max_errors']]:
+            self.stderr.write(f"Строка {error['line']}: {error['errors']}")
+        rate = result.created / elapsed if elapsed else result.created
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано точек: {result.created}, ошибок: {len(result.errors)}, '
+            f'{elapsed:.1f} с ({rate:.0f} строк/с)'
+        ))
+
+    @staticmethod
+    def _looks_like_feature_collection(f):
+        """NDJSON — если первая строка сама по себе JSON-объект, но не FeatureCollection."""
+        first_line = f.readline()
+        f.seek(0)
+        try:
+            first = json.loads(first_line)
+        except ValueError:
+            return True
+        return isinstance(first, dict) and first.get('type') == 'FeatureCollection'
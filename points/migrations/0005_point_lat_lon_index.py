@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('points', '0004_alter_message_point_alter_message_user_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='point',
+            index=models.Index(fields=['latitude', 'longitude'], name='points_poin_latitud_136fe3_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:08
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_message_stats(apps, schema_editor):
+    """Заполнить агрегаты сообщений для существующих точек"""
+    Point = apps.get_model('points', 'Point')
+    Message = apps.get_model('points', 'Message')
+
+    counts = Message.objects.values('point_id').annotate(n=Count('id'))
+    for row in counts.iterator():
+        latest = (
+            Message.objects.filter(point_id=row['point_id'])
+            .order_by('-created_at', '-id')
+            .values('id', 'created_at')
+            .first()
+        )
+        Point.objects.filter(pk=row['point_id']).update(
+            message_count=row['n'],
+            last_message_at=latest['created_at'],
+            last_message_id=latest['id'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('points', '0005_point_lat_lon_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='point',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='point',
+            name='last_message_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='point',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_message_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('points', '0006_point_message_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['point', 'created_at'], name='points_mess_point_i_91b6ec_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['created_at'], name='points_mess_created_670c83_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:14
+
+from itertools import islice
+
+from django.db import migrations, models
+
+
+def populate_changelog(apps, schema_editor):
+    """Записи upsert для уже существующих точек и сообщений, чтобы синхронизация с нуля видела всё"""
+    ChangeLog = apps.get_model('points', 'ChangeLog')
+    Point = apps.get_model('points', 'Point')
+    Message = apps.get_model('points', 'Message')
+
+    points = Point.objects.order_by('id').values_list('id', 'latitude', 'longitude')
+    messages = Message.objects.order_by('id').values_list('id', 'point__latitude', 'point__longitude')
+    for model, rows in (('point', points), ('message', messages)):
+        rows = rows.iterator(chunk_size=5000)
+        while chunk := list(islice(rows, 5000)):
+            ChangeLog.objects.bulk_create([
+                ChangeLog(model=model, object_id=pk, action='upsert', latitude=lat, longitude=lon)
+                for pk, lat, lon in chunk
+            ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('points', '0007_message_time_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('point', 'Point'), ('message', 'Message')], max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete')], max_length=8)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('previous_latitude', models.FloatField(blank=True, null=True)),
+                ('previous_longitude', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model', 'object_id'], name='points_chan_model_79189c_idx')],
+            },
+        ),
+        migrations.RunPython(populate_changelog, migrations.RunPython.noop),
+    ]
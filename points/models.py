@@ -12,13 +12,26 @@ class Point(models.Model):
     latitude = models.FloatField()
     longitude = models.FloatField()
     location = gis_models.PointField(geography=True, srid=4326)
+    # Денормализованные агрегаты сообщений, обновляются сигналами Message
+    # (см. points.stats). last_message_id — без FK, чтобы не было цикла
+    # ссылок Point <-> Message при каскадном удалении.
+    message_count = models.PositiveIntegerField(default=0)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_message_id = models.BigIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Range-префильтр fallback-поиска по bounding box
+            models.Index(fields=['latitude', 'longitude']),
+        ]
 
     def save(self, *args, **kwargs):
         """
         Автоматическая синхронизация location с latitude/longitude.
         
         Важно: не работает с bulk_create() и QuerySet.update().
-        Для bulk операций используйте explicit заполнение location.
+        Для bulk операций используйте explicit заполнение location
+        или points.ingest.ingest_points().
         """
         # Всегда синхронизируем location с lat/lon
         if self.latitude is not None and self.longitude is not None:
@@ -34,5 +47,59 @@ class Message(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Лента сообщений точки и общая лента по времени (since/until, order=recent)
+            models.Index(fields=['point', 'created_at']),
+            models.Index(fields=['created_at']),
+        ]
+
     def __str__(self):
         return f"Message by {self.user} on {self.point}"
+
+
+class ChangeLog(models.Model):
+    """
+    Журнал изменений точек и сообщений для инкрементальной синхронизации
+    (GET /api/sync/). id монотонно растёт и служит курсором клиента.
+    Координаты — положение точки (для сообщения — его точки) на момент
+    изменения; previous_* заполняются при перемещении точки, чтобы клиент
+    с bbox узнал, что точка из него ушла.
+    """
+    POINT = 'point'
+    MESSAGE = 'message'
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+
+    model = models.CharField(max_length=16, choices=[(POINT, 'Point'), (MESSAGE, 'Message')])
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=8, choices=[(UPSERT, 'Upsert'), (DELETE, 'Delete')])
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    previous_latitude = models.FloatField(null=True, blank=True)
+    previous_longitude = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Сжатие журнала: последняя запись по каждому объекту
+            models.Index(fields=['model', 'object_id']),
+        ]
+
+    def __str__(self):
+        return f'{self.id}: {self.action} {self.model} {self.object_id}'
+
+
+class Region(models.Model):
+    """
+    Именованная область (район, геозона) для поиска точек и сообщений
+    внутри неё. Скомпилированная геометрия кэшируется в points.regions
+    по (id, updated_at).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='regions')
+    name = models.SlugField(max_length=100, unique=True)
+    geometry = gis_models.MultiPolygonField(geography=True, srid=4326)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,99 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def _default_limit():
+    return getattr(settings, 'POINTS_SEARCH_DEFAULT_LIMIT', 100)
+
+
+def _max_limit():
+    return getattr(settings, 'POINTS_SEARCH_MAX_LIMIT', 1000)
+
+
+def encode_cursor(key, pk):
+    """
+    Непрозрачный курсор keyset-пагинации по (key, id), где key —
+    расстояние (float) или время создания (datetime).
+    """
+    key = key.isoformat() if isinstance(key, datetime) else repr(key)
+    raw = f'{key}:{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    key, pk = base64.urlsafe_b64decode(padded.encode()).decode().rsplit(':', 1)
+    return key, int(pk)
+
+
+def decode_cursor(cursor):
+    """Курсор по расстоянию: (distance, id)."""
+    distance, pk = _decode(cursor)
+    return float(distance), pk
+
+
+def decode_id_cursor(cursor):
+    """Курсор по id: (id, id)."""
+    key, pk = _decode(cursor)
+    return int(key), pk
+
+
+def decode_time_cursor(cursor):
+    """Курсор по времени создания: (created_at, id)."""
+    created_at, pk = _decode(cursor)
+    return datetime.fromisoformat(created_at), pk
+
+
+def parse_limit(request):
+    """Размер страницы: limit, не больше POINTS_SEARCH_MAX_LIMIT. Возвращает (limit, error_response)."""
+    limit = request.query_params.get('limit')
+    try:
+        limit = int(limit) if limit else _default_limit()
+    except (TypeError, ValueError):
+        return None, Response({'error': 'Параметр limit должен быть целым числом'}, status=status.HTTP_400_BAD_REQUEST)
+    if limit <= 0 or limit > _max_limit():
+        return None, Response({'error': f'Параметр limit должен быть в диапазоне от 1 до {_max_limit()}'}, status=status.HTTP_400_BAD_REQUEST)
+    return limit, None
+
+
+def parse_page_params(request, decode=decode_cursor):
+    """
+    Параметры страницы поиска: limit (не больше POINTS_SEARCH_MAX_LIMIT)
+    и cursor. Возвращает (limit, after, error_response), где after —
+    (key, id) последней строки предыдущей страницы или None; формат key
+    задаёт decode.
+    """
+    limit, error_response = parse_limit(request)
+    if error_response:
+        return None, None, error_response
+    cursor = request.query_params.get('cursor')
+    after = None
+    if cursor:
+        try:
+            after = decode(cursor)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return None, None, Response({'error': 'Некорректный cursor'}, status=status.HTTP_400_BAD_REQUEST)
+    return limit, after, None
+
+
+def next_page_headers(request, next_after):
+    """Заголовки Link и X-Next-Cursor для следующей страницы (пусто, если её нет)."""
+    if next_after is None:
+        return {}
+    cursor = encode_cursor(*next_after)
+    url = replace_query_param(request.build_absolute_uri(), 'cursor', cursor)
+    return {'Link': f'<{url}>; rel="next"', 'X-Next-Cursor': cursor}
+
+
+def paginated_response(request, data, next_after):
+    """
+    Ответ со страницей результатов. Тело остаётся списком, ссылка на
+    следующую страницу передаётся в заголовках Link и X-Next-Cursor.
+    """
+    return Response(data, headers=next_page_headers(request, next_after))
@@ -0,0 +1,129 @@
+"""
+Параллельный fallback-поиск в радиусе.
+
+При радиусе до 1000 км кандидатами становятся сотни тысяч точек, и
+haversine с отбором по (расстояние, id) занимает одно ядро целиком.
+Начиная с POINTS_PARALLEL_MIN_POINTS кандидатов они делятся на
+POINTS_PARALLEL_WORKERS шардов. Индексы отдают кандидатов ячейка за
+ячейкой, поэтому соседние куски — соседние участки сетки. Шарды считаются
+в пуле потоков: ядра NumPy отпускают GIL, и потоки не платят за
+пересылку массивов, как пул процессов. Отсортированные частичные
+результаты сливаются k-way merge (heapq.merge).
+"""
+import heapq
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from math import radians
+
+import numpy as np
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .geo import haversine_rad, sort_within
+from .instrumentation import registry
+
+_lock = threading.Lock()
+_pool = None
+_queries = {'serial': 0, 'parallel': 0}
+
+
+def _workers():
+    workers = getattr(settings, 'POINTS_PARALLEL_WORKERS', None)
+    if workers is None:
+        return os.cpu_count() or 1
+    return workers
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(_workers(), thread_name_prefix='points-search')
+        return _pool
+
+
+def reset():
+    """
+    Новый пул для следующих запросов. Старый не останавливается: запросы,
+    уже взявшие его, дошлют в него шарды. Его потоки завершатся, когда
+    пул соберёт сборщик мусора.
+    """
+    global _pool
+    with _lock:
+        _pool = None
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    if setting == 'POINTS_PARALLEL_WORKERS':
+        reset()
+
+
+def _shard(lat_r, lon_r, radius_km, ids, lats_r, lons_r, cos_lats, limit, after):
+    distances = haversine_rad(lat_r, lon_r, lats_r, lons_r, cos_lats)
+    positions = sort_within(distances, ids, radius_km, limit=limit, after=after)
+    return ids[positions], distances[positions]
+
+
+def merge(parts, limit=None):
+    """
+    Слить отсортированные по (расстояние, id) пары массивов (ids, distances)
+    в одну пару, сохранив порядок; limit — сколько первых оставить.
+    """
+    runs = [zip(distances.tolist(), ids.tolist()) for ids, distances in parts]
+    merged = list(islice(heapq.merge(*runs), limit))
+    distances = np.fromiter((distance for distance, _ in merged), dtype=np.float64, count=len(merged))
+    ids = np.fromiter((pk for _, pk in merged), dtype=np.int64, count=len(merged))
+    return ids, distances
+
+
+def query_radius(lat, lon, radius_km, ids, lats_r, lons_r, cos_lats, limit=None, after=None):
+    """
+    Массивы (ids, distances_km) кандидатов в радиусе, отсортированные по
+    (расстояние, id). ids, lats_r, lons_r, cos_lats — координаты кандидатов
+    (радианы и cos широты, как в индексах); limit и after — см. geo.sort_within.
+    """
+    lat_r, lon_r = radians(lat), radians(lon)
+    workers = _workers()
+    if workers < 2 or len(ids) < getattr(settings, 'POINTS_PARALLEL_MIN_POINTS', 200000):
+        with _lock:
+            _queries['serial'] += 1
+        return _shard(lat_r, lon_r, radius_km, ids, lats_r, lons_r, cos_lats, limit, after)
+
+    with _lock:
+        _queries['parallel'] += 1
+    # Шарды — срезы без копирования
+    bounds = np.linspace(0, len(ids), workers + 1).astype(np.int64).tolist()
+    pool = _get_pool()
+    futures = [
+        pool.submit(
+            _shard, lat_r, lon_r, radius_km, ids[start:stop], lats_r[start:stop], lons_r[start:stop],
+            cos_lats[start:stop], limit, after,
+        )
+        for start, stop in zip(bounds, bounds[1:])
+    ]
+    parts = [future.result() for future in futures]
+    if limit is None:
+        # Без limit сливать пришлось бы всё в Python — дешевле одна сортировка NumPy
+        ids = np.concatenate([part[0] for part in parts])
+        distances = np.concatenate([part[1] for part in parts])
+        order = np.lexsort((ids, distances))
+        return ids[order], distances[order]
+    return merge(parts, limit)
+
+
+def collect():
+    """Семейства метрик для /api/metrics/."""
+    with _lock:
+        queries = dict(_queries)
+    return [
+        ('points_radius_queries_total', 'counter', 'Fallback-поиски в радиусе: в одном потоке или шардами.', [
+            f'points_radius_queries_total{{path="{path}"}} {count}' for path, count in queries.items()
+        ]),
+    ]
+
+
+registry.add_collector(collect)
@@ -0,0 +1,20 @@
+from rest_framework.parsers import BaseParser, JSONParser
+
+from .ingest import iter_ndjson
+
+
+class NDJSONParser(BaseParser):
+    """
+    Newline-delimited JSON. Возвращает генератор (номер строки, запись,
+    ошибка): тело читается построчно, а ошибка разбора одной строки не
+    отменяет остальные.
+    """
+
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return iter_ndjson(stream)
+
+
+class GeoJSONParser(JSONParser):
+    media_type = 'application/geo+json'
@@ -0,0 +1,306 @@
+"""
+Push новых сообщений подписчикам поблизости (Server-Sent Events).
+
+Клиент держит открытым GET /api/stream/messages/?latitude=&longitude=&radius=
+(под ASGI, см. async_views.message_stream) и получает события message
+с телом как у MessageSerializer — вместо опроса messages/search.
+
+Подписки процесса лежат в SubscriptionIndex: сетке ячеек по bounding box
+круга подписки, так что новое сообщение сверяется только с подписками
+ячейки своей точки. Между процессами события идут через брокер
+POINTS_REALTIME_BROKER: InProcessBroker доставляет внутри процесса (один
+воркер, тесты), PostgresBroker — через LISTEN/NOTIFY той же БД.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+from math import floor
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection, connections
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+
+from .geo import bounding_box, haversine_km
+from .instrumentation import registry
+
+logger = logging.getLogger(__name__)
+
+# Подписка на больше ячеек хранится в общем списке и проверяется для каждого сообщения
+_MAX_CELLS = 64
+
+
+class Subscription:
+    """Круг подписки и очередь событий в event loop соединения."""
+
+    def __init__(self, lat, lon, radius, loop, maxsize=100):
+        self.lat, self.lon, self.radius = lat, lon, radius
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def covers(self, lat, lon):
+        return haversine_km(self.lat, self.lon, lat, lon) <= self.radius
+
+    def offer(self, event):
+        """Положить событие в очередь; можно вызывать из любого потока."""
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # Цикл соединения уже закрыт, подписка вот-вот будет снята
+            pass
+
+    def _put(self, event):
+        # Медленный клиент теряет самые старые события, а не тормозит рассылку
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    def take_dropped(self):
+        dropped, self.dropped = self.dropped, 0
+        return dropped
+
+
+class SubscriptionIndex:
+    """Сетка ячеек cell_deg по lat/lon: ячейка -> подписки, чей bbox её задевает."""
+
+    def __init__(self, cell_deg=1.0):
+        self.cell_deg = cell_deg
+        self._lock = threading.Lock()
+        self._cells = defaultdict(set)
+        self._cells_of = {}
+        self._wide = set()
+
+    def __len__(self):
+        return len(self._cells_of)
+
+    def _cell(self, lat, lon):
+        return floor((lat + 90) / self.cell_deg), floor((lon + 180) / self.cell_deg)
+
+    def _cells_for(self, subscription):
+        min_lat, max_lat, lon_ranges = bounding_box(subscription.lat, subscription.lon, subscription.radius)
+        row_lo, row_hi = self._cell(min_lat, 0)[0], self._cell(max_lat, 0)[0]
+        col_ranges = [(self._cell(0, lo)[1], self._cell(0, hi)[1]) for lo, hi in lon_ranges]
+        if (row_hi - row_lo + 1) * sum(hi - lo + 1 for lo, hi in col_ranges) > _MAX_CELLS:
+            return None
+        return [
+            (row, col)
+            for row in range(row_lo, row_hi + 1)
+            for col_lo, col_hi in col_ranges
+            for col in range(col_lo, col_hi + 1)
+        ]
+
+    def add(self, subscription):
+        cells = self._cells_for(subscription)
+        with self._lock:
+            self._cells_of[subscription] = cells
+            if cells is None:
+                self._wide.add(subscription)
+                return
+            for cell in cells:
+                self._cells[cell].add(subscription)
+
+    def discard(self, subscription):
+        with self._lock:
+            cells = self._cells_of.pop(subscription, None)
+            self._wide.discard(subscription)
+            for cell in cells or ():
+                members = self._cells[cell]
+                members.discard(subscription)
+                if not members:
+                    del self._cells[cell]
+
+    def match(self, lat, lon):
+        """Подписки, чей круг содержит (lat, lon)."""
+        with self._lock:
+            candidates = [*self._cells.get(self._cell(lat, lon), ()), *self._wide]
+        return [subscription for subscription in candidates if subscription.covers(lat, lon)]
+
+
+class InProcessBroker:
+    """Доставка подписчикам этого же процесса: один воркер, разработка, тесты."""
+
+    def __init__(self, dispatch):
+        self.dispatch = dispatch
+
+    def start(self):
+        pass
+
+    def publish(self, event):
+        self.dispatch(event)
+
+
+class PostgresBroker:
+    """
+    LISTEN/NOTIFY PostgreSQL (psycopg2 или psycopg 3): publish отправляет pg_notify,
+    поток-слушатель в каждом процессе с подписчиками раздаёт уведомления
+    своему SubscriptionIndex. Тело события больше лимита NOTIFY не
+    передаётся — процесс-получатель читает сообщение из БД сам.
+    """
+
+    channel = 'points_messages'
+    max_payload = 7900
+
+    def __init__(self, dispatch):
+        self.dispatch = dispatch
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._listen_forever, name='points-realtime-listener', daemon=True).start()
+
+    def publish(self, event):
+        payload = json.dumps(event, cls=JSONEncoder)
+        if len(payload.encode()) > self.max_payload:
+            payload = json.dumps({key: value for key, value in event.items() if key != 'data'}, cls=JSONEncoder)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, payload])
+
+    def _listen_forever(self):
+        while True:
+            try:
+                self._listen()
+            except Exception:
+                logger.exception('Слушатель %s упал, переподключение', self.channel)
+                time.sleep(1)
+
+    def _listen(self):
+        from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+        db = connections['default']
+        # Собственное соединение, а не get_new_connection: с пулом (DB_POOL)
+        # слушатель навсегда занял бы соединение пула
+        conn = db.Database.connect(**db.get_connection_params())
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {self.channel}')
+            if is_psycopg3:
+                for notify in conn.notifies():
+                    self.dispatch(json.loads(notify.payload))
+                return
+            while True:
+                if select.select([conn], [], [], 5) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self.dispatch(json.loads(conn.notifies.pop(0).payload))
+        finally:
+            conn.close()
+
+
+class Hub:
+    """Подписки процесса и брокер, через который приходят события."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._broker = None
+        self.index = SubscriptionIndex(getattr(settings, 'POINTS_REALTIME_CELL_DEG', 1.0))
+        self.counters = {'published': 0, 'delivered': 0}
+
+    @property
+    def broker(self):
+        with self._lock:
+            if self._broker is None:
+                broker_class = import_string(getattr(settings, 'POINTS_REALTIME_BROKER', 'points.realtime.InProcessBroker'))
+                self._broker = broker_class(self.dispatch)
+            return self._broker
+
+    def subscribe(self, lat, lon, radius, loop):
+        subscription = Subscription(lat, lon, radius, loop, getattr(settings, 'POINTS_REALTIME_QUEUE_SIZE', 100))
+        self.broker.start()
+        self.index.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.index.discard(subscription)
+
+    def publish(self, event):
+        with self._lock:
+            self.counters['published'] += 1
+        self.broker.publish(event)
+
+    def dispatch(self, event):
+        """Раздать событие подписчикам процесса, чей круг содержит точку сообщения."""
+        subscriptions = self.index.match(event['latitude'], event['longitude'])
+        if not subscriptions:
+            return
+        if 'data' not in event:
+            event = {**event, 'data': _message_data(event['id'])}
+            if event['data'] is None:
+                return
+        for subscription in subscriptions:
+            subscription.offer(event)
+        with self._lock:
+            self.counters['delivered'] += len(subscriptions)
+
+    def reset(self):
+        with self._lock:
+            self._broker = None
+        self.index = SubscriptionIndex(getattr(settings, 'POINTS_REALTIME_CELL_DEG', 1.0))
+
+    def collect(self):
+        """Семейства метрик для /api/metrics/."""
+        with self._lock:
+            counters = dict(self.counters)
+        return [
+            ('points_realtime_subscribers', 'gauge', 'Открытые подписки на сообщения в процессе.', [
+                f'points_realtime_subscribers {len(self.index)}',
+            ]),
+            ('points_realtime_events_total', 'counter', 'События о новых сообщениях.', [
+                f'points_realtime_events_total{{result="{result}"}} {count}' for result, count in counters.items()
+            ]),
+        ]
+
+
+def _message_data(pk):
+    from .models import Message
+    from .serializers import MessageSerializer
+
+    message = Message.objects.filter(pk=pk).first()
+    return MessageSerializer(message).data if message is not None else None
+
+
+hub = Hub()
+registry.add_collector(hub.collect)
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    if setting in ('POINTS_REALTIME_BROKER', 'POINTS_REALTIME_CELL_DEG'):
+        hub.reset()
+
+
+def message_event(message, data):
+    """Событие о сообщении: координаты его точки и представление MessageSerializer."""
+    return {
+        'id': message.pk,
+        'latitude': message.point.latitude,
+        'longitude': message.point.longitude,
+        'data': dict(data),
+    }
+
+
+def format_sse(event=None, data=None, event_id=None, comment=None):
+    """Один кадр text/event-stream."""
+    lines = []
+    if comment is not None:
+        lines.append(f': {comment}')
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event is not None:
+        lines.append(f'event: {event}')
+    if data is not None:
+        lines.append('data: ' + json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
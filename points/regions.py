@@ -0,0 +1,102 @@
+"""
+Области поиска: GeoJSON-многоугольник из запроса или сохранённый Region.
+
+Fallback без PostGIS проверяет точки prepared-геометрией GEOS после
+префильтра по bbox области. Сохранённые области держатся в памяти процесса
+уже скомпилированными (геометрия, prepared, bbox) — повторный запрос по
+имени не разбирает геометрию заново. Ключ кэша — (id, updated_at), так что
+изменение области в другом процессе тоже приводит к перекомпиляции.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.contrib.gis.geos import GEOSException, GEOSGeometry, MultiPolygon
+from django.contrib.gis.geos import Point as GEOSPoint
+
+from .models import Region
+
+
+class CompiledRegion:
+    __slots__ = ('region_id', 'geometry', 'prepared', 'bbox')
+
+    def __init__(self, geometry, region_id=None):
+        self.region_id = region_id
+        self.geometry = geometry
+        self.prepared = geometry.prepared
+        self.bbox = tuple(geometry.extent)
+
+    def covers(self, lats, lons):
+        """Булева маска точек массивов lats/lons, покрытых областью."""
+        covers = self.prepared.covers
+        return np.fromiter(
+            (covers(GEOSPoint(lon, lat, srid=4326)) for lat, lon in zip(lats.tolist(), lons.tolist())),
+            dtype=bool, count=len(lats),
+        )
+
+
+def parse_geometry(data):
+    """
+    MultiPolygon (SRID 4326) из GeoJSON Polygon/MultiPolygon или Feature с
+    такой геометрией. Бросает ValueError с текстом ошибки для клиента.
+    """
+    if isinstance(data, dict) and data.get('type') == 'Feature':
+        data = data.get('geometry')
+    if not isinstance(data, dict) or data.get('type') not in ('Polygon', 'MultiPolygon'):
+        raise ValueError('Ожидается GeoJSON Polygon или MultiPolygon.')
+    try:
+        geometry = GEOSGeometry(json.dumps(data), srid=4326)
+    except (GEOSException, ValueError, TypeError):
+        raise ValueError('Некорректная GeoJSON-геометрия.')
+    return normalize(geometry)
+
+
+def normalize(geometry):
+    """Polygon -> MultiPolygon с проверкой валидности и числа вершин."""
+    if geometry.geom_type == 'Polygon':
+        geometry = MultiPolygon(geometry, srid=geometry.srid)
+    if geometry.geom_type != 'MultiPolygon':
+        raise ValueError('Ожидается Polygon или MultiPolygon.')
+    if geometry.srid is None:
+        geometry.srid = 4326
+    elif geometry.srid != 4326:
+        geometry.transform(4326)
+    max_vertices = getattr(settings, 'POINTS_REGION_MAX_VERTICES', 100000)
+    if geometry.num_coords > max_vertices:
+        raise ValueError(f'Слишком сложная геометрия: больше {max_vertices} вершин.')
+    if not geometry.valid:
+        raise ValueError(f'Невалидная геометрия: {geometry.valid_reason}')
+    return geometry
+
+
+_compiled = OrderedDict()
+_lock = threading.Lock()
+
+
+def compiled_region(name):
+    """Скомпилированная сохранённая область по имени или None, если её нет."""
+    row = Region.objects.filter(name=name).values_list('pk', 'updated_at').first()
+    if row is None:
+        return None
+    pk, updated_at = row
+    with _lock:
+        cached = _compiled.get(pk)
+        if cached is not None and cached[0] == updated_at:
+            _compiled.move_to_end(pk)
+            return cached[1]
+
+    geometry = Region.objects.values_list('geometry', flat=True).get(pk=pk)
+    compiled = CompiledRegion(geometry, region_id=pk)
+    with _lock:
+        _compiled[pk] = (updated_at, compiled)
+        _compiled.move_to_end(pk)
+        while len(_compiled) > getattr(settings, 'POINTS_REGION_CACHE_SIZE', 64):
+            _compiled.popitem(last=False)
+    return compiled
+
+
+def evict(pk):
+    with _lock:
+        _compiled.pop(pk, None)
@@ -0,0 +1,111 @@
+import json
+from itertools import chain
+
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .tiles import MEDIA_TYPE as MVT_MEDIA_TYPE
+
+# Форматы, в которых поиск отдаёт результат потоком
+STREAMING_FORMATS = ('ndjson', 'geojson')
+
+# Сколько строк ORM забирает из БД за раз при потоковой выдаче
+STREAM_CHUNK_SIZE = 2000
+
+_FROM_ROW = object()
+
+
+def _dumps(data):
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def _feature(row, geometry=_FROM_ROW):
+    properties = dict(row)
+    if geometry is _FROM_ROW:
+        geometry = properties.pop('location', None)
+    return {'type': 'Feature', 'id': properties.get('id'), 'geometry': geometry, 'properties': properties}
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline-delimited JSON: одна строка на объект."""
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(_dumps(row) + '\n' for row in rows).encode()
+
+
+class GeoJSONRenderer(BaseRenderer):
+    """
+    GeoJSON FeatureCollection. Геометрия берётся из поля location,
+    остальные поля уходят в properties.
+    """
+
+    media_type = 'application/geo+json'
+    format = 'geojson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, list):
+            return _dumps(data).encode()
+        return _dumps({'type': 'FeatureCollection', 'features': [_feature(row) for row in data]}).encode()
+
+
+class MVTRenderer(BaseRenderer):
+    """
+    Mapbox Vector Tile для Accept: application/vnd.mapbox-vector-tile.
+    Тело тайла view отдаёт уже закодированным, ошибки — JSON.
+    """
+
+    media_type = MVT_MEDIA_TYPE
+    format = 'mvt'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        return _dumps(data).encode()
+
+
+def _ndjson_chunks(rows):
+    for row, _ in rows:
+        yield (_dumps(row) + '\n').encode()
+
+
+def _geojson_chunks(rows):
+    yield b'{"type":"FeatureCollection","features":['
+    separator = b''
+    for row, geometry in rows:
+        yield separator + _dumps(_feature(row, geometry)).encode()
+        separator = b','
+    yield b']}'
+
+
+def eager(iterable):
+    """
+    Запустить итератор сразу, а не при отдаче первого байта ответа:
+    ошибка запроса должна случиться внутри view и стать обычным ответом
+    об ошибке, а не оборванным потоком.
+    """
+    iterator = iter(iterable)
+    for first in iterator:
+        return chain([first], iterator)
+    return iter(())
+
+
+def streaming_response(objects, renderer, to_representation, geometry_of=None):
+    """
+    StreamingHttpResponse в формате renderer: объекты сериализуются и
+    пишутся в ответ по одному, память не растёт с размером выборки.
+    geometry_of(obj) задаёт геометрию Feature, если её нет в поле location.
+    """
+    rows = (
+        (to_representation(obj), geometry_of(obj) if geometry_of else _FROM_ROW)
+        for obj in objects
+    )
+    chunks = _ndjson_chunks(rows) if renderer.format == 'ndjson' else _geojson_chunks(rows)
+    return StreamingHttpResponse(chunks, content_type=renderer.media_type)
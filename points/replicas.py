@@ -0,0 +1,110 @@
+"""
+Чтение с реплик: читающие action-ы PointViewSet и MessageViewSet (list,
+retrieve, search и другие из replica_actions) идут на один из псевдонимов
+POINTS_DB_REPLICAS, всё остальное — на default.
+
+Решение принимает view (ReplicaReadMixin), а не роутер: роутер видит
+только модель, но не знает, читающий ли это запрос. После собственной
+записи пользователь POINTS_DB_STICKY_SECONDS читает с default, чтобы
+видеть свои изменения (read-your-writes). Отметка хранится в Django
+cache: с общим бэкендом кэша она действует во всех воркерах.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+_read_alias = ContextVar('points_read_alias', default=None)
+
+_STICKY_PREFIX = 'points:db:sticky'
+
+
+def replicas():
+    return getattr(settings, 'POINTS_DB_REPLICAS', [])
+
+
+def _sticky_key(user):
+    return f'{_STICKY_PREFIX}:{user.pk}'
+
+
+def mark_sticky(user):
+    """Следующие POINTS_DB_STICKY_SECONDS секунд читать для user с default."""
+    if user.is_authenticated and replicas():
+        cache.set(_sticky_key(user), True, getattr(settings, 'POINTS_DB_STICKY_SECONDS', 5))
+
+
+def read_alias(user):
+    """Реплика для чтений user или None (default), если реплик нет или он недавно писал."""
+    aliases = replicas()
+    if not aliases or (user.is_authenticated and cache.get(_sticky_key(user))):
+        return None
+    return random.choice(aliases)
+
+
+@contextmanager
+def primary():
+    """
+    Чтения внутри блока — с default, даже если запрос читает с реплики.
+    Для результатов, которые сохраняются в общий кэш: отстающая реплика
+    записала бы старые строки под новой версией кэша.
+    """
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """Чтения — на реплику, выбранную для текущего запроса; запись и миграции — только default."""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        # Явно: иначе объект, прочитанный с реплики, сохранялся бы туда же
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии default
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    Для ViewSet: action-ы из replica_actions читают с реплики, успешная
+    запись другими action-ами включает read-your-writes для пользователя.
+    """
+
+    replica_actions = ('list', 'retrieve', 'search')
+
+    def dispatch(self, request, *args, **kwargs):
+        token = _read_alias.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        # После аутентификации и проверки прав: они читают с default
+        super().initial(request, *args, **kwargs)
+        if self.action in self.replica_actions:
+            _read_alias.set(read_alias(request.user))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        writes = request.method not in SAFE_METHODS and self.action not in self.replica_actions
+        if writes and response.status_code < 400:
+            mark_sticky(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,134 @@
+import hashlib
+from math import floor
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .geo import bounding_box
+from .replicas import primary
+
+# Уровни сетки версий (градусы ячейки). Круг поиска привязывается к самому
+# мелкому уровню, на котором он покрывает не больше _MAX_CELLS ячеек.
+_LEVELS = (0.1, 1.0, 10.0)
+_MAX_CELLS = 16
+
+_PREFIX = 'points:search'
+
+
+def _enabled():
+    return getattr(settings, 'POINTS_SEARCH_CACHE', False)
+
+
+def _cache():
+    return caches[getattr(settings, 'POINTS_SEARCH_CACHE_ALIAS', 'default')]
+
+
+def _quantize(value):
+    return round(value, getattr(settings, 'POINTS_SEARCH_CACHE_PRECISION', 4))
+
+
+def _cell(level, lat, lon):
+    return floor((lat + 90) / level), floor((lon + 180) / level)
+
+
+def _version_key(endpoint, level, row, col):
+    return f'{_PREFIX}:v:{endpoint}:{level}:{row}:{col}'
+
+
+def _global_key(endpoint):
+    return f'{_PREFIX}:v:{endpoint}:all'
+
+
+def _circle_version_keys(endpoint, lat, lon, radius):
+    """Ключи версий ячеек, которые задевает круг поиска, плюс общая версия endpoint."""
+    min_lat, max_lat, lon_ranges = bounding_box(lat, lon, radius)
+    for level in _LEVELS:
+        row_lo, _ = _cell(level, min_lat, 0)
+        row_hi, _ = _cell(level, max_lat, 0)
+        col_ranges = [(_cell(level, 0, lo)[1], _cell(level, 0, hi)[1]) for lo, hi in lon_ranges]
+        covered = (row_hi - row_lo + 1) * sum(hi - lo + 1 for lo, hi in col_ranges)
+        if covered <= _MAX_CELLS:
+            keys = [
+                _version_key(endpoint, level, row, col)
+                for row in range(row_lo, row_hi + 1)
+                for col_lo, col_hi in col_ranges
+                for col in range(col_lo, col_hi + 1)
+            ]
+            return [_global_key(endpoint), *keys]
+    # Очень большой круг: достаточно общей версии
+    return [_global_key(endpoint)]
+
+
+def cached_search(endpoint, lat, lon, radius, params, compute):
+    """
+    Результат поиска из кэша или compute(lat, lon).
+
+    Координаты центра округляются до POINTS_SEARCH_CACHE_PRECISION знаков,
+    и compute вызывается уже с округлёнными значениями, чтобы ответ
+    соответствовал ключу. Запись хранит версии ячеек сетки, которые задевает
+    круг: изменение точки в любой из них делает запись недействительной.
+    Версии читаются до выполнения запроса, поэтому запись, конкурирующая
+    с поиском, не оставит в кэше устаревший результат. Промах считается
+    на default: версии сбрасываются после коммита на нём, и реплика могла
+    ещё не получить изменение.
+    """
+    if not _enabled():
+        return compute(lat, lon)
+
+    lat, lon, radius = _quantize(lat), _quantize(lon), _quantize(radius)
+    raw = repr((endpoint, lat, lon, radius, params)).encode()
+    key = f'{_PREFIX}:r:{hashlib.md5(raw).hexdigest()}'
+    version_keys = _circle_version_keys(endpoint, lat, lon, radius)
+
+    cache = _cache()
+    entry, versions = read_versions(cache, key, version_keys)
+    if entry is not None and entry[0] == versions:
+        return entry[1]
+
+    with primary():
+        value = compute(lat, lon)
+    cache.set(key, (versions, value), getattr(settings, 'POINTS_SEARCH_CACHE_TTL', 300))
+    return value
+
+
+def read_versions(cache, key, version_keys):
+    """
+    (запись key или None, кортеж текущих версий version_keys).
+
+    Версия — случайный токен, а не счётчик: после вытеснения ключа версии
+    счётчик начался бы заново и совпал бы с версией старой записи.
+    Отсутствующая версия получает новый токен, так что любая запись,
+    сохранённая раньше, считается промахом.
+    """
+    found = cache.get_many([key, *version_keys])
+    missing = [k for k in version_keys if k not in found]
+    if missing:
+        for version_key in missing:
+            # add: конкурентные читатели сойдутся на одном токене
+            cache.add(version_key, uuid4().hex, timeout=None)
+        found.update(cache.get_many(missing))
+    return found.get(key), tuple(found.get(k) for k in version_keys)
+
+
+def _bump(cache, keys):
+    token = uuid4().hex
+    cache.set_many(dict.fromkeys(keys, token), timeout=None)
+
+
+def invalidate_location(endpoints, lat, lon):
+    """Сделать недействительными записи, чьи круги задевают ячейки с (lat, lon)."""
+    if not _enabled() or lat is None or lon is None:
+        return
+    _bump(_cache(), [
+        _version_key(endpoint, level, *_cell(level, lat, lon))
+        for endpoint in endpoints
+        for level in _LEVELS
+    ])
+
+
+def invalidate_all(endpoints):
+    """Сбросить весь кэш endpoint-ов, например после массовой загрузки."""
+    if not _enabled():
+        return
+    _bump(_cache(), [_global_key(endpoint) for endpoint in endpoints])
@@ -1,17 +1,90 @@
 from rest_framework import serializers
 from rest_framework_gis.fields import GeometryField
 from django.contrib.gis.geos import Point as GEOSPoint
-from .models import Point, Message
+from .instrumentation import TimedSerializerMixin
+from .models import Point, Message, Region
+from .regions import normalize
 
-class PointSerializer(serializers.ModelSerializer):
+POINT_FIELDS = ['id', 'user', 'name', 'description', 'latitude', 'longitude', 'location']
+STATS_FIELDS = ['message_count', 'last_message_at', 'last_message_id']
+
+
+def wants_stats(request):
+    """Клиент запросил агрегаты сообщений: ?include=stats."""
+    if request is None:
+        return False
+    include = request.query_params.get('include', '')
+    return 'stats' in include.split(',')
+
+
+def point_fields(request):
+    """
+    Поля точки в ответе: все или выбранные ?fields=id,name,... (в порядке
+    схемы). Агрегаты — только вместе с ?include=stats. Возвращает
+    (fields, error); error — текст ошибки для неизвестных полей.
+    """
+    available = POINT_FIELDS + STATS_FIELDS if wants_stats(request) else POINT_FIELDS
+    requested = request.query_params.get('fields') if request is not None else None
+    if not requested:
+        return list(available), None
+    names = {name.strip() for name in requested.split(',') if name.strip()}
+    unknown = names.difference(available)
+    if unknown or not names:
+        return None, f"Неизвестные поля: {', '.join(sorted(unknown))}. Доступны: {', '.join(available)}"
+    return [name for name in available if name in names], None
+
+
+class PointRowSerializer(TimedSerializerMixin, serializers.BaseSerializer):
+    """
+    Быстрая read-only сериализация точек из строк .values(): без экземпляров
+    модели, GEOS-геометрии и полей DRF на каждую строку. Схема ответа — как
+    у PointSerializer, location собирается из latitude/longitude (модель
+    держит их синхронными).
+    """
+
+    _datetime = serializers.DateTimeField()
+
+    def __init__(self, *args, fields=POINT_FIELDS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.output_fields = list(fields)
+
+    @staticmethod
+    def columns(fields):
+        """Аргументы .values() для набора полей; id нужен всегда — для порядка и курсора."""
+        columns = ['id', *(name for name in fields if name not in ('id', 'location'))]
+        if 'location' in fields:
+            columns.extend(name for name in ('latitude', 'longitude') if name not in columns)
+        return columns
+
+    def to_representation(self, row):
+        data = {}
+        for name in self.output_fields:
+            if name == 'location':
+                data[name] = {'type': 'Point', 'coordinates': [row['longitude'], row['latitude']]}
+            elif name == 'last_message_at':
+                value = row[name]
+                data[name] = None if value is None else self._datetime.to_representation(value)
+            else:
+                data[name] = row[name]
+        return data
+
+
+class PointSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     location = GeometryField(required=False, allow_null=True)
     latitude = serializers.FloatField(required=False, allow_null=True)
     longitude = serializers.FloatField(required=False, allow_null=True)
     
     class Meta:
         model = Point
-        fields = ['id', 'user', 'name', 'description', 'latitude', 'longitude', 'location']
-        read_only_fields = ['id', 'user']
+        fields = ['id', 'user', 'name', 'description', 'latitude', 'longitude', 'location', *STATS_FIELDS]
+        read_only_fields = ['id', 'user', *STATS_FIELDS]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Агрегаты сообщений отдаются только по ?include=stats
+        if not wants_stats(self.context.get('request')):
+            for name in STATS_FIELDS:
+                self.fields.pop(name)
 
     def validate_latitude(self, value):
         if value is not None and not (-90 <= value <= 90):
@@ -79,8 +152,22 @@ class PointSerializer(serializers.ModelSerializer):
         
         return super().update(instance, validated_data)
 
-class MessageSerializer(serializers.ModelSerializer):
+class MessageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Message
         fields = ['id', 'user', 'point', 'content', 'created_at']
-        read_only_fields = ['id', 'user', 'created_at']
\ No newline at end of file
+        read_only_fields = ['id', 'user', 'created_at']
+
+class RegionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    geometry = GeometryField()
+
+    class Meta:
+        model = Region
+        fields = ['id', 'user', 'name', 'geometry', 'updated_at']
+        read_only_fields = ['id', 'user', 'updated_at']
+
+    def validate_geometry(self, value):
+        try:
+            return normalize(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
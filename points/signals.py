@@ -0,0 +1,163 @@
+import threading
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import changelog
+from .authentication import token_cache
+from .models import ChangeLog, Message, Point, Region
+from .regions import evict
+from .search_cache import invalidate_location
+from .spatial_index import point_index
+from .stats import message_created, message_deleted
+from .tiles import invalidate_tiles
+
+# Изменение точки влияет и на поиск точек, и на поиск сообщений по ней.
+# Поиск точек с агрегатами (?include=stats) после сообщений сбрасывает
+# points.stats — когда агрегаты уже обновлены
+POINT_SEARCH_ENDPOINTS = ('points', 'points-stats', 'messages')
+MESSAGE_SEARCH_ENDPOINTS = ('messages',)
+
+# (using, pk) точек, удаляемых в этом потоке: pre_delete всех объектов
+# каскада приходит раньше post_delete их сообщений
+_deleting = threading.local()
+
+
+def _deleting_points():
+    if not hasattr(_deleting, 'points'):
+        _deleting.points = set()
+    return _deleting.points
+
+
+@receiver(pre_save, sender=Point)
+def remember_point_coords(sender, instance, **kwargs):
+    instance._previous_coords = None
+    if instance.pk is not None:
+        instance._previous_coords = (
+            Point.objects.filter(pk=instance.pk).values_list('latitude', 'longitude').first()
+        )
+
+
+@receiver(post_save, sender=Point)
+def index_point_on_save(sender, instance, **kwargs):
+    point_index.add(instance.pk, instance.latitude, instance.longitude)
+
+
+def _after_commit(using, func, *args):
+    """
+    Сбросить кэш после коммита. До него конкурирующий поиск прочитал бы
+    новые версии, посчитал по старым строкам и сохранил устаревший
+    результат под новой версией.
+    """
+    transaction.on_commit(lambda: func(*args), using=using)
+
+
+def _point_locations(instance):
+    previous = getattr(instance, '_previous_coords', None)
+    current = (instance.latitude, instance.longitude)
+    return [previous, current] if previous and previous != current else [current]
+
+
+@receiver(post_save, sender=Point)
+def invalidate_search_cache_on_point_save(sender, instance, using, **kwargs):
+    for lat, lon in _point_locations(instance):
+        _after_commit(using, invalidate_location, POINT_SEARCH_ENDPOINTS, lat, lon)
+
+
+@receiver(post_save, sender=Point)
+def invalidate_tiles_on_point_save(sender, instance, using, **kwargs):
+    for lat, lon in _point_locations(instance):
+        _after_commit(using, invalidate_tiles, lat, lon)
+
+
+@receiver(post_delete, sender=Point)
+def unindex_point_on_delete(sender, instance, **kwargs):
+    point_index.discard(instance.pk)
+
+
+@receiver(post_delete, sender=Point)
+def invalidate_search_cache_on_point_delete(sender, instance, using, **kwargs):
+    _after_commit(using, invalidate_location, POINT_SEARCH_ENDPOINTS, instance.latitude, instance.longitude)
+    _after_commit(using, invalidate_tiles, instance.latitude, instance.longitude)
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def invalidate_search_cache_on_message_change(sender, instance, using, **kwargs):
+    try:
+        point = instance.point
+    except Point.DoesNotExist:
+        # Каскадное удаление вместе с точкой: кэш сбросит сигнал точки
+        return
+    _after_commit(using, invalidate_location, MESSAGE_SEARCH_ENDPOINTS, point.latitude, point.longitude)
+
+
+@receiver(pre_delete, sender=Point)
+def remember_point_delete(sender, instance, using, **kwargs):
+    _deleting_points().add((using, instance.pk))
+
+
+@receiver(post_delete, sender=Point)
+def forget_point_delete(sender, instance, using, **kwargs):
+    _deleting_points().discard((using, instance.pk))
+
+
+@receiver(post_save, sender=Message)
+def count_created_message(sender, instance, created, using, raw=False, **kwargs):
+    # Агрегаты точки обновляются при любом создании: API, админка, ORM
+    if created and not raw:
+        message_created(instance, using)
+
+
+@receiver(post_delete, sender=Message)
+def count_deleted_message(sender, instance, using, **kwargs):
+    # Вместе с точкой удаляются и её агрегаты — пересчитывать нечего
+    if (using, instance.point_id) not in _deleting_points():
+        message_deleted(instance, using)
+
+
+@receiver(post_save, sender=Point)
+def log_point_save(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_coords', None)
+    coords = (instance.latitude, instance.longitude)
+    changelog.record(
+        ChangeLog.POINT, instance.pk, ChangeLog.UPSERT, coords,
+        previous=previous if previous and previous != coords else None,
+    )
+
+
+@receiver(post_delete, sender=Point)
+def log_point_delete(sender, instance, **kwargs):
+    changelog.record(ChangeLog.POINT, instance.pk, ChangeLog.DELETE, (instance.latitude, instance.longitude))
+
+
+@receiver(post_save, sender=Message)
+def log_message_save(sender, instance, **kwargs):
+    changelog.record(ChangeLog.MESSAGE, instance.pk, ChangeLog.UPSERT, changelog.message_coords(instance))
+
+
+@receiver(post_delete, sender=Message)
+def log_message_delete(sender, instance, **kwargs):
+    changelog.record(ChangeLog.MESSAGE, instance.pk, ChangeLog.DELETE, changelog.message_coords(instance))
+
+
+@receiver(post_save, sender=Region)
+@receiver(post_delete, sender=Region)
+def evict_compiled_region(sender, instance, **kwargs):
+    evict(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def evict_token_on_delete(sender, instance, **kwargs):
+    token_cache.evict(instance.key)
+
+
+@receiver(post_save, sender=User)
+def evict_user_tokens_on_save(sender, instance, **kwargs):
+    # Деактивация или смена прав: следующий запрос перечитает пользователя
+    if token_cache.enabled():
+        for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+            token_cache.evict(key)
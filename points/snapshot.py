@@ -0,0 +1,364 @@
+"""
+Снимок индекса точек в файле, общий для всех воркеров.
+
+Без снимка каждый воркер строит свой GridIndex из БД: память растёт
+кратно числу воркеров, и каждый платит за холодный старт. Команда
+export_point_snapshot выгружает id/lat/lon точек в компактный бинарный
+файл, отсортированный по ячейкам сетки; SnapshotIndex отображает его
+в память только для чтения (mmap), так что страницы файла в page cache
+делят все процессы.
+
+Изменения после выгрузки накладываются поверх снимка из журнала
+ChangeLog (курсор записан в заголовке файла) и локальных сигналов:
+изменённые и удалённые точки скрываются в снимке, актуальные
+координаты лежат в небольшом GridIndex-оверлее. Новый снимок
+подменяет старый атомарно (os.replace), воркеры замечают подмену по
+stat файла при очередном опросе.
+
+Формат (little-endian): заголовок _HEADER, затем массивы
+cell_keys[cells], cell_starts[cells + 1] (CSR: точки ячейки
+cell_keys[i] — позиции cell_starts[i]..cell_starts[i + 1]),
+ids[count], lat_r[count], lon_r[count], cos_lat[count].
+"""
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from math import ceil, floor
+
+import numpy as np
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .geo import bbox_lon_ranges, bounding_box, in_bbox, sort_within
+from .parallel import query_radius
+from .spatial_index import GridIndex
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'PTSNAP\x00\x00'
+VERSION = 1
+# magic, version, cell_deg, count, cells, changelog_id, created_at
+_HEADER = struct.Struct('<8sIdqqqd')
+_ALIGN = 8
+
+
+def _columns(cell_deg):
+    return ceil(360 / cell_deg) + 1
+
+
+def _cell_keys(lats, lons, cell_deg):
+    rows = np.floor((lats + 90) / cell_deg).astype(np.int64)
+    cols = np.floor((lons + 180) / cell_deg).astype(np.int64)
+    return rows * _columns(cell_deg) + cols
+
+
+def write_snapshot(path, rows, changelog_id, cell_deg):
+    """
+    Записать снимок из итерируемого (id, lat, lon) и вернуть число точек.
+    Файл пишется рядом с path и подменяет его одним os.replace: читатели
+    видят либо старый, либо новый снимок целиком.
+    """
+    data = np.fromiter(
+        (row for row in rows if row[1] is not None and row[2] is not None),
+        dtype=[('id', np.int64), ('lat', np.float64), ('lon', np.float64)],
+    )
+    keys = _cell_keys(data['lat'], data['lon'], cell_deg)
+    order = np.lexsort((data['id'], keys))
+    data, keys = data[order], keys[order]
+    cell_keys, cell_starts = np.unique(keys, return_index=True)
+    cell_starts = np.append(cell_starts, len(data)).astype(np.int64)
+    lat_r = np.radians(data['lat'])
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.points-snapshot-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, cell_deg, len(data), len(cell_keys), changelog_id, time.time()))
+            f.write(b'\0' * (-_HEADER.size % _ALIGN))
+            for array in (cell_keys, cell_starts, data['id'], lat_r, np.radians(data['lon']), np.cos(lat_r)):
+                f.write(np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<')).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return len(data)
+
+
+def export_snapshot(path, cell_deg):
+    """
+    Выгрузить точки из БД в снимок: (число точек, курсор журнала).
+
+    Курсор берётся до выборки точек, поэтому изменения между ними
+    попадут и в снимок, и в оверлей — повтор upsert безвреден.
+    """
+    from .changelog import settled_cursor
+    from .models import Point
+
+    changelog_id = settled_cursor()
+    rows = Point.objects.using(DEFAULT_DB_ALIAS).values_list('id', 'latitude', 'longitude').iterator(chunk_size=10000)
+    return write_snapshot(path, rows, changelog_id, cell_deg), changelog_id
+
+
+def _ranges(starts, ends):
+    """Конкатенация диапазонов [starts[i], ends[i]) одним массивом позиций."""
+    lengths = ends - starts
+    keep = lengths > 0
+    starts, lengths = starts[keep], lengths[keep]
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(len(offsets), dtype=np.int64)
+
+
+class Snapshot:
+    """Снимок, отображённый в память: массивы — read-only представления mmap."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+        self.stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if len(buffer) < _HEADER.size:
+            raise ValueError(f'{path}: файл короче заголовка снимка')
+        magic, version, self.cell_deg, count, cells, self.changelog_id, self.created_at = _HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path}: не снимок индекса точек версии {VERSION}')
+        expected = _HEADER.size + (-_HEADER.size % _ALIGN) + 8 * (2 * cells + 1 + 4 * count)
+        if len(buffer) != expected:
+            raise ValueError(f'{path}: размер {len(buffer)} байт, ожидалось {expected}')
+
+        offset = _HEADER.size + (-_HEADER.size % _ALIGN)
+        arrays = []
+        for dtype, length in (('<i8', cells), ('<i8', cells + 1), ('<i8', count),
+                              ('<f8', count), ('<f8', count), ('<f8', count)):
+            arrays.append(np.frombuffer(buffer, dtype=dtype, count=length, offset=offset))
+            offset += 8 * length
+        self.cell_keys, self.cell_starts, self.ids, self.lat_r, self.lon_r, self.cos_lat = arrays
+        self._columns = _columns(self.cell_deg)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def positions_in(self, min_lat, max_lat, lon_ranges):
+        """Позиции точек ячеек, задевающих прямоугольник; точная проверка — на стороне вызывающего."""
+        row_lo = floor((min_lat + 90) / self.cell_deg)
+        row_hi = floor((max_lat + 90) / self.cell_deg)
+        rows = np.arange(row_lo, row_hi + 1, dtype=np.int64) * self._columns
+        # Ячейки одной строки в диапазоне колонок — непрерывный отрезок ключей,
+        # а значит, и непрерывный отрезок позиций в отсортированных массивах
+        lo_keys, hi_keys = [], []
+        for lon_lo, lon_hi in lon_ranges:
+            lo_keys.append(rows + floor((lon_lo + 180) / self.cell_deg))
+            hi_keys.append(rows + floor((lon_hi + 180) / self.cell_deg) + 1)
+        first = np.searchsorted(self.cell_keys, np.concatenate(lo_keys))
+        last = np.searchsorted(self.cell_keys, np.concatenate(hi_keys))
+        return _ranges(self.cell_starts[first], self.cell_starts[last])
+
+
+class SnapshotIndex:
+    """
+    Индекс точек поверх снимка POINTS_INDEX_SNAPSHOT с тем же интерфейсом
+    запросов, что у GridIndex. Пока файла нет, работает как GridIndex,
+    построенный из БД, и подхватывает снимок, когда тот появится.
+    """
+
+    def __init__(self, path, cell_deg=0.1):
+        self.path = path
+        self.cell_deg = cell_deg
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._snapshot = None
+        self._stat = None
+        self._overlay = GridIndex(cell_deg)
+        self._hidden = set()
+        self._hidden_ids = None
+        self._cursor = 0
+        self._next_poll = 0.0
+        self._built = False
+        self.counters = {'reloads': 0, 'changes': 0}
+
+    @property
+    def built(self):
+        return self._built
+
+    def __len__(self):
+        with self._lock:
+            base = len(self._snapshot) if self._snapshot is not None else 0
+            if base and self._hidden:
+                base -= int(np.isin(self._snapshot.ids, self._hidden_array()).sum())
+            return base + len(self._overlay)
+
+    def _hidden_array(self):
+        # Массив для np.isin пересобирается при первом запросе после изменений
+        if self._hidden_ids is None:
+            self._hidden_ids = np.fromiter(self._hidden, dtype=np.int64, count=len(self._hidden))
+        return self._hidden_ids
+
+    def _hide(self, pk):
+        if pk not in self._hidden:
+            self._hidden.add(pk)
+            self._hidden_ids = None
+
+    def _stat_file(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def refresh(self):
+        """
+        Подхватить новый файл снимка и изменения из журнала. Опрос — не
+        чаще POINTS_INDEX_POLL_SECONDS; пока один поток опрашивает,
+        остальные отвечают по текущему состоянию.
+        """
+        if self._built and time.monotonic() < self._next_poll:
+            return
+        if not self._refresh_lock.acquire(blocking=not self._built):
+            return
+        try:
+            if self._built and time.monotonic() < self._next_poll:
+                return
+            stat = self._stat_file()
+            if not self._built or stat != self._stat:
+                self._load(stat)
+            else:
+                self._apply_changes()
+            self._next_poll = time.monotonic() + getattr(settings, 'POINTS_INDEX_POLL_SECONDS', 1.0)
+        finally:
+            self._refresh_lock.release()
+
+    def _load(self, stat):
+        from .changelog import settled_cursor
+        from .models import Point
+
+        overlay = GridIndex(self.cell_deg)
+        if stat is None:
+            logger.warning('Снимок индекса %s не найден: индекс строится из БД', self.path)
+            snapshot = None
+            cursor = settled_cursor()
+            overlay.build(Point.objects.using(DEFAULT_DB_ALIAS).values_list('id', 'latitude', 'longitude').iterator())
+        else:
+            snapshot = Snapshot(self.path)
+            stat, cursor = snapshot.stat, snapshot.changelog_id
+            overlay = GridIndex(snapshot.cell_deg)
+            overlay.build([])
+            logger.info('Снимок индекса %s: %d точек, журнал после id %d', self.path, len(snapshot), cursor)
+        with self._lock:
+            # Старый mmap закроется сборщиком, когда его массивы отпустят текущие запросы
+            self._snapshot, self._stat, self._overlay = snapshot, stat, overlay
+            self._hidden = set()
+            self._hidden_ids = None
+            self._cursor = cursor
+            self._built = True
+            self.counters['reloads'] += 1
+        self._apply_changes()
+
+    def _apply_changes(self):
+        """Наложить записи журнала точек после курсора (повтор безвреден)."""
+        from .changelog import replay_point_changes
+
+        cursor, applied = replay_point_changes(self._cursor, self.add, self.discard)
+        with self._lock:
+            self._cursor = cursor
+            self.counters['changes'] += applied
+
+    def _add(self, pk, lat, lon):
+        self._hide(pk)
+        self._overlay.add(pk, lat, lon)
+
+    def _discard(self, pk):
+        self._hide(pk)
+        self._overlay.discard(pk)
+
+    def add(self, pk, lat, lon):
+        with self._lock:
+            if self._built:
+                self._add(pk, lat, lon)
+
+    def discard(self, pk):
+        with self._lock:
+            if self._built:
+                self._discard(pk)
+
+    def reset(self):
+        # Массовая загрузка уже записала журнал: достаточно внеочередного опроса
+        self._next_poll = 0.0
+
+    def _visible(self, positions):
+        ids = self._snapshot.ids[positions]
+        if not self._hidden:
+            return positions, ids
+        keep = ~np.isin(ids, self._hidden_array())
+        return positions[keep], ids[keep]
+
+    def query_arrays(self, lat, lon, radius_km, limit=None, after=None):
+        """Массивы (ids, distances_km) в радиусе, отсортированные по (расстояние, id) — как GridIndex."""
+        with self._lock:
+            snapshot, overlay = self._snapshot, self._overlay
+            ids, distances = overlay.query_arrays(lat, lon, radius_km, limit=limit, after=after)
+            if snapshot is None:
+                return ids, distances
+            positions, base_ids = self._visible(snapshot.positions_in(*bounding_box(lat, lon, radius_km)))
+        base_ids, base_distances = query_radius(
+            lat, lon, radius_km, base_ids,
+            snapshot.lat_r[positions], snapshot.lon_r[positions], snapshot.cos_lat[positions],
+            limit=limit, after=after,
+        )
+        ids = np.concatenate((base_ids, ids))
+        distances = np.concatenate((base_distances, distances))
+        positions = sort_within(distances, ids, radius_km, limit=limit, after=after)
+        return ids[positions], distances[positions]
+
+    def bbox_arrays(self, bbox):
+        """Массивы (ids, lats, lons) в градусах для точек внутри bbox — как GridIndex."""
+        min_lon, min_lat, max_lon, max_lat = bbox
+        with self._lock:
+            snapshot, overlay = self._snapshot, self._overlay
+            ids, lats, lons = overlay.bbox_arrays(bbox)
+            if snapshot is None:
+                return ids, lats, lons
+            positions, base_ids = self._visible(
+                snapshot.positions_in(min_lat, max_lat, bbox_lon_ranges(min_lon, max_lon)),
+            )
+        base_lats = np.degrees(snapshot.lat_r[positions])
+        base_lons = np.degrees(snapshot.lon_r[positions])
+        mask = in_bbox(base_lats, base_lons, bbox)
+        return (
+            np.concatenate((base_ids[mask], ids)),
+            np.concatenate((base_lats[mask], lats)),
+            np.concatenate((base_lons[mask], lons)),
+        )
+
+    def query(self, lat, lon, radius_km):
+        """Список (distance_km, id) в радиусе, отсортированный по расстоянию."""
+        ids, distances = self.query_arrays(lat, lon, radius_km)
+        return list(zip(distances.tolist(), ids.tolist()))
+
+    def collect(self):
+        """Семейства метрик для /api/metrics/."""
+        with self._lock:
+            snapshot = self._snapshot
+            base = len(snapshot) if snapshot is not None else 0
+            overlay, hidden, counters = len(self._overlay), len(self._hidden), dict(self.counters)
+        families = [
+            ('points_index_snapshot_points', 'gauge', 'Точки индекса: в снимке, в оверлее, изменённые после снимка.', [
+                f'points_index_snapshot_points{{part="snapshot"}} {base}',
+                f'points_index_snapshot_points{{part="overlay"}} {overlay}',
+                f'points_index_snapshot_points{{part="hidden"}} {hidden}',
+            ]),
+            ('points_index_snapshot_events_total', 'counter', 'Загрузки снимка и наложенные записи журнала.', [
+                f'points_index_snapshot_events_total{{event="{event}"}} {count}' for event, count in counters.items()
+            ]),
+        ]
+        if snapshot is not None:
+            families.append(('points_index_snapshot_age_seconds', 'gauge', 'Возраст загруженного снимка.', [
+                f'points_index_snapshot_age_seconds {time.time() - snapshot.created_at:.1f}',
+            ]))
+        return families
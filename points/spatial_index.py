@@ -0,0 +1,266 @@
+import threading
+import time
+from collections import defaultdict
+from itertools import chain
+from math import floor, radians
+
+import numpy as np
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .geo import bbox_lon_ranges, bounding_box, in_bbox
+from .parallel import query_radius
+
+
+class GridIndex:
+    """
+    In-process пространственный индекс: сетка ячеек по lat/lon.
+
+    Используется fallback-поиском вместо полного перебора таблицы.
+    Координаты лежат в непрерывных float64-массивах (в радианах, вместе с
+    предвычисленным cos широты), ячейки сетки хранят номера слотов в этих
+    массивах. Расстояния до кандидатов считаются одним векторным проходом.
+    """
+
+    def __init__(self, cell_deg=0.1):
+        self.cell_deg = cell_deg
+        self._lock = threading.RLock()
+        self._clear()
+        self._built = False
+        # Изменения, пришедшие во время build: применяются поверх прочитанных строк
+        self._pending = None
+
+    @property
+    def built(self):
+        return self._built
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _clear(self, capacity=0):
+        self._ids = np.full(capacity, -1, dtype=np.int64)
+        self._lat_r = np.zeros(capacity, dtype=np.float64)
+        self._lon_r = np.zeros(capacity, dtype=np.float64)
+        self._cos_lat = np.zeros(capacity, dtype=np.float64)
+        self._size = 0
+        self._free = []
+        self._slots = {}
+        self._cell_of = {}
+        self._cells = defaultdict(set)
+
+    def _cell(self, lat, lon):
+        return floor((lat + 90) / self.cell_deg), floor((lon + 180) / self.cell_deg)
+
+    def _grow(self):
+        capacity = max(1024, len(self._ids) * 2)
+        for name, fill in (('_ids', -1), ('_lat_r', 0.0), ('_lon_r', 0.0), ('_cos_lat', 0.0)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _add(self, pk, lat, lon):
+        self._discard(pk)
+        if self._free:
+            slot = self._free.pop()
+        else:
+            if self._size == len(self._ids):
+                self._grow()
+            slot = self._size
+            self._size += 1
+        lat_r = radians(lat)
+        self._ids[slot] = pk
+        self._lat_r[slot] = lat_r
+        self._lon_r[slot] = radians(lon)
+        self._cos_lat[slot] = np.cos(lat_r)
+        cell = self._cell(lat, lon)
+        self._slots[pk] = slot
+        self._cell_of[slot] = cell
+        self._cells[cell].add(slot)
+
+    def _discard(self, pk):
+        slot = self._slots.pop(pk, None)
+        if slot is None:
+            return
+        self._ids[slot] = -1
+        self._free.append(slot)
+        cell = self._cell_of.pop(slot)
+        bucket = self._cells[cell]
+        bucket.discard(slot)
+        if not bucket:
+            del self._cells[cell]
+
+    def build(self, rows):
+        """
+        Полностью перестроить индекс из итерируемого (id, lat, lon).
+
+        Чтение rows идёт без блокировки; add и discard, вызванные в это
+        время, запоминаются и применяются к построенному индексу, а не
+        теряются.
+        """
+        with self._lock:
+            self._pending = []
+        data = np.array(
+            [row for row in rows if row[1] is not None and row[2] is not None],
+            dtype=np.float64,
+        ).reshape(-1, 3)
+        with self._lock:
+            self._clear()
+            count = len(data)
+            self._ids = data[:, 0].astype(np.int64)
+            lats, lons = data[:, 1], data[:, 2]
+            self._lat_r = np.radians(lats)
+            self._lon_r = np.radians(lons)
+            self._cos_lat = np.cos(self._lat_r)
+            self._size = count
+            self._slots = dict(zip(self._ids.tolist(), range(count)))
+
+            rows_ = np.floor((lats + 90) / self.cell_deg).astype(np.int64).tolist()
+            cols_ = np.floor((lons + 180) / self.cell_deg).astype(np.int64).tolist()
+            for slot, cell in enumerate(zip(rows_, cols_)):
+                self._cell_of[slot] = cell
+                self._cells[cell].add(slot)
+            pending, self._pending = self._pending or [], None
+            for pk, lat, lon in pending:
+                self._apply(pk, lat, lon)
+            self._built = True
+
+    def reset(self):
+        with self._lock:
+            self._clear()
+            self._built = False
+
+    def _apply(self, pk, lat, lon):
+        if lat is None or lon is None:
+            self._discard(pk)
+        else:
+            self._add(pk, lat, lon)
+
+    def add(self, pk, lat, lon):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((pk, lat, lon))
+            if self._built:
+                self._apply(pk, lat, lon)
+
+    def discard(self, pk):
+        self.add(pk, None, None)
+
+    def _candidate_slots(self, lat, lon, radius_km):
+        return self._slots_in(*bounding_box(lat, lon, radius_km))
+
+    def _slots_in(self, min_lat, max_lat, lon_ranges):
+        """Слоты ячеек, задевающих прямоугольник; точная проверка — на стороне вызывающего."""
+        row_lo, _ = self._cell(min_lat, 0)
+        row_hi, _ = self._cell(max_lat, 0)
+        col_ranges = [
+            (self._cell(0, lo)[1], self._cell(0, hi)[1])
+            for lo, hi in lon_ranges
+        ]
+        covered = (row_hi - row_lo + 1) * sum(hi - lo + 1 for lo, hi in col_ranges)
+
+        # Круг покрывает больше ячеек, чем непустых в индексе: дешевле
+        # векторно посчитать расстояния до всех живых слотов
+        if covered > len(self._cells):
+            return np.flatnonzero(self._ids[:self._size] >= 0)
+
+        buckets = []
+        for row in range(row_lo, row_hi + 1):
+            for col_lo, col_hi in col_ranges:
+                for col in range(col_lo, col_hi + 1):
+                    bucket = self._cells.get((row, col))
+                    if bucket:
+                        buckets.append(bucket)
+        count = sum(len(bucket) for bucket in buckets)
+        return np.fromiter(chain.from_iterable(buckets), dtype=np.int64, count=count)
+
+    def query_arrays(self, lat, lon, radius_km, limit=None, after=None):
+        """
+        Массивы (ids, distances_km) в радиусе, отсортированные по (расстояние, id).
+
+        limit и after=(distance_km, id) — см. geo.sort_within.
+        """
+        with self._lock:
+            slots = self._candidate_slots(lat, lon, radius_km)
+            ids, lats_r, lons_r, cos_lats = (
+                self._ids[slots], self._lat_r[slots], self._lon_r[slots], self._cos_lat[slots],
+            )
+        return query_radius(lat, lon, radius_km, ids, lats_r, lons_r, cos_lats, limit=limit, after=after)
+
+    def bbox_arrays(self, bbox):
+        """Массивы (ids, lats, lons) в градусах для точек внутри bbox (min_lon, min_lat, max_lon, max_lat)."""
+        min_lon, min_lat, max_lon, max_lat = bbox
+        with self._lock:
+            slots = self._slots_in(min_lat, max_lat, bbox_lon_ranges(min_lon, max_lon))
+            ids = self._ids[slots]
+            lats = np.degrees(self._lat_r[slots])
+            lons = np.degrees(self._lon_r[slots])
+        mask = in_bbox(lats, lons, bbox)
+        return ids[mask], lats[mask], lons[mask]
+
+    def query(self, lat, lon, radius_km):
+        """Список (distance_km, id) в радиусе, отсортированный по расстоянию."""
+        ids, distances = self.query_arrays(lat, lon, radius_km)
+        return list(zip(distances.tolist(), ids.tolist()))
+
+
+class SyncedGridIndex(GridIndex):
+    """
+    GridIndex процесса, который догоняет изменения других воркеров.
+
+    Сигналы обновляют индекс только в процессе, обработавшем запись. Поэтому
+    после построения из БД индекс не чаще раза в POINTS_INDEX_POLL_SECONDS
+    применяет записи журнала ChangeLog после курсора, взятого до выборки
+    точек. Так же подхватываются изменения, закоммиченные уже после того,
+    как выборка прочитала строку.
+    """
+
+    def __init__(self, cell_deg=0.1):
+        super().__init__(cell_deg)
+        self._refresh_lock = threading.Lock()
+        self._cursor = 0
+        self._next_poll = 0.0
+
+    def refresh(self):
+        """Построить индекс при первом обращении, затем применять журнал; пока один поток опрашивает, остальные не ждут."""
+        if self._built and time.monotonic() < self._next_poll:
+            return
+        if not self._refresh_lock.acquire(blocking=not self._built):
+            return
+        try:
+            if self._built and time.monotonic() < self._next_poll:
+                return
+            from .changelog import replay_point_changes, settled_cursor
+
+            if not self._built:
+                from .models import Point
+
+                self._cursor = settled_cursor()
+                self.build(Point.objects.using(DEFAULT_DB_ALIAS).values_list('id', 'latitude', 'longitude').iterator())
+            self._cursor, _ = replay_point_changes(self._cursor, self.add, self.discard)
+            self._next_poll = time.monotonic() + getattr(settings, 'POINTS_INDEX_POLL_SECONDS', 1.0)
+        finally:
+            self._refresh_lock.release()
+
+
+def _create_point_index():
+    """SyncedGridIndex процесса или, при POINTS_INDEX_SNAPSHOT, индекс поверх общего снимка (points.snapshot)."""
+    cell_deg = getattr(settings, 'POINTS_INDEX_CELL_DEG', 0.1)
+    path = getattr(settings, 'POINTS_INDEX_SNAPSHOT', '')
+    if not path:
+        return SyncedGridIndex(cell_deg=cell_deg)
+    from .instrumentation import registry
+    from .snapshot import SnapshotIndex
+
+    index = SnapshotIndex(path, cell_deg=cell_deg)
+    registry.add_collector(index.collect)
+    return index
+
+
+point_index = _create_point_index()
+
+
+def get_point_index():
+    """Индекс точек: построенный из БД или загруженный из снимка, с изменениями из журнала."""
+    point_index.refresh()
+    return point_index
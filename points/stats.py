@@ -0,0 +1,63 @@
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import Point
+from .search_cache import invalidate_location
+
+# Поиск точек с агрегатами (?include=stats)
+STATS_ENDPOINTS = ('points-stats',)
+
+
+def _lock_point(point_id, using):
+    # Блокировка строки точки сериализует конкурирующие обновления агрегатов.
+    # FOR NO KEY UPDATE: вставка сообщения уже держит на точке FOR KEY SHARE
+    # (проверка FK), с которым FOR UPDATE конфликтует — две одновременные
+    # вставки в одну точку ждали бы друг друга
+    no_key = connections[using].features.has_select_for_no_key_update
+    return (
+        Point.objects.using(using)
+        .select_for_update(no_key=no_key)
+        .only('id', 'latitude', 'longitude', 'last_message_at', 'last_message_id')
+        .filter(pk=point_id)
+        .first()
+    )
+
+
+def _invalidate_after_commit(point, using):
+    # Только после коммита обновлённых агрегатов: иначе поиск ?include=stats
+    # закэширует старые значения под новой версией
+    transaction.on_commit(
+        lambda: invalidate_location(STATS_ENDPOINTS, point.latitude, point.longitude), using=using,
+    )
+
+
+def message_created(message, using='default'):
+    """Учесть новое сообщение в агрегатах его точки (post_save, см. points.signals)."""
+    with transaction.atomic(using=using):
+        point = _lock_point(message.point_id, using)
+        if point is None:
+            return
+        update = {'message_count': F('message_count') + 1}
+        if point.last_message_at is None or (message.created_at, message.pk) > (point.last_message_at, point.last_message_id):
+            update.update(last_message_at=message.created_at, last_message_id=message.pk)
+        Point.objects.using(using).filter(pk=point.pk).update(**update)
+        _invalidate_after_commit(point, using)
+
+
+def message_deleted(message, using='default'):
+    """Пересчитать агрегаты точки удалённого сообщения (post_delete, см. points.signals)."""
+    with transaction.atomic(using=using):
+        point = _lock_point(message.point_id, using)
+        if point is None:
+            return
+        update = {'message_count': Greatest(F('message_count') - 1, 0)}
+        if point.last_message_id == message.pk:
+            latest = (
+                point.messages.using(using).order_by('-created_at', '-id')
+                .values_list('id', 'created_at')
+                .first()
+            )
+            update['last_message_id'], update['last_message_at'] = latest or (None, None)
+        Point.objects.using(using).filter(pk=point.pk).update(**update)
+        _invalidate_after_commit(point, using)
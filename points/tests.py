@@ -1,10 +1,41 @@
+import asyncio
+import json
+import os
+import tempfile
+from datetime import timedelta
+from types import SimpleNamespace
+
+import numpy as np
 from django.contrib.auth.models import User
-from django.test import TestCase
-from django.urls import reverse
-from rest_framework import status
-from rest_framework.test import APITestCase
+from django.contrib.gis.geos import Point as GEOSPoint
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+from rest_framework import status, viewsets
+from rest_framework.authtoken.models import Token
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, APITestCase, force_authenticate
 
+from . import engines
+from .authentication import TokenCache, token_cache
+from .geo import (
+    bbox_center, bbox_lon_ranges, bbox_radius_km, bounding_box, distances_km, grid_clusters, haversine_km,
+    sort_within, within_radius,
+)
+from .ingest import ingest_points, iter_ndjson, validate_record
+from .instrumentation import Registry, RequestStats, registry
 from .models import Message, Point
+from .parallel import _get_pool, merge, reset as reset_pool
+from .realtime import Hub, Subscription, SubscriptionIndex, format_sse, hub
+from .regions import CompiledRegion, parse_geometry
+from .replicas import ReplicaReadMixin, ReplicaRouter
+from .search_cache import _circle_version_keys, cached_search, invalidate_location
+from .serializers import PointRowSerializer, PointSerializer
+from .snapshot import Snapshot, SnapshotIndex, export_snapshot, write_snapshot
+from .spatial_index import GridIndex, SyncedGridIndex
+from .tiles import encode_tile, tile_bbox, tile_xy, tiles_containing
 
 
 class PointModelTest(TestCase):
@@ -30,6 +61,7 @@ class MessageModelTest(TestCase):
 
 class PointAPITest(APITestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username='testuser', password='testpass')
         self.client.force_authenticate(user=self.user)
 
@@ -40,6 +72,34 @@ class PointAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(Point.objects.count(), 1)
 
+    def test_bulk_create_points_ndjson(self):
+        url = reverse('points-bulk')
+        body = '\n'.join([
+            '{"name": "A", "latitude": 1, "longitude": 2}',
+            '{"name": "B", "location": {"type": "Point", "coordinates": [3, 4]}}',
+            '{"name": "Bad", "latitude": 100, "longitude": 0}',
+            'not json',
+        ])
+        response = self.client.post(url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([e['line'] for e in response.data['errors']], [3, 4])
+        point = Point.objects.get(name='B')
+        self.assertEqual((point.latitude, point.longitude), (4, 3))
+        self.assertEqual(point.location.coords, (3, 4))
+
+    def test_bulk_create_points_geojson(self):
+        url = reverse('points-bulk')
+        data = {
+            'type': 'FeatureCollection',
+            'features': [
+                {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [30.31, 59.93]}, 'properties': {'name': 'SPb'}},
+            ],
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Point.objects.get().name, 'SPb')
+
     def test_search_points(self):
         Point.objects.create(user=self.user, name='Nearby', description='', latitude=0, longitude=0)
         url = reverse('points-search') + '?latitude=0&longitude=0&radius=5'
@@ -47,9 +107,175 @@ class PointAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
 
+    @override_settings(POINTS_SPATIAL_INDEX=False)
+    def test_search_points_bounding_box_fallback(self):
+        Point.objects.create(user=self.user, name='Near', description='', latitude=0, longitude=0.01)
+        Point.objects.create(user=self.user, name='Nearest', description='', latitude=0, longitude=0)
+        Point.objects.create(user=self.user, name='Far', description='', latitude=1, longitude=1)
+        url = reverse('points-search') + '?latitude=0&longitude=0&radius=5'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['name'] for p in response.data], ['Nearest', 'Near'])
+
+    def test_search_points_cursor_pagination(self):
+        for i in range(5):
+            Point.objects.create(user=self.user, name=f'P{i}', description='', latitude=0, longitude=i * 0.001)
+        url = reverse('points-search') + '?latitude=0&longitude=0&radius=5&limit=2'
+        names = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data), 2)
+            names.extend(p['name'] for p in response.data)
+            cursor = response.get('X-Next-Cursor')
+            url = f'{url.split("&cursor=")[0]}&cursor={cursor}' if cursor else None
+        self.assertEqual(names, ['P0', 'P1', 'P2', 'P3', 'P4'])
+
+    def test_search_points_ndjson_stream(self):
+        Point.objects.create(user=self.user, name='A', description='', latitude=0, longitude=0)
+        Point.objects.create(user=self.user, name='B', description='', latitude=0, longitude=0.01)
+        url = reverse('points-search') + '?latitude=0&longitude=0&radius=5&format=ndjson'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['name'] for line in lines], ['A', 'B'])
+
+    def test_search_points_geojson_stream(self):
+        Point.objects.create(user=self.user, name='A', description='', latitude=1, longitude=2)
+        url = reverse('points-search') + '?latitude=1&longitude=2&radius=5&format=geojson'
+        response = self.client.get(url)
+        collection = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(collection['type'], 'FeatureCollection')
+        feature = collection['features'][0]
+        self.assertEqual(feature['geometry']['coordinates'], [2, 1])
+        self.assertEqual(feature['properties']['name'], 'A')
+
+    @override_settings(POINTS_SEARCH_CACHE=True)
+    def test_search_cache_invalidated_by_nearby_point(self):
+        Point.objects.create(user=self.user, name='A', description='', latitude=0, longitude=0)
+        url = reverse('points-search') + '?latitude=0&longitude=0&radius=5'
+        self.assertEqual(len(self.client.get(url).data), 1)
+        # Кэш сбрасывается после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            Point.objects.create(user=self.user, name='B', description='', latitude=0, longitude=0.01)
+        self.assertEqual(len(self.client.get(url).data), 2)
+
+    def test_points_within_bbox(self):
+        for name, lat, lon in [('East', 0, 179.5), ('West', 0.5, -179.8), ('Far', 0, 170), ('North', 5, 179.9)]:
+            Point.objects.create(user=self.user, name=name, description='', latitude=lat, longitude=lon)
+        url = reverse('points-within')
+        response = self.client.get(url, {'bbox': '179,-1,-179,1'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['name'] for p in response.data], ['East', 'West'])
+
+        first = self.client.get(url, {'bbox': '179,-1,-179,1', 'limit': 1})
+        second = self.client.get(url, {'bbox': '179,-1,-179,1', 'limit': 1, 'cursor': first['X-Next-Cursor']})
+        self.assertEqual([p['name'] for p in second.data], ['West'])
+        self.assertEqual(self.client.get(url, {'bbox': '1,2,3'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_points_inside_region(self):
+        inside = Point.objects.create(user=self.user, name='In', description='', latitude=0.5, longitude=0.5)
+        Point.objects.create(user=self.user, name='Out', description='', latitude=0.5, longitude=1.5)
+        polygon = {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}
+        url = reverse('points-inside')
+        response = self.client.post(url, polygon, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['id'] for p in response.data], [inside.id])
+
+        created = self.client.post(reverse('regions-list'), {'name': 'square', 'geometry': polygon}, format='json')
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([p['id'] for p in self.client.get(url, {'region': 'square'}).data], [inside.id])
+        self.assertEqual(self.client.get(url, {'region': 'missing'}).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_point_clusters(self):
+        for lat, lon in [(0, 0), (0.01, 0.01), (0.02, 0), (10, 10)]:
+            Point.objects.create(user=self.user, name='P', description='', latitude=lat, longitude=lon)
+        url = reverse('points-clusters')
+        response = self.client.get(url, {'bbox': '-20,-20,20,20', 'zoom': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([c['count'] for c in response.data], [3, 1])
+        self.assertAlmostEqual(response.data[0]['latitude'], 0.01)
+        self.assertEqual(self.client.get(url, {'bbox': '-180,-90,180,90', 'zoom': 20}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(POINTS_TILE_CACHE=True)
+    def test_point_tiles(self):
+        Point.objects.create(user=self.user, name='Центр', description='', latitude=0.001, longitude=0.001)
+        url = reverse('points-tiles', args=[1, 1, 0])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+        self.assertIn('Центр'.encode(), response.content)
+        self.assertNotIn('Центр'.encode(), self.client.get(reverse('points-tiles', args=[2, 0, 0])).content)
+
+        response = self.client.get(url, HTTP_ACCEPT='application/vnd.mapbox-vector-tile')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Центр'.encode(), response.content)
+
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        with self.captureOnCommitCallbacks(execute=True):
+            Point.objects.create(user=self.user, name='Новая', description='', latitude=10, longitude=10)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Новая'.encode(), response.content)
+        self.assertEqual(self.client.get(reverse('points-tiles', args=[1, 2, 0])).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_nearest_points(self):
+        Point.objects.create(user=self.user, name='Far', description='', latitude=10, longitude=10)
+        Point.objects.create(user=self.user, name='Near', description='', latitude=0, longitude=0.5)
+        Point.objects.create(user=self.user, name='Nearest', description='', latitude=0, longitude=0)
+        url = reverse('points-nearest') + '?latitude=0&longitude=0&k=2'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['name'] for p in response.data], ['Nearest', 'Near'])
+
+    def test_server_timing_and_metrics(self):
+        registry.reset()
+        Point.objects.create(user=self.user, name='Nearby', description='', latitude=0, longitude=0)
+        response = self.client.get(reverse('points-search') + '?latitude=0&longitude=0&radius=5')
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="SQL x[1-9]\d*", ser;dur=[\d.]+, total;dur=')
+
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        metrics = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('points_db_queries_total{view="points-search",action="search",method="GET",status="200"}', metrics)
+
+    def test_search_points_limit_validation(self):
+        url = reverse('points-search') + '?latitude=0&longitude=0&radius=5&limit=100000'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_points_matches_model_serializer(self):
+        Point.objects.create(user=self.user, name='Nearby', description='', latitude=0, longitude=0)
+        response = self.client.get(reverse('points-list') + '?include=stats')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = PointSerializer(Point.objects.all(), many=True, context={'request': response.wsgi_request}).data
+        self.assertEqual(json.loads(response.content), json.loads(json.dumps(expected)))
+
+    def test_search_points_fields(self):
+        point = Point.objects.create(user=self.user, name='Nearby', description='', latitude=0, longitude=0)
+        url = reverse('points-search') + '?latitude=0&longitude=0&radius=5'
+        response = self.client.get(url + '&fields=name,id')
+        self.assertEqual(response.data, [{'id': point.id, 'name': point.name}])
+        response = self.client.get(url + '&fields=id,message_count')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_points_include_stats(self):
+        point = Point.objects.create(user=self.user, name='Nearby', description='', latitude=0, longitude=0)
+        self.client.post(reverse('messages-list'), {'point': point.id, 'content': 'Hi'}, format='json')
+        url = reverse('points-search') + '?latitude=0&longitude=0&radius=5'
+        self.assertNotIn('message_count', self.client.get(url).data[0])
+        data = self.client.get(url + '&include=stats').data[0]
+        self.assertEqual(data['message_count'], 1)
+        self.assertIsNotNone(data['last_message_at'])
+
 
 class MessageAPITest(APITestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username='testuser', password='testpass')
         self.point = Point.objects.create(user=self.user, name='Test Point', description='', latitude=0, longitude=0)
         self.client.force_authenticate(user=self.user)
@@ -61,9 +287,723 @@ class MessageAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(Message.objects.count(), 1)
 
+    def test_message_stats_maintained(self):
+        url = reverse('messages-list')
+        first = self.client.post(url, {'point': self.point.id, 'content': 'One'}, format='json').data
+        second = self.client.post(url, {'point': self.point.id, 'content': 'Two'}, format='json').data
+        self.point.refresh_from_db()
+        self.assertEqual(self.point.message_count, 2)
+        self.assertEqual(self.point.last_message_id, second['id'])
+
+        response = self.client.delete(reverse('messages-detail', args=[second['id']]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.point.refresh_from_db()
+        self.assertEqual(self.point.message_count, 1)
+        self.assertEqual(self.point.last_message_id, first['id'])
+
+    def test_message_stats_maintained_outside_api(self):
+        other = User.objects.create_user(username='other', password='testpass')
+        own = Message.objects.create(user=self.user, point=self.point, content='Own')
+        foreign = Message.objects.create(user=other, point=self.point, content='Foreign')
+        self.point.refresh_from_db()
+        self.assertEqual((self.point.message_count, self.point.last_message_id), (2, foreign.id))
+
+        # Каскад от пользователя: его точки удаляются, сообщения на чужих — пересчитываются
+        other_point = Point.objects.create(user=other, name='Other', description='', latitude=1, longitude=1)
+        Message.objects.create(user=other, point=other_point, content='Gone')
+        other.delete()
+        self.point.refresh_from_db()
+        self.assertEqual((self.point.message_count, self.point.last_message_id), (1, own.id))
+
+        own.delete()
+        self.point.refresh_from_db()
+        self.assertEqual((self.point.message_count, self.point.last_message_id, self.point.last_message_at), (0, None, None))
+
+    def test_delete_foreign_message_forbidden(self):
+        other = User.objects.create_user(username='other', password='testpass')
+        message = Message.objects.create(user=other, point=self.point, content='Hi')
+        response = self.client.delete(reverse('messages-detail', args=[message.id]))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertTrue(Message.objects.filter(pk=message.pk).exists())
+
+    def test_created_message_pushed_to_nearby_subscribers(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        near = hub.subscribe(0.01, 0, 5, loop)
+        far = hub.subscribe(10, 10, 5, loop)
+        self.addCleanup(hub.unsubscribe, near)
+        self.addCleanup(hub.unsubscribe, far)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('messages-list'), {'point': self.point.id, 'content': 'Hi'}, format='json')
+        loop.run_until_complete(asyncio.sleep(0))
+        event = near.queue.get_nowait()
+        self.assertEqual(event['data']['id'], response.data['id'])
+        self.assertEqual(event['data']['content'], 'Hi')
+        self.assertTrue(far.queue.empty())
+
     def test_search_messages(self):
         Message.objects.create(user=self.user, point=self.point, content='Hi')
         url = reverse('messages-search') + '?latitude=0&longitude=0&radius=5'
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
+
+    def test_list_messages_recent_window(self):
+        older = Message.objects.create(user=self.user, point=self.point, content='Old')
+        Message.objects.filter(pk=older.pk).update(created_at=timezone.now() - timedelta(days=2))
+        first = Message.objects.create(user=self.user, point=self.point, content='One')
+        second = Message.objects.create(user=self.user, point=self.point, content='Two')
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+
+        url = reverse('messages-list')
+        response = self.client.get(url, {'since': since, 'limit': 1})
+        self.assertEqual([m['id'] for m in response.data], [second.id])
+        response = self.client.get(url, {'since': since, 'limit': 1, 'cursor': response['X-Next-Cursor']})
+        self.assertEqual([m['id'] for m in response.data], [first.id])
+        self.assertNotIn('X-Next-Cursor', response)
+        self.assertEqual(self.client.get(url, {'since': 'вчера'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_messages_recent(self):
+        far_point = Point.objects.create(user=self.user, name='Far', description='', latitude=1, longitude=1)
+        here = Message.objects.create(user=self.user, point=self.point, content='Here')
+        Message.objects.create(user=self.user, point=far_point, content='Far')
+        newest = Message.objects.create(user=self.user, point=self.point, content='Newest')
+        url = reverse('messages-search')
+        params = {'latitude': 0, 'longitude': 0, 'radius': 5, 'order': 'recent', 'since': here.created_at.isoformat()}
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m['id'] for m in response.data], [newest.id, here.id])
+
+    def test_messages_inside_region(self):
+        message = Message.objects.create(user=self.user, point=self.point, content='Hi')
+        polygon = {'type': 'Polygon', 'coordinates': [[[-1, -1], [1, -1], [1, 1], [-1, 1], [-1, -1]]]}
+        response = self.client.post(reverse('messages-inside'), polygon, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m['id'] for m in response.data], [message.id])
+
+    def test_nearest_messages(self):
+        far_point = Point.objects.create(user=self.user, name='Far', description='', latitude=20, longitude=20)
+        Message.objects.create(user=self.user, point=far_point, content='Far')
+        Message.objects.create(user=self.user, point=self.point, content='Here')
+        url = reverse('messages-nearest') + '?latitude=0&longitude=0&k=1'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m['content'] for m in response.data], ['Here'])
+
+
+class AsyncViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        Point.objects.create(user=self.user, name='Nearby', description='', latitude=0, longitude=0)
+
+    async def test_async_search_requires_token(self):
+        response = await self.async_client.get(reverse('async-points-search') + '?latitude=0&longitude=0&radius=5')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_async_search_points(self):
+        response = await self.async_client.get(
+            reverse('async-points-search') + '?latitude=0&longitude=0&radius=5',
+            headers={'Authorization': f'Token {self.token.key}'},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['name'] for p in response.json()], ['Nearby'])
+
+    async def test_async_list_points(self):
+        response = await self.async_client.get(
+            reverse('async-points-list'), headers={'Authorization': f'Token {self.token.key}'},
+        )
+        self.assertEqual(response['X-Total-Count'], '1')
+        self.assertEqual(len(response.json()), 1)
+
+    async def test_async_list_points_paginated(self):
+        await Point.objects.acreate(user=self.user, name='Second', description='', latitude=1, longitude=1)
+        headers = {'Authorization': f'Token {self.token.key}'}
+        response = await self.async_client.get(reverse('async-points-list') + '?limit=1&fields=id,name', headers=headers)
+        self.assertEqual(response['X-Total-Count'], '2')
+        self.assertEqual(list(response.json()[0]), ['id', 'name'])
+        self.assertEqual([p['name'] for p in response.json()], ['Nearby'])
+        response = await self.async_client.get(
+            reverse('async-points-list') + f'?limit=1&cursor={response["X-Next-Cursor"]}', headers=headers,
+        )
+        self.assertEqual([p['name'] for p in response.json()], ['Second'])
+        self.assertNotIn('X-Next-Cursor', response)
+
+    async def test_async_messages_match_sync(self):
+        point = await Point.objects.aget(name='Nearby')
+        old = await Message.objects.acreate(user=self.user, point=point, content='Old')
+        await Message.objects.filter(pk=old.pk).aupdate(created_at=timezone.now() - timedelta(days=2))
+        await Message.objects.acreate(user=self.user, point=point, content='New')
+        headers = {'Authorization': f'Token {self.token.key}'}
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        for params in ({}, {'since': since}, {'limit': 1}):
+            sync = await self.async_client.get(reverse('messages-list'), params, headers=headers)
+            response = await self.async_client.get(reverse('async-messages-list'), params, headers=headers)
+            self.assertEqual(response.json(), sync.json())
+            self.assertEqual(response.get('X-Next-Cursor'), sync.get('X-Next-Cursor'))
+        search = {'latitude': 0, 'longitude': 0, 'radius': 5, 'order': 'recent'}
+        for params in (search, {**search, 'since': since}):
+            sync = await self.async_client.get(reverse('messages-search'), params, headers=headers)
+            response = await self.async_client.get(reverse('async-messages-search'), params, headers=headers)
+            self.assertEqual(response.json(), sync.json())
+
+
+@override_settings(POINTS_AUTH_CACHE=True)
+class TokenCacheAPITest(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cached_token_skips_auth_query(self):
+        url = reverse('points-list')
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.assertEqual(token_cache.counters, {'hit_local': 1, 'hit_shared': 0, 'miss': 1})
+
+    def test_deactivation_and_token_deletion_invalidate(self):
+        url = reverse('points-list')
+        self.client.get(url)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.user.is_active = True
+        self.user.save()
+        self.client.get(url)
+        self.token.delete()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(POINTS_SYNC_SETTLE_SECONDS=0)
+class SyncAPITest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_authenticate(user=self.user)
+
+    def sync(self, **params):
+        response = self.client.get(reverse('sync'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_sync_returns_changes_after_cursor(self):
+        point = Point.objects.create(user=self.user, name='A', description='', latitude=0, longitude=0)
+        first = self.sync()
+        self.assertEqual([(c['type'], c['action'], c['id']) for c in first['changes']], [('point', 'upsert', point.pk)])
+        self.assertEqual(first['changes'][0]['data']['name'], 'A')
+
+        Message.objects.create(user=self.user, point=point, content='Hi')
+        point.name = 'B'
+        point.save()
+        point.delete()
+        changes = self.sync(since=first['cursor'])['changes']
+        self.assertEqual([(c['type'], c['action']) for c in changes], [('message', 'delete'), ('point', 'delete')])
+        self.assertEqual(self.sync(since=self.sync()['cursor'])['changes'], [])
+
+    def test_sync_bbox_sees_point_leaving(self):
+        point = Point.objects.create(user=self.user, name='A', description='', latitude=0, longitude=179.5)
+        Point.objects.create(user=self.user, name='Far', description='', latitude=40, longitude=0)
+        bbox = '179,-1,-179,1'
+        self.assertEqual([c['id'] for c in self.sync(bbox=bbox)['changes']], [point.pk])
+
+        cursor = self.sync(bbox=bbox)['cursor']
+        point.longitude = 10
+        point.save()
+        changes = self.sync(bbox=bbox, since=cursor)['changes']
+        self.assertEqual(changes[0]['data']['longitude'], 10)
+
+    def test_sync_includes_bulk_ingest(self):
+        ingest_points(iter_ndjson(['{"name": "A", "latitude": 1, "longitude": 2}']), self.user, use_copy=False)
+        self.assertEqual(len(self.sync()['changes']), 1)
+
+
+class IngestTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+
+    def test_validate_record_matches_serializer_rules(self):
+        self.assertEqual(validate_record({'name': 'A', 'latitude': 1, 'longitude': 2}), ('A', '', 1.0, 2.0))
+        with self.assertRaises(ValueError) as ctx:
+            validate_record({'name': 'A', 'latitude': 1, 'longitude': 2, 'location': {'type': 'Point', 'coordinates': [2, 1]}})
+        self.assertIn('non_field_errors', ctx.exception.args[0])
+
+    def test_ingest_in_chunks_reports_bad_rows(self):
+        lines = ['{"name": "P%d", "latitude": 0, "longitude": %d}' % (i, i) for i in range(5)]
+        lines.insert(2, '{"name": "Bad"}')
+        result = ingest_points(iter_ndjson(lines), self.user, chunk_size=2, use_copy=False)
+        self.assertEqual(result.created, 5)
+        self.assertEqual([e['line'] for e in result.errors], [3])
+        self.assertEqual(Point.objects.count(), 5)
+
+
+@override_settings(POINTS_SEARCH_CACHE=True, POINTS_SEARCH_CACHE_PRECISION=3)
+class SearchCacheTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+
+    def compute(self, lat, lon):
+        self.calls.append((lat, lon))
+        return len(self.calls)
+
+    def test_quantized_hit(self):
+        self.assertEqual(cached_search('points', 55.12341, 37.6, 5, (), self.compute), 1)
+        self.assertEqual(cached_search('points', 55.12349, 37.6, 5, (), self.compute), 1)
+        self.assertEqual(self.calls, [(55.123, 37.6)])
+
+    def test_invalidation_is_spatial(self):
+        cached_search('points', 55.1, 37.6, 5, (), self.compute)
+        invalidate_location(('points',), -33.9, 151.2)
+        invalidate_location(('messages',), 55.1, 37.6)
+        self.assertEqual(cached_search('points', 55.1, 37.6, 5, (), self.compute), 1)
+        invalidate_location(('points',), 55.1, 37.61)
+        self.assertEqual(cached_search('points', 55.1, 37.6, 5, (), self.compute), 2)
+
+    def test_evicted_versions_do_not_revive_entry(self):
+        version_keys = _circle_version_keys('points', 55.1, 37.6, 5)
+        invalidate_location(('points',), 55.1, 37.6)
+        self.assertEqual(cached_search('points', 55.1, 37.6, 5, (), self.compute), 1)
+        invalidate_location(('points',), 55.1, 37.6)
+        # Вытеснение ключей версий (LocMemCache с MAX_ENTRIES)
+        cache.delete_many(version_keys)
+        invalidate_location(('points',), 55.1, 37.6)
+        self.assertEqual(cached_search('points', 55.1, 37.6, 5, (), self.compute), 2)
+        cache.delete_many(version_keys)
+        self.assertEqual(cached_search('points', 55.1, 37.6, 5, (), self.compute), 3)
+
+
+class GeoMathTest(SimpleTestCase):
+    def test_distances_match_scalar_haversine(self):
+        lats, lons = [0, 10, -45.5, 89.9], [0, 20, 170, -179.5]
+        distances = distances_km((1, 2), lats, lons)
+        for distance, lat, lon in zip(distances, lats, lons):
+            self.assertAlmostEqual(distance, haversine_km(1, 2, lat, lon), places=6)
+
+    def test_sort_within_limit_and_after(self):
+        distances = np.array([3.0, 1.0, 2.0, 1.0, 9.0])
+        ids = np.array([10, 20, 30, 40, 50])
+        positions = sort_within(distances, ids, 5, limit=2)
+        self.assertEqual(ids[positions].tolist(), [20, 40])
+        positions = sort_within(distances, ids, 5, limit=2, after=(1.0, 40))
+        self.assertEqual(ids[positions].tolist(), [30, 10])
+
+    def test_within_radius_sorted(self):
+        positions, distances = within_radius((0, 0), [0, 0, 0, 5], [0.2, 0.1, 3, 0], 50)
+        self.assertEqual(positions.tolist(), [1, 0])
+        self.assertLess(distances[0], distances[1])
+
+    def test_bounding_box_wraps_antimeridian(self):
+        min_lat, max_lat, lon_ranges = bounding_box(0, 179.95, 20)
+        self.assertLess(min_lat, 0)
+        self.assertGreater(max_lat, 0)
+        self.assertEqual(len(lon_ranges), 2)
+        self.assertEqual(lon_ranges[0][1], 180.0)
+        self.assertEqual(lon_ranges[1][0], -180.0)
+
+    def test_bbox_lon_ranges_wrap_antimeridian(self):
+        self.assertEqual(bbox_lon_ranges(10, 20), [(10, 20)])
+        self.assertEqual(bbox_lon_ranges(170, -170), [(170, 180.0), (-180.0, -170)])
+
+    def test_bbox_center_and_radius(self):
+        self.assertEqual(bbox_center((170, -10, -170, 10)), (0, 180))
+        radius = bbox_radius_km((170, -10, -170, 10), (0, 180))
+        self.assertGreaterEqual(radius, haversine_km(0, 180, 10, 170))
+
+    def test_grid_clusters(self):
+        clusters = grid_clusters([0, 0.1, 5], [0, 0.1, 5], 1.0)
+        self.assertEqual(sorted(c['count'] for c in clusters), [1, 2])
+        pair = next(c for c in clusters if c['count'] == 2)
+        self.assertAlmostEqual(pair['latitude'], 0.05)
+        self.assertEqual(pair['bbox'], [0.0, 0.0, 0.1, 0.1])
+
+    def test_bounding_box_polar_cap(self):
+        min_lat, max_lat, lon_ranges = bounding_box(89.95, 10, 20)
+        self.assertEqual(max_lat, 90)
+        self.assertEqual(lon_ranges, [(-180.0, 180.0)])
+
+
+class RegionTest(SimpleTestCase):
+    def test_compiled_region_covers(self):
+        region = CompiledRegion(parse_geometry({
+            'type': 'Feature',
+            'geometry': {'type': 'Polygon', 'coordinates': [[[0, 0], [2, 0], [2, 2], [0, 0]]]},
+        }))
+        self.assertEqual(region.bbox, (0, 0, 2, 2))
+        mask = region.covers(np.array([1, 1.5, 1]), np.array([1.5, 0.5, 2]))
+        self.assertEqual(mask.tolist(), [True, False, True])
+
+    def test_parse_geometry_errors(self):
+        with self.assertRaises(ValueError):
+            parse_geometry({'type': 'Point', 'coordinates': [0, 0]})
+        with self.assertRaises(ValueError):
+            # Самопересекающийся «бантик»
+            parse_geometry({'type': 'Polygon', 'coordinates': [[[0, 0], [1, 1], [1, 0], [0, 1], [0, 0]]]})
+
+
+class PointRowSerializerTest(SimpleTestCase):
+    def test_matches_point_serializer(self):
+        point = Point(id=7, user_id=3, name='A', description='d', latitude=55.987654321012343, longitude=-37.1)
+        point.location = GEOSPoint(point.longitude, point.latitude, srid=4326)
+        row = {'id': 7, 'user': 3, 'name': 'A', 'description': 'd', 'latitude': point.latitude, 'longitude': point.longitude}
+        self.assertEqual(
+            json.dumps(PointRowSerializer(row).data),
+            json.dumps(PointSerializer(point).data),
+        )
+
+    def test_columns(self):
+        self.assertEqual(PointRowSerializer.columns(['name', 'location']), ['id', 'name', 'latitude', 'longitude'])
+
+
+@override_settings(POINTS_AUTH_CACHE=True, POINTS_AUTH_CACHE_SIZE=2)
+class TokenCacheTest(SimpleTestCase):
+    def test_lru_and_ttl(self):
+        cache = TokenCache()
+        for key in ('a', 'b'):
+            cache.set(key, key.upper(), None)
+        cache.get('a')
+        cache.set('c', 'C', None)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), ('A', None))
+        with override_settings(POINTS_AUTH_CACHE_TTL=0):
+            cache.set('d', 'D', None)
+        self.assertIsNone(cache.get('d'))
+        self.assertEqual(cache.counters, {'hit_local': 2, 'hit_shared': 0, 'miss': 2})
+
+    def test_shared_cache_fills_local(self):
+        cache = TokenCache()
+        with override_settings(POINTS_AUTH_CACHE_ALIAS='default'):
+            cache.set('k', 'U', None)
+            cache.clear()
+            self.assertEqual(cache.get('k'), ('U', None))
+            self.assertEqual(cache.get('k'), ('U', None))
+            cache.evict('k')
+        self.assertEqual(cache.counters, {'hit_local': 1, 'hit_shared': 1, 'miss': 0})
+
+
+class EngineTest(SimpleTestCase):
+    def test_detect_engine(self):
+        def conn(**ops):
+            return SimpleNamespace(ops=SimpleNamespace(**ops))
+        self.assertEqual(engines.detect_engine(conn(postgis=True)), 'postgis')
+        self.assertEqual(engines.detect_engine(conn(spatialite=True)), 'spatialite')
+        self.assertEqual(engines.detect_engine(conn()), 'python')
+
+    @override_settings(POINTS_SPATIAL_ENGINE='spatialite')
+    def test_fallback_is_counted_and_logged(self):
+        with self.assertLogs('points.engines', 'DEBUG') as logs:
+            self.assertTrue(engines.use_database(engines.RADIUS))
+            self.assertFalse(engines.use_database(engines.KNN))
+            self.assertFalse(engines.use_database(engines.KNN))
+        self.assertEqual(sum('WARNING' in line for line in logs.output), 1)
+        metrics = Registry()
+        metrics.add_collector(engines.collect)
+        text = metrics.render()
+        self.assertIn('points_spatial_engine_info{engine="spatialite",source="setting"} 1', text)
+        self.assertRegex(text, r'points_spatial_queries_total\{capability="knn",engine="spatialite",path="python"\} [1-9]')
+
+    @override_settings(POINTS_SPATIAL_ENGINE='oracle')
+    def test_unknown_engine(self):
+        with self.assertRaises(ImproperlyConfigured):
+            engines.get_engine()
+
+
+class RealtimeTest(SimpleTestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def test_index_matches_only_covering_circles(self):
+        index = SubscriptionIndex(cell_deg=1.0)
+        near = Subscription(0, 0, 10, self.loop)
+        across = Subscription(0, 179.95, 20, self.loop)
+        wide = Subscription(0, 0, 5000, self.loop)
+        for subscription in (near, across, wide):
+            index.add(subscription)
+        self.assertEqual(set(index.match(0, 0.05)), {near, wide})
+        self.assertEqual(index.match(0, -179.95), [across])
+        index.discard(near)
+        self.assertEqual(index.match(0, 0.05), [wide])
+        self.assertEqual(len(index), 2)
+
+    def test_hub_delivers_and_drops_oldest(self):
+        local_hub = Hub()
+        with override_settings(POINTS_REALTIME_QUEUE_SIZE=2):
+            subscription = local_hub.subscribe(0, 0, 10, self.loop)
+        for pk in range(3):
+            local_hub.publish({'id': pk, 'latitude': 0, 'longitude': 0.01, 'data': {'id': pk}})
+        local_hub.publish({'id': 9, 'latitude': 5, 'longitude': 5, 'data': {'id': 9}})
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(subscription.take_dropped(), 1)
+        self.assertEqual([subscription.queue.get_nowait()['id'] for _ in range(2)], [1, 2])
+        self.assertEqual(local_hub.counters, {'published': 4, 'delivered': 3})
+
+    def test_format_sse(self):
+        self.assertEqual(format_sse(event='message', data={'id': 1}, event_id=1), 'id: 1\nevent: message\ndata: {"id":1}\n\n')
+        self.assertEqual(format_sse(comment='keepalive'), ': keepalive\n\n')
+
+
+class _ReplicaProbeViewSet(ReplicaReadMixin, viewsets.ViewSet):
+    def list(self, request):
+        return Response({'alias': ReplicaRouter().db_for_read(Point)})
+
+    def create(self, request):
+        return Response(status=status.HTTP_201_CREATED)
+
+    def search(self, request):
+        def compute(lat, lon):
+            return ReplicaRouter().db_for_read(Point)
+
+        return Response({'alias': cached_search('probe', 0, 0, 1, (), compute)})
+
+
+@override_settings(POINTS_DB_REPLICAS=['replica_1'])
+class ReplicaRoutingTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = SimpleNamespace(pk=1, is_authenticated=True)
+
+    def call(self, method, action='list'):
+        request = getattr(APIRequestFactory(), method)('/')
+        force_authenticate(request, user=self.user)
+        return _ReplicaProbeViewSet.as_view({'get': action, 'post': 'create'})(request)
+
+    def test_reads_use_replica_until_own_write(self):
+        self.assertEqual(self.call('get').data['alias'], 'replica_1')
+        self.call('post')
+        self.assertIsNone(self.call('get').data['alias'])
+        self.assertIsNone(ReplicaRouter().db_for_read(Point))
+
+    @override_settings(POINTS_SEARCH_CACHE=True)
+    def test_cache_miss_computed_on_default(self):
+        # Промах, посчитанный на отстающей реплике, остался бы в кэше под новой версией
+        self.assertIsNone(self.call('get', action='search').data['alias'])
+
+    def test_writes_and_migrations_stay_on_default(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_write(Point), 'default')
+        self.assertFalse(router.allow_migrate('replica_1', 'points'))
+        self.assertIsNone(router.allow_migrate('default', 'points'))
+
+
+class InstrumentationTest(SimpleTestCase):
+    def test_registry_renders_prometheus_text(self):
+        registry = Registry()
+        stats = RequestStats()
+        stats.queries, stats.db_time = 3, 0.002
+        registry.observe(('points-search', 'search', 'GET', 200), 0.02, stats, 100)
+        registry.observe(('points-search', 'search', 'GET', 200), 20.0, stats, 50)
+        text = registry.render()
+        labels = 'view="points-search",action="search",method="GET",status="200"'
+        self.assertIn(f'points_request_duration_seconds_bucket{{{labels},le="0.025"}} 1', text)
+        self.assertIn(f'points_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', text)
+        self.assertIn(f'points_db_queries_total{{{labels}}} 6', text)
+        self.assertIn(f'points_response_bytes_total{{{labels}}} 150', text)
+
+
+class TileTest(SimpleTestCase):
+    def test_tile_route_accepts_mvt(self):
+        url = reverse('points-tiles', args=[1, 2, 0])
+        request = APIRequestFactory().get(url, HTTP_ACCEPT='application/vnd.mapbox-vector-tile')
+        force_authenticate(request, user=User(pk=1, username='tiles'))
+        # Некорректный тайл: ответ до запроса к БД, но уже после согласования формата
+        response = resolve(url).func(request, z=1, x=2, y=0)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(b'error', response.rendered_content)
+
+    def test_tile_coordinates(self):
+        self.assertEqual(tile_xy(0, 0, 0, 0, 0), (2048, 2048))
+        self.assertEqual(tile_xy(1, 1, 0, 0, 0), (0, 4096))
+        min_lon, min_lat, max_lon, max_lat = tile_bbox(1, 1, 0)
+        self.assertEqual((min_lon, max_lon), (0, 180))
+        self.assertAlmostEqual(min_lat, 0)
+
+    def test_tiles_containing_respects_buffer(self):
+        self.assertEqual(tiles_containing(1, 10, 10), [(1, 0)])
+        self.assertEqual(sorted(tiles_containing(1, 10, 0.1)), [(0, 0), (1, 0)])
+
+    def test_encode_tile(self):
+        data = encode_tile([(1, 10, 20, {'name': 'A', 'rank': -1}), (2, 30, 40, {'name': 'A'})])
+        # Tile.layers (поле 3, length-delimited), внутри — имя слоя, ключи и одно значение 'A'
+        self.assertEqual(data[0], (3 << 3) | 2)
+        self.assertIn(b'points', data)
+        self.assertEqual(data.count(b'name'), 1)
+        self.assertEqual(data.count(b'\x0a\x01A'), 1)
+
+
+class GridIndexTest(SimpleTestCase):
+    rows = [
+        (1, 0, 0),
+        (2, 0, 0.05),
+        (3, 10, 10),
+        (4, 0, 179.99),
+        (5, 0, -179.99),
+        (6, 89.99, 45),
+        (7, 89.99, -135),
+    ]
+
+    def setUp(self):
+        self.index = GridIndex(cell_deg=0.5)
+        self.index.build(self.rows)
+
+    def test_query_sorted_by_distance(self):
+        hits = self.index.query(0, 0.04, 50)
+        self.assertEqual([pk for _, pk in hits], [2, 1])
+        self.assertAlmostEqual(hits[0][0], haversine_km(0, 0.04, 0, 0.05))
+
+    def test_query_across_antimeridian(self):
+        hits = self.index.query(0, 180, 10)
+        self.assertEqual(sorted(pk for _, pk in hits), [4, 5])
+
+    def test_query_polar_cap(self):
+        hits = self.index.query(90, 0, 10)
+        self.assertEqual(sorted(pk for _, pk in hits), [6, 7])
+
+    def test_bbox_across_antimeridian(self):
+        ids, _, _ = self.index.bbox_arrays((179, -1, -179, 1))
+        self.assertEqual(sorted(ids.tolist()), [4, 5])
+
+    def test_changes_during_build_are_kept(self):
+        index = GridIndex(cell_deg=0.5)
+
+        def rows():
+            yield 1, 0, 0
+            # Сигнал post_save/post_delete, пришедший во время чтения строк
+            index.add(1, 10, 10)
+            index.add(9, 0, 0.01)
+            index.discard(2)
+            yield 2, 0, 0.02
+
+        index.build(rows())
+        self.assertEqual([pk for _, pk in index.query(0, 0, 50)], [9])
+        self.assertEqual([pk for _, pk in index.query(10, 10, 5)], [1])
+
+    def test_add_and_discard(self):
+        self.index.add(1, 10, 10.01)
+        self.index.discard(2)
+        hits = self.index.query(0, 0, 50)
+        self.assertEqual(hits, [])
+        hits = self.index.query(10, 10, 5)
+        self.assertEqual(sorted(pk for _, pk in hits), [1, 3])
+
+
+class ParallelSearchTest(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.index = GridIndex(cell_deg=0.5)
+        # Округление даёт равные расстояния: порядок среди них решает id
+        self.index.build(zip(range(1, 5001), np.round(rng.uniform(-5, 5, 5000), 1), np.round(rng.uniform(-5, 5, 5000), 1)))
+
+    def search(self, workers, **kwargs):
+        with override_settings(POINTS_PARALLEL_WORKERS=workers, POINTS_PARALLEL_MIN_POINTS=0):
+            ids, distances = self.index.query_arrays(0, 0, 400, **kwargs)
+        return ids.tolist(), distances.tolist()
+
+    def test_sharded_search_matches_serial(self):
+        ids, distances = self.search(1, limit=50)
+        for kwargs in ({}, {'limit': 50}, {'limit': 50, 'after': (distances[-1], ids[-1])}):
+            self.assertEqual(self.search(3, **kwargs), self.search(1, **kwargs))
+
+    def test_reset_keeps_pool_in_use(self):
+        pool = _get_pool()
+        reset_pool()
+        # Запрос, взявший пул до сброса, досылает в него шарды
+        self.assertEqual(pool.submit(sum, [1, 2]).result(), 3)
+        self.assertIsNot(_get_pool(), pool)
+
+    def test_merge_keeps_distance_and_id_order(self):
+        parts = [
+            (np.array([2, 7]), np.array([1.0, 3.0])),
+            (np.array([1, 5]), np.array([1.0, 2.0])),
+        ]
+        ids, distances = merge(parts, limit=3)
+        self.assertEqual((ids.tolist(), distances.tolist()), ([1, 2, 5], [1.0, 1.0, 2.0]))
+
+
+class SnapshotTest(SimpleTestCase):
+    rows = GridIndexTest.rows
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'points.snap')
+        self.assertEqual(write_snapshot(self.path, self.rows + [(8, None, None)], 42, 0.5), len(self.rows))
+        self.grid = GridIndex(cell_deg=0.5)
+        self.grid.build(self.rows)
+
+    def test_matches_grid_index(self):
+        snapshot = Snapshot(self.path)
+        self.assertEqual((len(snapshot), snapshot.changelog_id, snapshot.cell_deg), (len(self.rows), 42, 0.5))
+        self.assertFalse(snapshot.ids.flags.writeable)
+        for lat, lon, radius in ((0, 0.04, 50), (0, 180, 10), (90, 0, 10), (10, 10, 5), (0, 0, 1000)):
+            box = bounding_box(lat, lon, radius)
+            positions = snapshot.positions_in(*box)
+            distances = distances_km((lat, lon), np.degrees(snapshot.lat_r[positions]), np.degrees(snapshot.lon_r[positions]))
+            ids = snapshot.ids[positions][distances <= radius]
+            self.assertEqual(sorted(ids.tolist()), sorted(pk for _, pk in self.grid.query(lat, lon, radius)))
+
+    def test_rejects_foreign_file(self):
+        with open(self.path, 'r+b') as f:
+            f.write(b'NOTSNAP!')
+        with self.assertRaises(ValueError):
+            Snapshot(self.path)
+
+
+@override_settings(POINTS_SYNC_SETTLE_SECONDS=0, POINTS_INDEX_POLL_SECONDS=0)
+class SyncedGridIndexTest(TestCase):
+    def test_follows_writes_of_other_workers(self):
+        user = User.objects.create_user(username='testuser', password='testpass')
+        point = Point.objects.create(user=user, name='A', description='', latitude=0, longitude=0)
+        # Отдельный индекс не получает сигналов этого процесса, как индекс другого воркера
+        index = SyncedGridIndex(cell_deg=0.5)
+        index.refresh()
+        self.assertEqual([pk for _, pk in index.query(0, 0, 5)], [point.pk])
+
+        added = Point.objects.create(user=user, name='B', description='', latitude=0, longitude=0.01)
+        point.delete()
+        index.refresh()
+        self.assertEqual([pk for _, pk in index.query(0, 0, 5)], [added.pk])
+
+
+@override_settings(POINTS_SYNC_SETTLE_SECONDS=0, POINTS_INDEX_POLL_SECONDS=0)
+class SnapshotIndexTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'points.snap')
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.near = Point.objects.create(user=self.user, name='A', description='', latitude=0, longitude=0)
+        self.moved = Point.objects.create(user=self.user, name='B', description='', latitude=0, longitude=0.01)
+        self.gone = Point.objects.create(user=self.user, name='C', description='', latitude=0, longitude=0.02)
+
+    def ids(self, index, lat=0, lon=0, radius=50):
+        return sorted(pk for _, pk in index.query(lat, lon, radius))
+
+    def test_overlays_changes_after_export(self):
+        export_snapshot(self.path, 0.5)
+        self.moved.latitude = 10
+        self.moved.save()
+        self.gone.delete()
+        added = Point.objects.create(user=self.user, name='D', description='', latitude=0, longitude=0.03)
+
+        # Отдельный индекс видит изменения только через журнал, как другой воркер
+        index = SnapshotIndex(self.path)
+        index.refresh()
+        self.assertEqual(self.ids(index), [self.near.pk, added.pk])
+        self.assertEqual(self.ids(index, lat=10), [self.moved.pk])
+        self.assertEqual(len(index), 3)
+
+    def test_picks_up_swapped_file(self):
+        index = SnapshotIndex(self.path)
+        index.refresh()
+        self.assertEqual(self.ids(index), [self.near.pk, self.moved.pk, self.gone.pk])
+
+        export_snapshot(self.path, 0.5)
+        index.refresh()
+        self.assertEqual(index.collect()[0][3][0], 'points_index_snapshot_points{part="snapshot"} 3')
+        self.gone.delete()
+        index.refresh()
+        self.assertEqual(self.ids(index), [self.near.pk, self.moved.pk])
@@ -0,0 +1,269 @@
+"""
+Векторные тайлы точек (Mapbox Vector Tile 2.1).
+
+Геометрия тайла — Web Mercator с сеткой z/x/y, как у XYZ-тайлов карты.
+На PostGIS тайл собирает ST_AsMVT, без него — encode_tile на чистом
+Python. Готовые тайлы хранятся в кэше до изменения точки внутри тайла:
+у каждого тайла своя версия, сохранение или удаление точки меняет версии
+тайлов, которые её содержат, на всех кэшируемых уровнях.
+"""
+import hashlib
+import struct
+from math import atan, cos, degrees, floor, log, pi, radians, sinh, tan
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import connection
+
+from .geo import bbox_q
+from .models import Point
+from .replicas import primary
+from .search_cache import _cache, read_versions
+
+LAYER_NAME = 'points'
+MEDIA_TYPE = 'application/vnd.mapbox-vector-tile'
+
+# Граница Web Mercator: выше по модулю широты проекция уходит в бесконечность
+MAX_LATITUDE = degrees(atan(sinh(pi)))
+
+_PREFIX = 'points:tile'
+
+
+def extent():
+    return getattr(settings, 'POINTS_TILE_EXTENT', 4096)
+
+
+def buffer():
+    return getattr(settings, 'POINTS_TILE_BUFFER', 64)
+
+
+def max_zoom():
+    return getattr(settings, 'POINTS_TILE_MAX_ZOOM', 22)
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= max_zoom() and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def _world_xy(lat, lon):
+    """Координаты точки в единицах мира [0, 1) по x и y (y растёт на юг)."""
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = (lon + 180) / 360
+    y = (1 - log(tan(radians(lat)) + 1 / cos(radians(lat))) / pi) / 2
+    return x, y
+
+
+def _lat(world_y):
+    return degrees(atan(sinh(pi * (1 - 2 * world_y))))
+
+
+def tile_bbox(z, x, y, margin=0.0):
+    """
+    bbox тайла (min_lon, min_lat, max_lon, max_lat) в градусах; margin —
+    запас в долях тайла с каждой стороны (буфер ST_AsMVTGeom).
+    """
+    n = 2 ** z
+    min_lon = max(-180.0, (x - margin) / n * 360 - 180)
+    max_lon = min(180.0, (x + 1 + margin) / n * 360 - 180)
+    max_lat = _lat(max(0.0, (y - margin) / n))
+    min_lat = _lat(min(1.0, (y + 1 + margin) / n))
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def tile_xy(z, x, y, lat, lon):
+    """Целочисленные координаты точки внутри тайла в единицах extent."""
+    n = 2 ** z
+    world_x, world_y = _world_xy(lat, lon)
+    size = extent()
+    return round((world_x * n - x) * size), round((world_y * n - y) * size)
+
+
+def tiles_containing(z, lat, lon):
+    """Тайлы уровня z, в которые (с учётом буфера) попадает точка."""
+    n = 2 ** z
+    world_x, world_y = _world_xy(lat, lon)
+    margin = buffer() / extent()
+    xs = {floor(world_x * n + d) for d in (-margin, 0, margin)}
+    ys = {floor(world_y * n + d) for d in (-margin, 0, margin)}
+    return [(tx, ty) for tx in xs if 0 <= tx < n for ty in ys if 0 <= ty < n]
+
+
+# --- Кодирование MVT (protobuf без внешних зависимостей) ---
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _varint_field(field, value):
+    return _key(field, 0) + _varint(value)
+
+
+def _bytes_field(field, data):
+    return _key(field, 2) + _varint(len(data)) + data
+
+
+def _packed_field(field, values):
+    return _bytes_field(field, b''.join(_varint(v) for v in values))
+
+
+def _value(value):
+    """Сообщение Value слоя: строка, bool, целое или double."""
+    if isinstance(value, bool):
+        return _varint_field(7, int(value))
+    if isinstance(value, int):
+        return _varint_field(6, _zigzag(value)) if value < 0 else _varint_field(5, value)
+    if isinstance(value, float):
+        return _key(3, 1) + struct.pack('<d', value)
+    return _bytes_field(1, str(value).encode())
+
+
+def encode_tile(features, layer_name=LAYER_NAME):
+    """
+    Тайл из одного слоя точек. features — итерируемое (id, x, y, properties)
+    с координатами в единицах extent (см. tile_xy). Свойства со значением
+    None пропускаются.
+    """
+    keys, values = {}, {}
+    encoded = []
+    for feature_id, x, y, properties in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+        # Одна команда MoveTo (id 1, count 1) и смещение от начала тайла
+        geometry = [(1 << 3) | 1, _zigzag(x), _zigzag(y)]
+        feature = _varint_field(1, feature_id)
+        if tags:
+            feature += _packed_field(2, tags)
+        feature += _varint_field(3, 1) + _packed_field(4, geometry)
+        encoded.append(_bytes_field(2, feature))
+
+    layer = _varint_field(15, 2) + _bytes_field(1, layer_name.encode())
+    layer += b''.join(encoded)
+    layer += b''.join(_bytes_field(3, key.encode()) for key in keys)
+    layer += b''.join(_bytes_field(4, _value(value)) for _, value in values)
+    layer += _varint_field(5, extent())
+    return _bytes_field(3, layer)
+
+
+# --- Сборка тайла ---
+
+def max_features():
+    return getattr(settings, 'POINTS_TILE_MAX_FEATURES', 5000)
+
+
+_TILE_SQL = """
+WITH bounds AS (
+    SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom,
+           ST_TileEnvelope(%(z)s, %(x)s, %(y)s, margin => %(margin)s) AS search
+),
+features AS (
+    SELECT p.id, p.name,
+           ST_AsMVTGeom(ST_Transform(p.location::geometry, 3857), bounds.geom, %(extent)s, %(buffer)s, true) AS geom
+    FROM {table} p, bounds
+    WHERE p.location && ST_Transform(bounds.search, 4326)::geography
+    ORDER BY p.id
+    LIMIT %(limit)s
+)
+SELECT ST_AsMVT(features.*, %(layer)s, %(extent)s, 'geom', 'id') FROM features
+"""
+
+
+def postgis_tile(z, x, y):
+    """Тайл средствами PostGIS: отбор по GiST-индексу location, ST_AsMVTGeom и ST_AsMVT."""
+    params = {
+        'z': z, 'x': x, 'y': y, 'margin': buffer() / extent(), 'extent': extent(),
+        'buffer': buffer(), 'limit': max_features(), 'layer': LAYER_NAME,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(_TILE_SQL.format(table=Point._meta.db_table), params)
+        row = cursor.fetchone()
+    return bytes(row[0] or b'')
+
+
+def python_tile(z, x, y):
+    """Тайл без PostGIS: range-запрос по индексу (latitude, longitude) и encode_tile."""
+    bbox = tile_bbox(z, x, y, margin=buffer() / extent())
+    rows = (
+        Point.objects.filter(bbox_q(bbox))
+        .order_by('id')
+        .values_list('id', 'name', 'latitude', 'longitude')[:max_features()]
+    )
+    return encode_tile((pk, *tile_xy(z, x, y, lat, lon), {'name': name}) for pk, name, lat, lon in rows)
+
+
+# --- Кэш тайлов ---
+
+def _enabled(z):
+    return getattr(settings, 'POINTS_TILE_CACHE', False) and z <= getattr(settings, 'POINTS_TILE_CACHE_MAX_ZOOM', 16)
+
+
+def _version_key(z, x, y):
+    return f'{_PREFIX}:v:{z}:{x}:{y}'
+
+
+def _global_key():
+    return f'{_PREFIX}:v:all'
+
+
+def cached_tile(z, x, y, compute):
+    """
+    (тело тайла, etag) из кэша или compute(); etag — None, если тайл не
+    кэшируется. Версии читаются до вычисления, как в search_cache;
+    вытесненная версия — промах, а не возврат к прежнему значению.
+    """
+    if not _enabled(z):
+        return compute(), None
+    key = f'{_PREFIX}:t:{z}:{x}:{y}'
+    version_keys = [_global_key(), _version_key(z, x, y)]
+    cache = _cache()
+    entry, versions = read_versions(cache, key, version_keys)
+    etag = '"' + hashlib.md5(repr((z, x, y, versions)).encode()).hexdigest() + '"'
+    if entry is not None and entry[0] == versions:
+        return entry[1], etag
+    # Промах — с default, как в search_cache
+    with primary():
+        body = compute()
+    cache.set(key, (versions, body), getattr(settings, 'POINTS_TILE_CACHE_TTL', 86400))
+    return body, etag
+
+
+def invalidate_tiles(lat, lon):
+    """
+    Новые версии тайлов, содержащих (lat, lon), на всех кэшируемых уровнях.
+    Версия — случайный токен: все ключи пишутся одним set_many без incr.
+    """
+    if not getattr(settings, 'POINTS_TILE_CACHE', False) or lat is None or lon is None:
+        return
+    top = min(max_zoom(), getattr(settings, 'POINTS_TILE_CACHE_MAX_ZOOM', 16))
+    token = uuid4().hex
+    keys = {
+        _version_key(z, tx, ty): token
+        for z in range(top + 1)
+        for tx, ty in tiles_containing(z, lat, lon)
+    }
+    _cache().set_many(keys, timeout=None)
+
+
+def invalidate_all_tiles():
+    """Сбросить все тайлы, например после массовой загрузки."""
+    if getattr(settings, 'POINTS_TILE_CACHE', False):
+        _cache().set(_global_key(), uuid4().hex, timeout=None)
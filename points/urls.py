@@ -1,13 +1,34 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
+from rest_framework.settings import api_settings
 
-from .views import MessageViewSet, PointViewSet
+from . import async_views
+from .instrumentation import metrics_view
+from .renderers import MVTRenderer
+from .views import MessageViewSet, PointViewSet, RegionViewSet, SyncView
 
 router = DefaultRouter()
 router.register(r'points', PointViewSet, basename='points')
+router.register(r'regions', RegionViewSet, basename='regions')
 
 urlpatterns = [
     path('points/messages/', MessageViewSet.as_view({'get': 'list', 'post': 'create'}), name='messages-list'),
+    path('points/messages/<int:pk>/', MessageViewSet.as_view({'get': 'retrieve', 'delete': 'destroy'}), name='messages-detail'),
     path('points/messages/search/', MessageViewSet.as_view({'get': 'search'}), name='messages-search'),
+    path('points/messages/inside/', MessageViewSet.as_view({'get': 'inside', 'post': 'inside'}, **MessageViewSet.inside.kwargs), name='messages-inside'),
+    path('points/messages/nearest/', MessageViewSet.as_view({'get': 'nearest'}), name='messages-nearest'),
+    path(
+        'points/tiles/<int:z>/<int:x>/<int:y>.mvt',
+        # MVTRenderer: иначе Accept тайла не проходит согласование формата (406)
+        PointViewSet.as_view({'get': 'tiles'}, renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, MVTRenderer]),
+        name='points-tiles',
+    ),
+    path('metrics/', metrics_view, name='metrics'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('async/points/', async_views.point_list, name='async-points-list'),
+    path('async/points/search/', async_views.point_search, name='async-points-search'),
+    path('async/points/messages/', async_views.message_list, name='async-messages-list'),
+    path('async/points/messages/search/', async_views.message_search, name='async-messages-search'),
+    path('stream/messages/', async_views.message_stream, name='messages-stream'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,15 +1,49 @@
-from math import atan2, cos, radians, sin, sqrt
+from itertools import islice
+from math import floor, pi
 
-from django.contrib.gis.db.models.functions import Distance
+import numpy as np
+from django.conf import settings
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.db.models.functions import Distance, SnapToGrid
 from django.contrib.gis.geos import Point as GEOSPoint
 from django.contrib.gis.measure import D
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min, Q, Subquery
+from django.db.models.functions import Cast
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.settings import api_settings
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from .models import Message, Point
-from .serializers import MessageSerializer, PointSerializer
+from . import engines, tiles
+from .changelog import read_changes
+from .functions import KNNDistance
+from .geo import (
+    EARTH_RADIUS_KM, bbox_center, bbox_lon_ranges, bbox_polygon, bbox_q, bbox_radius_km, bounding_box_q,
+    grid_clusters, within_radius,
+)
+from .ingest import ingest_points, iter_payload
+from .models import ChangeLog, Message, Point, Region
+from .pagination import decode_cursor, decode_id_cursor, decode_time_cursor, paginated_response, parse_limit, parse_page_params
+from .parsers import GeoJSONParser, NDJSONParser
+from .renderers import (
+    STREAM_CHUNK_SIZE, STREAMING_FORMATS, GeoJSONRenderer, NDJSONRenderer, eager, streaming_response,
+)
+from .realtime import hub, message_event
+from .regions import CompiledRegion, compiled_region, parse_geometry
+from .replicas import ReplicaReadMixin
+from .search_cache import cached_search
+from .serializers import (
+    MessageSerializer, PointRowSerializer, PointSerializer, RegionSerializer, point_fields, wants_stats,
+)
+from .spatial_index import get_point_index
 
 
 def _parse_geo_params(request):
@@ -28,72 +62,857 @@ def _parse_geo_params(request):
         return None, None, None, Response({'error': 'Некорректные географические параметры'}, status=status.HTTP_400_BAD_REQUEST)
 
 
-def _haversine_km(lat1, lon1, lat2, lon2):
-    earth_radius_km = 6371
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
-    return 2 * earth_radius_km * atan2(sqrt(a), sqrt(1 - a))
+def _parse_knn_params(request):
+    lat = request.query_params.get('latitude') or request.query_params.get('lat')
+    lon = request.query_params.get('longitude') or request.query_params.get('lon')
+    k = request.query_params.get('k')
+    if not all([lat, lon, k]):
+        return None, None, None, Response({'error': 'Требуются параметры latitude, longitude и k'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        lat, lon, k = float(lat), float(lon), int(k)
+    except (TypeError, ValueError):
+        return None, None, None, Response({'error': 'Некорректные параметры поиска ближайших'}, status=status.HTTP_400_BAD_REQUEST)
+    max_k = getattr(settings, 'POINTS_SEARCH_MAX_LIMIT', 1000)
+    if k <= 0 or k > max_k:
+        return None, None, None, Response({'error': f'Параметр k должен быть в диапазоне от 1 до {max_k}'}, status=status.HTTP_400_BAD_REQUEST)
+    return lat, lon, k, None
+
+
+def _parse_bbox(request):
+    """
+    bbox=min_lon,min_lat,max_lon,max_lat (порядок GeoJSON). min_lon > max_lon —
+    прямоугольник через антимеридиан. Возвращает (bbox или None, error_response).
+    """
+    value = request.query_params.get('bbox')
+    if not value:
+        return None, None
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in value.split(','))
+    except ValueError:
+        return None, Response({'error': 'Параметр bbox: ожидается min_lon,min_lat,max_lon,max_lat'}, status=status.HTTP_400_BAD_REQUEST)
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        return None, Response({'error': 'Параметр bbox: координаты вне допустимого диапазона'}, status=status.HTTP_400_BAD_REQUEST)
+    return (min_lon, min_lat, max_lon, max_lat), None
+
+
+def _cluster_cell_deg(zoom):
+    """Размер ячейки кластеризации: POINTS_CLUSTER_CELLS_PER_TILE ячеек на ширину тайла уровня zoom."""
+    return 360 / (2 ** zoom * getattr(settings, 'POINTS_CLUSTER_CELLS_PER_TILE', 8))
+
+
+def _parse_cluster_params(request):
+    """bbox и zoom для кластеризации. Возвращает (bbox, cell_deg, error_response)."""
+    bbox, error_response = _parse_bbox(request)
+    if error_response:
+        return None, None, error_response
+    zoom = request.query_params.get('zoom')
+    if bbox is None or zoom is None:
+        return None, None, Response({'error': 'Требуются параметры bbox и zoom'}, status=status.HTTP_400_BAD_REQUEST)
+    max_zoom = getattr(settings, 'POINTS_CLUSTER_MAX_ZOOM', 22)
+    try:
+        zoom = int(zoom)
+    except ValueError:
+        zoom = -1
+    if not 0 <= zoom <= max_zoom:
+        return None, None, Response({'error': f'Параметр zoom должен быть целым числом от 0 до {max_zoom}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    cell_deg = _cluster_cell_deg(zoom)
+    min_lon, min_lat, max_lon, max_lat = bbox
+    cells = (floor((max_lat - min_lat) / cell_deg) + 1) * sum(
+        floor((hi - lo) / cell_deg) + 1 for lo, hi in bbox_lon_ranges(min_lon, max_lon)
+    )
+    if cells > getattr(settings, 'POINTS_CLUSTER_MAX_CELLS', 10000):
+        return None, None, Response({'error': 'Слишком много ячеек: уменьшите bbox или zoom'}, status=status.HTTP_400_BAD_REQUEST)
+    return bbox, cell_deg, None
+
+
+def _parse_within_params(request):
+    """
+    bbox и центр сортировки для within: latitude/longitude, если переданы,
+    иначе центр bbox. Возвращает (bbox, center, error_response).
+    """
+    bbox, error_response = _parse_bbox(request)
+    if error_response:
+        return None, None, error_response
+    if bbox is None:
+        return None, None, Response({'error': 'Требуется параметр bbox'}, status=status.HTTP_400_BAD_REQUEST)
+    lat = request.query_params.get('latitude') or request.query_params.get('lat')
+    lon = request.query_params.get('longitude') or request.query_params.get('lon')
+    if lat is None and lon is None:
+        return bbox, bbox_center(bbox), None
+    try:
+        return bbox, (float(lat), float(lon)), None
+    except (TypeError, ValueError):
+        return None, None, Response({'error': 'Некорректные географические параметры'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _parse_region(request):
+    """
+    Область поиска: ?region=<имя> сохранённой области или тело POST —
+    GeoJSON Polygon/MultiPolygon (или Feature), либо {"region": "<имя>"}.
+    Возвращает (CompiledRegion, error_response).
+    """
+    name = request.query_params.get('region')
+    data = request.data if request.method == 'POST' else None
+    if isinstance(data, dict) and 'type' not in data and data.get('region'):
+        name = data['region']
+    if name:
+        region = compiled_region(name)
+        if region is None:
+            return None, Response({'error': f'Область {name} не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        return region, None
+    if not data:
+        return None, Response({'error': 'Требуется параметр region или GeoJSON-геометрия в теле запроса'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        return CompiledRegion(parse_geometry(data)), None
+    except ValueError as e:
+        return None, Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _parse_datetime_param(request, name):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(name)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, timezone.get_default_timezone())
+    return parsed
+
+
+def _parse_time_window(request):
+    """
+    Окно времени сообщений: since (включительно) и until (не включительно)
+    в ISO 8601. Возвращает (time_q, window, error_response), где window —
+    (since, until) для ключа кэша.
+    """
+    try:
+        since = _parse_datetime_param(request, 'since')
+        until = _parse_datetime_param(request, 'until')
+    except ValueError as e:
+        return None, None, Response({'error': f'Некорректная дата в параметре {e}, ожидается ISO 8601'}, status=status.HTTP_400_BAD_REQUEST)
+    time_q = Q()
+    if since:
+        time_q &= Q(created_at__gte=since)
+    if until:
+        time_q &= Q(created_at__lt=until)
+    return time_q, (since, until), None
+
+
+def _parse_order(request):
+    order = request.query_params.get('order') or 'distance'
+    if order not in ('distance', 'recent'):
+        return None, Response({'error': 'Параметр order должен быть distance или recent'}, status=status.HTTP_400_BAD_REQUEST)
+    return order, None
+
+
+# SQLite ограничивает число параметров в одном запросе
+_IN_BATCH_SIZE = 900
+
+
+def _fallback_point_ids(lat, lon, radius, limit=None, after=None):
+    """
+    Массивы (ids, distances_km) точек в радиусе, отсортированные по (расстояние, id).
+
+    С POINTS_SPATIAL_INDEX кандидаты берутся из in-process индекса, иначе —
+    из БД range-запросом по bounding box (индекс latitude, longitude);
+    haversine уточняет только кандидатов.
+    """
+    if getattr(settings, 'POINTS_SPATIAL_INDEX', True):
+        return get_point_index().query_arrays(lat, lon, radius, limit=limit, after=after)
+
+    rows = np.array(
+        Point.objects.filter(bounding_box_q(lat, lon, radius)).values_list('id', 'latitude', 'longitude'),
+        dtype=np.float64,
+    ).reshape(-1, 3)
+    ids = rows[:, 0].astype(np.int64)
+    positions, distances = within_radius(
+        (lat, lon), rows[:, 1], rows[:, 2], radius, ids=ids, limit=limit, after=after,
+    )
+    return ids[positions], distances
+
+
+def _fallback_bbox_point_ids(bbox, center, limit=None, after=None):
+    """
+    Массивы (ids, distances_km) точек bbox, отсортированные по расстоянию
+    до center и id. Кандидаты — из индекса или range-запросом, как в
+    _fallback_point_ids.
+    """
+    if getattr(settings, 'POINTS_SPATIAL_INDEX', True):
+        ids, lats, lons = get_point_index().bbox_arrays(bbox)
+    else:
+        rows = np.array(
+            Point.objects.filter(bbox_q(bbox)).values_list('id', 'latitude', 'longitude'),
+            dtype=np.float64,
+        ).reshape(-1, 3)
+        ids, lats, lons = rows[:, 0].astype(np.int64), rows[:, 1], rows[:, 2]
+    positions, distances = within_radius(center, lats, lons, np.inf, ids=ids, limit=limit, after=after)
+    return ids[positions], distances
+
+
+def _points_page(ids, distances, limit):
+    """Гидрация страницы точек по упорядоченным id и курсор следующей."""
+    ids, distances = ids.tolist(), distances.tolist()
+    next_after = (distances[limit - 1], ids[limit - 1]) if len(ids) > limit else None
+    ids = ids[:limit]
+    by_id = Point.objects.in_bulk(ids)
+    return [by_id[pk] for pk in ids if pk in by_id], next_after
+
+
+def _point_rows(ids, columns):
+    """Строки .values() точек по упорядоченным id, пачками."""
+    for start in range(0, len(ids), _IN_BATCH_SIZE):
+        batch = ids[start:start + _IN_BATCH_SIZE]
+        by_id = {row['id']: row for row in Point.objects.filter(id__in=batch).values(*columns)}
+        yield from (by_id[pk] for pk in batch if pk in by_id)
+
+
+def _point_rows_page(ids, distances, limit, columns):
+    """Как _points_page, но строки .values() вместо экземпляров модели."""
+    ids, distances = ids.tolist(), distances.tolist()
+    next_after = (distances[limit - 1], ids[limit - 1]) if len(ids) > limit else None
+    return list(_point_rows(ids[:limit], columns)), next_after
+
+
+def _iter_points(ids):
+    """Точки по упорядоченным id, гидрация пачками."""
+    for start in range(0, len(ids), _IN_BATCH_SIZE):
+        batch = ids[start:start + _IN_BATCH_SIZE]
+        by_id = Point.objects.in_bulk(batch)
+        yield from (by_id[pk] for pk in batch if pk in by_id)
+
+
+def _fallback_region_point_ids(region):
+    """Отсортированные id точек в области: префильтр по её bbox, затем prepared-геометрия GEOS."""
+    if getattr(settings, 'POINTS_SPATIAL_INDEX', True):
+        ids, lats, lons = get_point_index().bbox_arrays(region.bbox)
+    else:
+        rows = np.array(
+            Point.objects.filter(bbox_q(region.bbox)).values_list('id', 'latitude', 'longitude'),
+            dtype=np.float64,
+        ).reshape(-1, 3)
+        ids, lats, lons = rows[:, 0].astype(np.int64), rows[:, 1], rows[:, 2]
+    return np.sort(ids[region.covers(lats, lons)])
 
 
-class PointViewSet(viewsets.ModelViewSet):
+def _fallback_region_messages(region, limit, after=None):
+    """
+    Страница сообщений точек области по возрастанию id. Каждая пачка
+    точек отдаёт не больше limit + 1 строк, итог — первые limit + 1.
+    """
+    ids = _fallback_region_point_ids(region).tolist()
+    qs = Message.objects.select_related('point')
+    if after:
+        qs = qs.filter(id__gt=after[1])
+    rows = []
+    for start in range(0, len(ids), _IN_BATCH_SIZE):
+        rows.extend(qs.filter(point_id__in=ids[start:start + _IN_BATCH_SIZE]).order_by('id')[:limit + 1])
+        rows.sort(key=lambda m: m.pk)
+        del rows[limit + 1:]
+    return _id_page(rows, limit)
+
+
+def _fallback_points(lat, lon, radius, limit, after, columns):
+    """Страница строк .values() точек в радиусе и курсор следующей страницы (или None)."""
+    ids, distances = _fallback_point_ids(lat, lon, radius, limit=limit + 1, after=after)
+    return _point_rows_page(ids, distances, limit, columns)
+
+
+def _iter_fallback_points(lat, lon, radius, columns):
+    """Строки .values() всех точек в радиусе по порядку расстояния, пачками."""
+    return _point_rows(_fallback_point_ids(lat, lon, radius)[0].tolist(), columns)
+
+
+def _iter_fallback_messages(lat, lon, radius, after=None, time_q=Q()):
+    """
+    Сообщения в порядке (расстояние до точки, id) как кортежи
+    (distance_km, id, message). Сообщения выбираются пачками точек от
+    ближних к дальним, поэтому потребитель может остановиться в любой момент.
+    """
+    point_after = (after[0], -1) if after else None
+    ids, distances = _fallback_point_ids(lat, lon, radius, after=point_after)
+    ids, distances = ids.tolist(), distances.tolist()
+
+    start = 0
+    while start < len(ids):
+        end = min(start + _IN_BATCH_SIZE, len(ids))
+        # Точки на одинаковом расстоянии не разрываем между пачками,
+        # иначе порядок по id сообщений между ними нарушится
+        while end < len(ids) and distances[end] == distances[end - 1]:
+            end += 1
+        distance_of = dict(zip(ids[start:end], distances[start:end]))
+        batch = [
+            (distance_of[m.point_id], m.pk, m)
+            for m in Message.objects.select_related('point').filter(time_q, point_id__in=ids[start:end])
+        ]
+        if after:
+            batch = [row for row in batch if row[:2] > after]
+        batch.sort(key=lambda row: row[:2])
+        yield from batch
+        start = end
+
+
+def _fallback_messages(lat, lon, radius, limit, after=None, time_q=Q()):
+    """Страница сообщений в радиусе и курсор следующей страницы (или None)."""
+    rows = list(islice(_iter_fallback_messages(lat, lon, radius, after, time_q), limit + 1))
+    next_after = rows[limit - 1][:2] if len(rows) > limit else None
+    return [m for _, _, m in rows[:limit]], next_after
+
+
+def _fallback_recent_messages(lat, lon, radius, limit, after=None, time_q=Q()):
+    """
+    Страница самых новых сообщений точек в радиусе. Каждая пачка точек
+    отдаёт не больше limit + 1 строк по индексу (point, created_at),
+    итог — лучшие limit + 1 из всех пачек.
+    """
+    ids = _fallback_point_ids(lat, lon, radius)[0].tolist()
+    qs = Message.objects.select_related('point').filter(time_q)
+    if after:
+        qs = qs.filter(_recent_q(after))
+    rows = []
+    for start in range(0, len(ids), _IN_BATCH_SIZE):
+        batch = qs.filter(point_id__in=ids[start:start + _IN_BATCH_SIZE])
+        rows.extend(batch.order_by('-created_at', '-id')[:limit + 1])
+        rows.sort(key=lambda m: (m.created_at, m.pk), reverse=True)
+        del rows[limit + 1:]
+    next_after = (rows[limit - 1].created_at, rows[limit - 1].pk) if len(rows) > limit else None
+    return rows[:limit], next_after
+
+
+# k-NN без PostGIS: радиус поиска растёт, пока не наберётся k результатов
+_KNN_START_RADIUS_KM = 1
+_KNN_MAX_RADIUS_KM = pi * EARTH_RADIUS_KM
+
+
+def _fallback_nearest(fetch, k):
+    """
+    k ближайших через расширяющийся радиус: k ближайших внутри радиуса r
+    при полном наборе — глобально ближайшие, всё вне r дальше.
+    fetch(radius) возвращает до k строк внутри radius.
+    """
+    radius = _KNN_START_RADIUS_KM
+    while True:
+        rows = fetch(radius)
+        if len(rows) >= k or radius >= _KNN_MAX_RADIUS_KM:
+            return rows
+        radius = min(radius * 4, _KNN_MAX_RADIUS_KM)
+
+
+def _fallback_nearest_points(lat, lon, k):
+    ids = _fallback_nearest(lambda radius: _fallback_point_ids(lat, lon, radius, limit=k)[0], k).tolist()
+    by_id = Point.objects.in_bulk(ids)
+    return [by_id[pk] for pk in ids if pk in by_id]
+
+
+def _fallback_nearest_messages(lat, lon, k):
+    return _fallback_nearest(lambda radius: _fallback_messages(lat, lon, radius, k)[0], k)
+
+
+def _keyset_q(after):
+    """Фильтр keyset-пагинации по аннотации distance (в метрах) и id."""
+    distance, pk = after
+    return Q(distance__gt=D(m=distance)) | Q(distance=D(m=distance), id__gt=pk)
+
+
+def _recent_q(after):
+    """Фильтр keyset-пагинации по убыванию (created_at, id)."""
+    created_at, pk = after
+    return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+
+
+def _recent_page(qs, limit, after):
+    """Страница queryset от новых к старым и курсор следующей."""
+    if after:
+        qs = qs.filter(_recent_q(after))
+    rows = list(qs.order_by('-created_at', '-id')[:limit + 1])
+    next_after = (rows[limit - 1].created_at, rows[limit - 1].pk) if len(rows) > limit else None
+    return rows[:limit], next_after
+
+
+def _point_geometry(message):
+    return {'type': 'Point', 'coordinates': [message.point.longitude, message.point.latitude]}
+
+
+def _fallback_clusters(bbox, cell_deg):
+    """Кластеры без PostGIS: точки bbox из индекса или range-запросом, сетка — в numpy."""
+    if getattr(settings, 'POINTS_SPATIAL_INDEX', True):
+        _, lats, lons = get_point_index().bbox_arrays(bbox)
+    else:
+        rows = np.array(list(Point.objects.filter(bbox_q(bbox)).values_list('latitude', 'longitude')), dtype=np.float64)
+        rows = rows.reshape(-1, 2)
+        lats, lons = rows[:, 0], rows[:, 1]
+    return grid_clusters(lats, lons, cell_deg)
+
+
+def _within_q(bbox):
+    """
+    Фильтр PostGIS по bbox: пересечение geography с накрывающим
+    многоугольником идёт по GiST-индексу location, точную границу
+    прямоугольника задают range-фильтры latitude/longitude.
+    """
+    polygon = bbox_polygon(bbox)
+    q = bbox_q(bbox)
+    if polygon is not None:
+        q &= Q(location__intersects=polygon)
+    return q
+
+
+def _region_q(region, prefix=''):
+    """
+    ST_CoveredBy по области. Сохранённая область подставляется подзапросом —
+    её геометрия не передаётся в каждый запрос, план остаётся индексным.
+    """
+    if region.region_id is not None:
+        geometry = Subquery(Region.objects.filter(pk=region.region_id).values('geometry'))
+    else:
+        geometry = region.geometry
+    return Q(**{f'{prefix}location__coveredby': geometry})
+
+
+def _id_page(rows, limit):
+    """Страница строк, упорядоченных по id, и курсор следующей."""
+    next_after = (rows[limit - 1].pk, rows[limit - 1].pk) if len(rows) > limit else None
+    return rows[:limit], next_after
+
+
+def _postgis_id_page(qs, limit, after):
+    if after:
+        qs = qs.filter(id__gt=after[1])
+    return _id_page(list(qs.order_by('id')[:limit + 1]), limit)
+
+
+def _postgis_page(qs, limit, after):
+    """Страница queryset, отсортированного по (distance, id), и курсор следующей."""
+    if after:
+        qs = qs.filter(_keyset_q(after))
+    rows = list(qs.order_by('distance', 'id')[:limit + 1])
+    next_after = (rows[limit - 1].distance.m, rows[limit - 1].pk) if len(rows) > limit else None
+    return rows[:limit], next_after
+
+
+def _postgis_rows_page(qs, limit, after, columns):
+    """Как _postgis_page, но строки .values(*columns) без экземпляров модели."""
+    if after:
+        qs = qs.filter(_keyset_q(after))
+    rows = list(qs.order_by('distance', 'id').values(*columns, 'distance')[:limit + 1])
+    next_after = (rows[limit - 1]['distance'].m, rows[limit - 1]['id']) if len(rows) > limit else None
+    return rows[:limit], next_after
+
+
+def _parse_point_fields(request):
+    """?fields= для list/search точек. Возвращает (fields, error_response)."""
+    fields, error = point_fields(request)
+    if error:
+        return None, Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+    return fields, None
+
+
+class PointViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Point.objects.all()
     serializer_class = PointSerializer
     permission_classes = [IsAuthenticated]
+    replica_actions = ('list', 'retrieve', 'search', 'within', 'nearest', 'inside', 'clusters', 'tiles')
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer, GeoJSONRenderer]
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, GeoJSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        Массовое создание точек из NDJSON, GeoJSON FeatureCollection или
+        JSON-списка. Ошибки отдельных записей возвращаются в errors.
+        """
+        if request.content_type.startswith(NDJSONParser.media_type):
+            records = request.data
+        else:
+            records = iter_payload(request.data)
+        result = ingest_points(records, request.user)
+        response_status = status.HTTP_201_CREATED if result.created or not result.errors else status.HTTP_400_BAD_REQUEST
+        return Response({'created': result.created, 'errors': result.errors}, status=response_status)
+
+    def list(self, request, *args, **kwargs):
+        """Все точки; строки сериализуются без экземпляров модели, ?fields= сужает ответ."""
+        fields, error_response = _parse_point_fields(request)
+        if error_response:
+            return error_response
+        rows = self.filter_queryset(self.get_queryset()).values(*PointRowSerializer.columns(fields))
+        return Response(PointRowSerializer(rows, many=True, fields=fields).data)
+
     @action(detail=False, methods=['get'])
     def search(self, request):
         lat, lon, radius, error_response = _parse_geo_params(request)
+        if error_response:
+            return error_response
+        fields, error_response = _parse_point_fields(request)
+        if error_response:
+            return error_response
+        columns = PointRowSerializer.columns(fields)
+        if request.accepted_renderer.format in STREAMING_FORMATS:
+            return self._stream_search(lat, lon, radius, fields, columns)
+        limit, after, error_response = parse_page_params(request)
         if error_response:
             return error_response
 
-        try:
+        def compute(lat, lon):
+            if engines.use_database(engines.RADIUS):
+                center = GEOSPoint(lon, lat, srid=4326)
+                # Поиск с сортировкой по расстоянию
+                qs = Point.objects.filter(location__distance_lte=(center, D(km=radius)))
+                qs = qs.annotate(distance=Distance('location', center))
+                rows, next_after = _postgis_rows_page(qs, limit, after, columns)
+            else:
+                # Fallback на Haversine (без PostGIS или для SQLite)
+                rows, next_after = _fallback_points(lat, lon, radius, limit, after, columns)
+            serializer = PointRowSerializer(rows, many=True, fields=fields)
+            return list(serializer.data), next_after
+
+        # Агрегаты меняются вместе с сообщениями — у них своя область кэша
+        endpoint = 'points-stats' if wants_stats(request) else 'points'
+        data, next_after = cached_search(endpoint, lat, lon, radius, (limit, after, tuple(fields)), compute)
+        return paginated_response(request, data, next_after)
+
+    def _stream_search(self, lat, lon, radius, fields, columns):
+        """Весь результат поиска потоком NDJSON/GeoJSON, без пагинации."""
+        if engines.use_database(engines.RADIUS):
             center = GEOSPoint(lon, lat, srid=4326)
-            # Поиск с сортировкой по расстоянию
             qs = Point.objects.filter(location__distance_lte=(center, D(km=radius)))
-            qs = qs.annotate(distance=Distance('location', center)).order_by('distance')
-            serializer = self.get_serializer(qs, many=True)
-            return Response(serializer.data)
-        except Exception as e:
-            # Fallback на Haversine (без PostGIS или для SQLite)
-            # Ограничиваем только точками с координатами
-            points = [
-                p for p in Point.objects.exclude(latitude__isnull=True, longitude__isnull=True)
-                if _haversine_km(lat, lon, p.latitude, p.longitude) <= radius
-            ]
+            qs = qs.annotate(distance=Distance('location', center)).order_by('distance', 'id')
+            rows = eager(qs.values(*columns).iterator(chunk_size=STREAM_CHUNK_SIZE))
+        else:
+            rows = _iter_fallback_points(lat, lon, radius, columns)
+        serializer = PointRowSerializer(fields=fields)
+        return streaming_response(rows, self.request.accepted_renderer, serializer.to_representation)
+
+    @action(detail=False, methods=['get', 'post'], parser_classes=[JSONParser, GeoJSONParser])
+    def inside(self, request):
+        """
+        Точки внутри области: ?region=<имя> или GeoJSON-многоугольник в теле
+        POST. Порядок — по id, пагинация limit/cursor.
+        """
+        region, error_response = _parse_region(request)
+        if error_response:
+            return error_response
+        limit, after, error_response = parse_page_params(request, decode=decode_id_cursor)
+        if error_response:
+            return error_response
+
+        if engines.use_database(engines.REGION):
+            points, next_after = _postgis_id_page(Point.objects.filter(_region_q(region)), limit, after)
+        else:
+            ids = _fallback_region_point_ids(region)
+            if after:
+                ids = ids[np.searchsorted(ids, after[1], side='right'):]
+            ids = ids[:limit + 1].tolist()
+            by_id = Point.objects.in_bulk(ids)
+            points, next_after = _id_page([by_id[pk] for pk in ids if pk in by_id], limit)
+        serializer = self.get_serializer(points, many=True)
+        return paginated_response(request, serializer.data, next_after)
+
+    @action(detail=False, methods=['get'])
+    def within(self, request):
+        """
+        Точки в прямоугольнике bbox (окно карты) с той же сортировкой по
+        расстоянию (до центра bbox или latitude/longitude), пагинацией и
+        потоковыми форматами, что у search.
+        """
+        bbox, center, error_response = _parse_within_params(request)
+        if error_response:
+            return error_response
+        lat, lon = center
+        if request.accepted_renderer.format in STREAMING_FORMATS:
+            return self._stream_within(bbox, lat, lon)
+        limit, after, error_response = parse_page_params(request)
+        if error_response:
+            return error_response
+
+        def compute(lat, lon):
+            if engines.use_database(engines.BBOX):
+                center = GEOSPoint(lon, lat, srid=4326)
+                qs = Point.objects.filter(_within_q(bbox)).annotate(distance=Distance('location', center))
+                points, next_after = _postgis_page(qs, limit, after)
+            else:
+                ids, distances = _fallback_bbox_point_ids(bbox, (lat, lon), limit=limit + 1, after=after)
+                points, next_after = _points_page(ids, distances, limit)
             serializer = self.get_serializer(points, many=True)
-            return Response(serializer.data)
+            return list(serializer.data), next_after
 
+        # Ключ кэша — круг, накрывающий bbox: его ячейки инвалидируются при изменении точек внутри
+        endpoint = 'points-stats' if wants_stats(request) else 'points'
+        radius = bbox_radius_km(bbox, (lat, lon))
+        data, next_after = cached_search(endpoint, lat, lon, radius, ('within', bbox, limit, after), compute)
+        return paginated_response(request, data, next_after)
 
-class MessageViewSet(viewsets.ModelViewSet):
+    def _stream_within(self, bbox, lat, lon):
+        """Все точки bbox потоком NDJSON/GeoJSON, без пагинации."""
+        if engines.use_database(engines.BBOX):
+            center = GEOSPoint(lon, lat, srid=4326)
+            qs = Point.objects.filter(_within_q(bbox)).annotate(distance=Distance('location', center))
+            points = eager(qs.order_by('distance', 'id').iterator(chunk_size=STREAM_CHUNK_SIZE))
+        else:
+            points = _iter_points(_fallback_bbox_point_ids(bbox, (lat, lon))[0].tolist())
+        return streaming_response(points, self.request.accepted_renderer, self.get_serializer().to_representation)
+
+    @action(detail=False, methods=['get'])
+    def nearest(self, request):
+        lat, lon, k, error_response = _parse_knn_params(request)
+        if error_response:
+            return error_response
+
+        if engines.use_database(engines.KNN):
+            center = GEOSPoint(lon, lat, srid=4326)
+            # KNN-сортировка по GiST-индексу (<->), без радиуса
+            qs = Point.objects.order_by(KNNDistance('location', center), 'id')
+            points = list(qs[:k])
+        else:
+            points = _fallback_nearest_points(lat, lon, k)
+        serializer = self.get_serializer(points, many=True)
+        return Response(serializer.data)
+
+    def tiles(self, request, z, x, y):
+        """
+        Векторный тайл слоя точек: /api/points/tiles/{z}/{x}/{y}.mvt.
+        Кэшируется до изменения точки внутри тайла, ETag позволяет
+        клиенту перепроверять тайл ответом 304.
+        """
+        if not tiles.valid_tile(z, x, y):
+            return Response({'error': f'Некорректный тайл: zoom от 0 до {tiles.max_zoom()}, x и y от 0 до 2^zoom - 1'}, status=status.HTTP_400_BAD_REQUEST)
+
+        def compute():
+            if engines.use_database(engines.TILES):
+                return tiles.postgis_tile(z, x, y)
+            else:
+                # Fallback: кодирование MVT на Python
+                return tiles.python_tile(z, x, y)
+
+        body, etag = tiles.cached_tile(z, x, y, compute)
+        if etag and request.headers.get('If-None-Match') == etag:
+            return HttpResponseNotModified(headers={'ETag': etag})
+        response = HttpResponse(body, content_type=tiles.MEDIA_TYPE)
+        if etag:
+            response['ETag'] = etag
+        return response
+
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
+        """
+        Кластеры точек в bbox для уровня zoom: число точек, центроид и bbox
+        участников по ячейкам сетки. Для мелких масштабов карты вместо
+        отдельных точек.
+        """
+        bbox, cell_deg, error_response = _parse_cluster_params(request)
+        if error_response:
+            return error_response
+
+        if engines.use_database(engines.CLUSTERS):
+            # Группировка по узлу сетки в БД: наружу уходит по строке на ячейку
+            cell = SnapToGrid(Cast('location', GeometryField(srid=4326)), cell_deg)
+            qs = (
+                Point.objects.filter(bbox_q(bbox))
+                .annotate(cell=cell)
+                .values('cell')
+                .annotate(
+                    count=Count('id'), center_lat=Avg('latitude'), center_lon=Avg('longitude'),
+                    min_lat=Min('latitude'), min_lon=Min('longitude'),
+                    max_lat=Max('latitude'), max_lon=Max('longitude'),
+                )
+                .order_by()
+            )
+            clusters = [
+                {
+                    'count': row['count'], 'latitude': row['center_lat'], 'longitude': row['center_lon'],
+                    'bbox': [row['min_lon'], row['min_lat'], row['max_lon'], row['max_lat']],
+                }
+                for row in qs
+            ]
+        else:
+            clusters = _fallback_clusters(bbox, cell_deg)
+        clusters.sort(key=lambda c: (-c['count'], c['latitude'], c['longitude']))
+        return Response(clusters)
+
+
+class MessageViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Message.objects.select_related('point', 'user')
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated]
+    replica_actions = ('list', 'retrieve', 'search', 'nearest', 'inside')
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer, GeoJSONRenderer]
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        # Сообщение и агрегаты его точки (post_save, points.stats) пишутся в одной транзакции
+        with transaction.atomic():
+            message = serializer.save(user=self.request.user)
+            # Подписчикам поблизости — только после коммита
+            event = message_event(message, serializer.data)
+            transaction.on_commit(lambda: hub.publish(event), robust=True)
+
+    def perform_destroy(self, instance):
+        if instance.user_id != self.request.user.pk:
+            raise PermissionDenied('Удалять можно только свои сообщения.')
+        instance.delete()
+
+    def list(self, request):
+        """Лента сообщений от новых к старым с since/until и keyset-курсором."""
+        time_q, _, error_response = _parse_time_window(request)
+        if error_response:
+            return error_response
+        limit, after, error_response = parse_page_params(request, decode=decode_time_cursor)
+        if error_response:
+            return error_response
+
+        messages, next_after = _recent_page(self.get_queryset().filter(time_q), limit, after)
+        serializer = self.get_serializer(messages, many=True)
+        return paginated_response(request, serializer.data, next_after)
 
     @action(detail=False, methods=['get'])
     def search(self, request):
         lat, lon, radius, error_response = _parse_geo_params(request)
+        if error_response:
+            return error_response
+        time_q, window, error_response = _parse_time_window(request)
+        if error_response:
+            return error_response
+        if request.accepted_renderer.format in STREAMING_FORMATS:
+            return self._stream_search(lat, lon, radius, time_q)
+        order, error_response = _parse_order(request)
+        if error_response:
+            return error_response
+        decode = decode_time_cursor if order == 'recent' else decode_cursor
+        limit, after, error_response = parse_page_params(request, decode=decode)
         if error_response:
             return error_response
 
-        try:
-            center = GEOSPoint(lon, lat, srid=4326)
-            # Поиск с сортировкой по расстоянию точки
-            qs = Message.objects.select_related('point').filter(point__location__distance_lte=(center, D(km=radius)))
-            qs = qs.annotate(distance=Distance('point__location', center)).order_by('distance')
-            serializer = self.get_serializer(qs, many=True)
-            return Response(serializer.data)
-        except Exception as e:
-            # Fallback на Haversine
-            messages = [
-                m for m in Message.objects.select_related('point').exclude(point__latitude__isnull=True, point__longitude__isnull=True)
-                if _haversine_km(lat, lon, m.point.latitude, m.point.longitude) <= radius
-            ]
+        def compute(lat, lon):
+            if engines.use_database(engines.RADIUS):
+                center = GEOSPoint(lon, lat, srid=4326)
+                if order == 'recent':
+                    # Точки в радиусе — подзапрос по GiST-индексу, сообщения —
+                    # по индексам (point, created_at) / (created_at)
+                    nearby = Point.objects.filter(location__distance_lte=(center, D(km=radius))).values('id')
+                    qs = Message.objects.select_related('point').filter(time_q, point_id__in=nearby)
+                    messages, next_after = _recent_page(qs, limit, after)
+                else:
+                    # Поиск с сортировкой по расстоянию точки
+                    qs = Message.objects.select_related('point').filter(time_q, point__location__distance_lte=(center, D(km=radius)))
+                    qs = qs.annotate(distance=Distance('point__location', center))
+                    messages, next_after = _postgis_page(qs, limit, after)
+            else:
+                # Fallback на Haversine
+                if order == 'recent':
+                    messages, next_after = _fallback_recent_messages(lat, lon, radius, limit, after, time_q)
+                else:
+                    messages, next_after = _fallback_messages(lat, lon, radius, limit, after, time_q)
             serializer = self.get_serializer(messages, many=True)
-            return Response(serializer.data)
+            return list(serializer.data), next_after
+
+        data, next_after = cached_search('messages', lat, lon, radius, (limit, after, order, window), compute)
+        return paginated_response(request, data, next_after)
+
+    def _stream_search(self, lat, lon, radius, time_q):
+        """Весь результат поиска потоком NDJSON/GeoJSON, без пагинации."""
+        if engines.use_database(engines.RADIUS):
+            center = GEOSPoint(lon, lat, srid=4326)
+            qs = Message.objects.select_related('point').filter(time_q, point__location__distance_lte=(center, D(km=radius)))
+            qs = qs.annotate(distance=Distance('point__location', center)).order_by('distance', 'id')
+            messages = eager(qs.iterator(chunk_size=STREAM_CHUNK_SIZE))
+        else:
+            messages = (m for _, _, m in _iter_fallback_messages(lat, lon, radius, time_q=time_q))
+        return streaming_response(
+            messages, self.request.accepted_renderer, self.get_serializer().to_representation,
+            geometry_of=_point_geometry,
+        )
+
+    @action(detail=False, methods=['get', 'post'], parser_classes=[JSONParser, GeoJSONParser])
+    def inside(self, request):
+        """Сообщения точек внутри области (как PointViewSet.inside), порядок — по id."""
+        region, error_response = _parse_region(request)
+        if error_response:
+            return error_response
+        limit, after, error_response = parse_page_params(request, decode=decode_id_cursor)
+        if error_response:
+            return error_response
+
+        if engines.use_database(engines.REGION):
+            qs = Message.objects.select_related('point').filter(_region_q(region, prefix='point__'))
+            messages, next_after = _postgis_id_page(qs, limit, after)
+        else:
+            messages, next_after = _fallback_region_messages(region, limit, after)
+        serializer = self.get_serializer(messages, many=True)
+        return paginated_response(request, serializer.data, next_after)
+
+    @action(detail=False, methods=['get'])
+    def nearest(self, request):
+        lat, lon, k, error_response = _parse_knn_params(request)
+        if error_response:
+            return error_response
+
+        if engines.use_database(engines.KNN):
+            center = GEOSPoint(lon, lat, srid=4326)
+            # Точки обходятся KNN-сканом индекса, сообщения подтягиваются по point_id
+            qs = Message.objects.select_related('point').order_by(KNNDistance('point__location', center), 'id')
+            messages = list(qs[:k])
+        else:
+            messages = _fallback_nearest_messages(lat, lon, k)
+        serializer = self.get_serializer(messages, many=True)
+        return Response(serializer.data)
+
+
+class SyncView(APIView):
+    """
+    Дельта-синхронизация: изменения точек и сообщений после курсора since.
+
+    Ответ — {"cursor", "has_more", "changes": [{"type", "action", "id", "data"}]};
+    для action=delete поле data отсутствует. Клиент сохраняет cursor и
+    передаёт его в следующий запрос; has_more — сразу запросить ещё.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        since = request.query_params.get('since') or '0'
+        try:
+            since = int(since)
+        except ValueError:
+            return Response({'error': 'Параметр since должен быть курсором из предыдущего ответа'}, status=status.HTTP_400_BAD_REQUEST)
+        if since < 0:
+            return Response({'error': 'Параметр since должен быть курсором из предыдущего ответа'}, status=status.HTTP_400_BAD_REQUEST)
+        limit, error_response = parse_limit(request)
+        if error_response:
+            return error_response
+        bbox, error_response = _parse_bbox(request)
+        if error_response:
+            return error_response
+
+        changes, cursor, has_more = read_changes(since, limit, bbox)
+        serializer_for = {
+            ChangeLog.POINT: PointSerializer(context={'request': request}),
+            ChangeLog.MESSAGE: MessageSerializer(context={'request': request}),
+        }
+        data = []
+        for entry, obj in changes:
+            change = {'type': entry.model, 'action': entry.action, 'id': entry.object_id}
+            if obj is not None:
+                change['data'] = serializer_for[entry.model].to_representation(obj)
+            data.append(change)
+        return Response({'cursor': str(cursor), 'has_more': has_more, 'changes': data})
+
+
+class RegionViewSet(viewsets.ModelViewSet):
+    """Сохранённые области для поиска ?region=<имя>. Менять и удалять может только автор."""
+    queryset = Region.objects.all()
+    serializer_class = RegionSerializer
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser, GeoJSONParser]
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def perform_update(self, serializer):
+        if serializer.instance.user_id != self.request.user.pk:
+            raise PermissionDenied('Изменять можно только свои области.')
+        serializer.save()
+
+    def perform_destroy(self, instance):
+        if instance.user_id != self.request.user.pk:
+            raise PermissionDenied('Удалять можно только свои области.')
+        instance.delete()